@@ -1,7 +1,5 @@
 @echo off  
 
-python "%~dp0src\spotify_data_processing.py"
-python "%~dp0src\report_generator.py"
-python "%~dp0src\extra_profiling_report.py"
+python "%~dp0src\pipeline.py" %*
 
 pause
\ No newline at end of file
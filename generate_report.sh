@@ -0,0 +1,5 @@
+#!/bin/sh
+# Dataset processing, PDF report and profiling report in a single process
+cd "$(dirname "$0")"
+
+python src/pipeline.py "$@"
@@ -1,11 +1,13 @@
 import json
 import os
+import itertools
 from io import StringIO, BytesIO
 
 import utils_io
 import pandas as pd
 from datetime import datetime
 import pandas as pd
+import numpy as np
 
 
 # 1. Completeness 
@@ -31,7 +33,7 @@ def dataset_properties(df):
 def column_has_null_values(df, column):
     # Check if there are null values in the column
     null_values = df[column].isnull()
-    null_values_count = df[column].isnull().sum()
+    null_values_count = null_values.sum()
 
     data = {'nulls': null_values, 'count': null_values_count}
 
@@ -44,7 +46,7 @@ def column_has_null_values(df, column):
 def dataset_has_duplicate_rows(df):
     # Check if there are duplicates in the dataset
     duplicates = df.duplicated()
-    duplicates_count = df.duplicated().sum()
+    duplicates_count = duplicates.sum()
 
     # Get the unique values that are duplicated
     duplicates = df.loc[duplicates, :]
@@ -56,6 +58,375 @@ def dataset_has_duplicate_rows(df):
     else:
         return False
 
+# Settings of the near duplicate tracks check
+near_duplicate_settings = {
+    # Minimum similarity of two track names: Jaccard of their character trigrams, estimated with MinHash
+    'name_threshold': 0.8,
+    # Maximum difference of every scaled audio feature of two tracks
+    'feature_tolerance': 0.05,
+    # MinHash permutations, split in LSH bands of permutations / bands values
+    'permutations': 64,
+    'bands': 16,
+    # Audio features of each band of the feature vector
+    'band_features': 2,
+    # Buckets up to this size are paired all at once, larger ones are compared in blocks of block_rows rows
+    'max_bucket': 100,
+    'block_rows': 1000,
+}
+# Audio features compared by the check and their scale, so every feature is about [0, 1]
+near_duplicate_features = {
+    'audio_features.danceability': 1,
+    'audio_features.energy': 1,
+    'audio_features.speechiness': 1,
+    'audio_features.acousticness': 1,
+    'audio_features.liveness': 1,
+    'audio_features.valence': 1,
+    'audio_features.loudness': 60,
+    'audio_features.tempo': 250,
+}
+# Version suffixes of a track name: "(Taylor's Version)", "[Live]", "- Remastered 2015"
+version_suffix = r"\s*[\(\[][^\)\]]*[\)\]]|\s+-\s+.*$"
+
+def normalize_track_names(names):
+    names = names.fillna('').astype(str).str.lower().str.replace(version_suffix, '', regex=True)
+    return names.str.replace(r"[^\w\s]", '', regex=True).str.split().str.join(' ').fillna('')
+
+def minhash_signatures(names, permutations=64, seed=0, block_names=2000):
+    # MinHash signature of the character trigrams of every name, the names are padded so that
+    # one letter names have a trigram
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, 2 ** 63, size=permutations, dtype=np.uint64) | np.uint64(1)
+    b = rng.integers(0, 2 ** 63, size=permutations, dtype=np.uint64)
+    signatures = np.empty((len(names), permutations), dtype=np.uint64)
+    for start in range(0, len(names), block_names):
+        padded = [f' {name} ' for name in names[start:start + block_names]]
+        trigrams = [name[i:i + 3] for name in padded for i in range(len(name) - 2)]
+        sizes = np.array([len(name) - 2 for name in padded])
+        hashes = pd.util.hash_array(np.array(trigrams, dtype=object))
+        # Multiply-shift hash of every trigram for every permutation, minimum per name
+        values = (hashes[:, None] * a + b) >> np.uint64(32)
+        signatures[start:start + len(padded)] = np.minimum.reduceat(values, np.r_[0, np.cumsum(sizes)[:-1]], axis=0)
+    return signatures
+
+def signature_similarity(signatures, first, second, block_pairs=100000):
+    # Fraction of equal MinHash values of every pair, the estimate of the Jaccard similarity
+    similarity = np.empty(len(first))
+    for start in range(0, len(first), block_pairs):
+        block = slice(start, start + block_pairs)
+        similarity[block] = (signatures[first[block]] == signatures[second[block]]).mean(axis=1)
+    return similarity
+
+def split_buckets(keys, max_bucket):
+    # Pairs of positions (first, second) that share a key in the buckets up to max_bucket rows, and the
+    # positions of the rows of the larger buckets with the number of their bucket
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+    sizes = np.diff(np.r_[starts, len(keys)])
+    large = sizes > max_bucket
+    small = (sizes > 1) & ~large
+    small_starts, small_sizes = starts[small], sizes[small]
+    # Every member of a bucket is paired with the members after it
+    members = np.repeat(small_starts, small_sizes) + np.arange(small_sizes.sum()) - np.repeat(np.cumsum(small_sizes) - small_sizes, small_sizes)
+    followers = np.repeat(small_starts + small_sizes, small_sizes) - members - 1
+    first = np.repeat(members, followers)
+    second = first + 1 + np.arange(followers.sum()) - np.repeat(np.cumsum(followers) - followers, followers)
+    return order[first], order[second], order[np.repeat(large, sizes)], np.repeat(np.arange(large.sum()), sizes[large])
+
+def distinct_buckets(rows, buckets):
+    # Buckets with the same rows are kept once, the same rows often share a bucket with several keys
+    if not len(rows):
+        return rows, buckets
+    order = np.lexsort((rows, buckets))
+    rows, buckets = rows[order], buckets[order]
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    sizes = np.diff(np.r_[starts, len(rows)])
+    # Hash of the rows of every bucket that doesn't depend on their order
+    members = np.add.reduceat(pd.util.hash_array(rows.astype(np.int64)), starts)
+    keep = ~pd.DataFrame({'members': members, 'sizes': sizes}).duplicated().to_numpy()
+    entries = np.repeat(keep, sizes)
+    return rows[entries], np.repeat(np.cumsum(keep) - 1, sizes)[entries]
+
+def block_pairs(rows, buckets, block_rows=1000):
+    # Every pair of rows of the same bucket, block by block of block_rows rows
+    order = np.argsort(buckets, kind='stable')
+    rows, buckets = rows[order], buckets[order]
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    for start, end in zip(starts, np.r_[starts[1:], len(rows)]):
+        members = rows[start:end]
+        for i in range(0, len(members), block_rows):
+            block = members[i:i + block_rows]
+            # Pairs inside the block, then with every block after it
+            first, second = np.triu_indices(len(block), 1)
+            yield np.minimum(block[first], block[second]), np.maximum(block[first], block[second])
+            for j in range(i + block_rows, len(members), block_rows):
+                others = members[j:j + block_rows]
+                first, second = np.repeat(block, len(others)), np.tile(others, len(block))
+                yield np.minimum(first, second), np.maximum(first, second)
+
+def bucket_pairs(rows, buckets, levels, max_bucket=100, block_rows=1000):
+    """Blocks of pairs of rows (first < second) that share a bucket
+
+    Buckets up to max_bucket rows give all their pairs at once. Larger buckets are split again with the
+    keys of the next level, and so on, so a large bucket is never paired as a whole unless no level can
+    split it: those are compared in blocks of block_rows rows. A level can have several alternative keys,
+    every one of them splits the buckets, and a pair is found if it shares the key of one alternative of
+    every level that was needed.
+
+    :param rows: Row of every member of the buckets
+    :param buckets: Bucket of every member
+    :param levels: Functions of the rows that return the alternative keys of a level, each a matrix with
+                   one column per member
+    """
+    for level in levels:
+        large_rows, large_buckets, count = [], [], 0
+        for keys in level(rows):
+            first, second, large, large_bucket = split_buckets(group_keys(np.vstack([buckets, keys])), max_bucket)
+            first, second = rows[first], rows[second]
+            yield np.minimum(first, second), np.maximum(first, second)
+            # The large buckets of every alternative are numbered apart
+            large_rows.append(rows[large])
+            large_buckets.append(large_bucket + count)
+            count += len(np.unique(large_bucket))
+        rows, buckets = distinct_buckets(np.concatenate(large_rows), np.concatenate(large_buckets))
+        if not len(rows):
+            return
+    yield from block_pairs(rows, buckets, block_rows)
+
+def group_keys(columns):
+    # Integer key of every distinct combination of values of the columns
+    return pd.DataFrame(columns).T.groupby(list(range(len(columns))), sort=False).ngroup().to_numpy()
+
+# Check if there are tracks that are the same song under a different name or id
+def dataset_has_near_duplicate_tracks(df, name_threshold=None, feature_tolerance=None, settings=None):
+    """Near duplicate tracks: similar names and almost the same audio features, with different track ids
+
+    Candidates are found in close to linear time instead of comparing every pair of rows. Names are
+    grouped with MinHash LSH bands (names that share a band of their signatures), and the rows of every
+    group of names are split into buckets of quantized bands of the audio features. Only the rows of
+    the same bucket are compared, with the thresholds, large buckets in blocks of rows.
+
+    :param name_threshold: Minimum similarity of the names, from 0 to 1
+    :param feature_tolerance: Maximum difference of every scaled audio feature
+    :return: Dictionary with the 'pairs' (index of both rows, name similarity and feature distance) and
+             the 'count' of rows that are a near duplicate of a previous row, or False
+    """
+    settings = near_duplicate_settings | (settings or {})
+    name_threshold = name_threshold if name_threshold is not None else settings['name_threshold']
+    tolerance = feature_tolerance if feature_tolerance is not None else settings['feature_tolerance']
+    columns = [column for column in near_duplicate_features if column in df.columns]
+    if 'track_name' not in df.columns or not columns:
+        return False
+
+    # Rows with a name and every audio feature
+    names = normalize_track_names(df['track_name'])
+    features = df[columns].apply(pd.to_numeric, errors='coerce') / pd.Series(near_duplicate_features)[columns]
+    valid = np.flatnonzero((names != '').to_numpy() & features.notna().all(axis=1).to_numpy())
+    if len(valid) < 2:
+        return False
+    codes, unique_names = pd.factorize(names.iloc[valid])
+    features = features.iloc[valid].to_numpy()
+
+    # Similar names: pairs of names that share a band, verified with the similarity of their signatures
+    signatures = minhash_signatures(unique_names, settings['permutations'])
+    rows_per_band = settings['permutations'] // settings['bands']
+    # A large bucket of a band is split with the following bands
+    band_keys = lambda band: lambda rows: [signatures[rows, band * rows_per_band:(band + 1) * rows_per_band].T]
+    similar = np.array([], dtype=np.int64)
+    for band in range(settings['bands']):
+        levels = [band_keys((band + level) % settings['bands']) for level in range(settings['bands'])]
+        found = []
+        for first, second in bucket_pairs(np.arange(len(unique_names)), np.zeros(len(unique_names), dtype=np.int64), levels, settings['max_bucket'], settings['block_rows']):
+            keep = signature_similarity(signatures, first, second) >= name_threshold
+            found.append(first[keep].astype(np.int64) * len(unique_names) + second[keep])
+        similar = np.union1d(similar, np.concatenate(found))
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+    first, second = similar // len(unique_names), similar % len(unique_names)
+    graph = coo_matrix((np.ones(len(similar)), (first, second)), shape=(len(unique_names),) * 2)
+    groups = connected_components(graph, directed=False)[1][codes]
+
+    # Candidate rows: same group of names and same cell in a band of the audio features, large buckets
+    # are split with the next bands. Cells are twice the tolerance, and every feature is also quantized on
+    # a grid shifted by the tolerance. Two values within the tolerance share a cell of one of both grids,
+    # so two rows within the tolerance share a cell with one of the combinations of shifts of every band
+    def band_cells(start):
+        def cells(rows):
+            band = features[rows, start:start + settings['band_features']]
+            for shifts in itertools.product((0, tolerance), repeat=band.shape[1]):
+                yield np.floor((band + np.array(shifts)) / (2 * tolerance)).astype(np.int64).T
+        return cells
+
+    levels = [band_cells(start) for start in range(0, len(columns), settings['band_features'])]
+    track_ids = df['track_id'].iloc[valid].to_numpy() if 'track_id' in df.columns else np.full(len(valid), None)
+    found = []
+    for first, second in bucket_pairs(np.arange(len(valid)), groups, levels, settings['max_bucket'], settings['block_rows']):
+        # Verification with both thresholds, rows with the same track id are exact duplicates
+        name_similarity = signature_similarity(signatures, codes[first], codes[second])
+        distance = np.abs(features[first] - features[second]).max(axis=1)
+        different = (track_ids[first] != track_ids[second]) | pd.isnull(track_ids[first])
+        keep = (name_similarity >= name_threshold) & (distance <= tolerance) & different
+        # Pairs are encoded as one integer, so the pairs found with several keys are kept once
+        found.append(first[keep].astype(np.int64) * len(valid) + second[keep])
+    near = np.unique(np.concatenate(found))
+    first, second = near // len(valid), near % len(valid)
+
+    pairs = pd.DataFrame({
+        'first': df.index[valid[first]],
+        'second': df.index[valid[second]],
+        'name_similarity': signature_similarity(signatures, codes[first], codes[second]),
+        'feature_distance': np.abs(features[first] - features[second]).max(axis=1),
+    })
+    near_duplicates_count = pairs['second'].nunique()
+
+    data = {'pairs': pairs, 'count': near_duplicates_count}
+
+    if near_duplicates_count > 0:
+        return data
+    else:
+        return False
+
+# Settings of the multivariate outliers check of the audio features
+multivariate_settings = {
+    # Rows of the sample the robust covariance is fitted on
+    'sample_rows': 20000,
+    # Fraction of the sample that defines the covariance, the rest can be outliers without moving it
+    'support_fraction': 0.75,
+    # Rows above this quantile of the chi-squared distribution of the distances are outliers
+    'quantile': 0.999,
+    # Rows scored at a time
+    'block_rows': 100000,
+}
+# Continuous audio features of the check (the discrete ones, key, mode and time signature, are left out)
+# and the offset of the log scale of the proportions concentrated near zero, so their long tail is not
+# taken for outliers: column -> offset, or None to use the values as they are
+multivariate_features = {
+    'audio_features.danceability': None,
+    'audio_features.energy': None,
+    'audio_features.loudness': None,
+    'audio_features.speechiness': 0.01,
+    'audio_features.acousticness': 0.01,
+    'audio_features.liveness': 0.01,
+    'audio_features.valence': None,
+    'audio_features.tempo': None,
+}
+
+def feature_block(df, columns):
+    # Audio features of some rows as a float matrix, and the mask of the rows with every feature
+    values = df[columns].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float64)
+    for i, column in enumerate(columns):
+        if multivariate_features[column] is not None:
+            values[:, i] = np.log(np.clip(values[:, i], 0, None) + multivariate_features[column])
+    return values, ~np.isnan(values).any(axis=1)
+
+def squared_distances(values, model):
+    # Squared Mahalanobis distances, the whitening matrix is the inverse of the Cholesky factor
+    return (((values - model['location']) @ model['whitening']) ** 2).sum(axis=1)
+
+def robust_covariance_model(sample, support_fraction=0.75, quantile=0.999, steps=50):
+    """Minimum covariance determinant estimate of the location and covariance of a sample
+
+    Starts from the rows closest to the median (scaled by the MAD) and repeats concentration steps:
+    the covariance of the support rows, then the support rows with the smallest distances, until the
+    support doesn't change. The covariance is scaled so that the distances of normal data follow a
+    chi-squared distribution.
+
+    :param sample: Matrix of rows without missing values
+    :return: Dictionary with the 'location', the 'whitening' matrix and the 'threshold' of the squared distances
+    """
+    from scipy.stats import chi2
+
+    rows, features = sample.shape
+    support = max(int(rows * support_fraction), features + 1)
+    location = np.median(sample, axis=0)
+    scale = np.median(np.abs(sample - location), axis=0) * 1.4826
+    scale[scale == 0] = 1
+    subset = np.sort(np.argsort((((sample - location) / scale) ** 2).sum(axis=1))[:support])
+
+    for _ in range(steps):
+        location = sample[subset].mean(axis=0)
+        covariance = np.cov(sample[subset], rowvar=False)
+        # A small ridge keeps constant features from making the covariance singular
+        covariance += np.eye(features) * 1e-9 * max(np.trace(covariance), 1e-12)
+        model = {'location': location, 'whitening': np.linalg.inv(np.linalg.cholesky(covariance)).T}
+        distances = squared_distances(sample, model)
+        new_subset = np.sort(np.argsort(distances)[:support])
+        if np.array_equal(new_subset, subset):
+            break
+        subset = new_subset
+
+    # Consistency correction: the median distance of normal data is the median of the chi-squared distribution
+    correction = np.median(distances) / chi2.ppf(0.5, features)
+    model['whitening'] = model['whitening'] / np.sqrt(correction)
+
+    # Reweighting: the covariance of every row that is not an outlier at the 97.5% quantile, which is
+    # more efficient than the covariance of the support rows
+    inliers = squared_distances(sample, model) <= chi2.ppf(0.975, features)
+    if inliers.sum() > features:
+        location = sample[inliers].mean(axis=0)
+        covariance = np.cov(sample[inliers], rowvar=False)
+        covariance += np.eye(features) * 1e-9 * max(np.trace(covariance), 1e-12)
+        model = {'location': location, 'whitening': np.linalg.inv(np.linalg.cholesky(covariance)).T}
+        correction = np.median(squared_distances(sample, model)) / chi2.ppf(0.5, features)
+        model['whitening'] = model['whitening'] / np.sqrt(correction)
+
+    model['threshold'] = chi2.ppf(quantile, features)
+
+    return model
+
+def multivariate_outlier_scores(blocks, model, columns):
+    # Squared distances over the threshold of every block of rows: index -> distance. Only one block is
+    # converted to a matrix at a time
+    outliers = []
+    for block in blocks:
+        values, complete = feature_block(block, columns)
+        distances = squared_distances(values[complete], model)
+        over = distances > model['threshold']
+        outliers.append(pd.Series(distances[over], index=block.index[complete][over]))
+    outliers = pd.concat(outliers) if outliers else pd.Series(dtype=np.float64)
+    return outliers.sort_values(ascending=False)
+
+# Check if there are rows whose combination of audio features is far from the rest of the dataset
+def dataset_has_multivariate_outliers(df, quantile=None, model=None, settings=None):
+    """Rows whose audio features are an unlikely combination, even if every value is inside its range
+
+    The robust covariance of the features is fitted on a sample, and the rows are scored with their
+    Mahalanobis distance in blocks of block_rows, so the full matrix of features is never built.
+
+    :param quantile: Quantile of the chi-squared distribution of the distances over which a row is an outlier
+    :param model: Model fitted by robust_covariance_model. If not specified then it is fitted on a sample of df
+    :return: Dictionary with the 'outliers' (squared distance of every outlier row, the largest first) and
+             their 'count', or False
+    """
+    settings = multivariate_settings | (settings or {})
+    quantile = quantile if quantile is not None else settings['quantile']
+    columns = [column for column in multivariate_features if column in df.columns]
+    if len(columns) < 2:
+        return False
+
+    if model is None:
+        # The sample rows are chosen first, so only their features are copied
+        positions = np.random.default_rng(0).choice(df.shape[0], min(settings['sample_rows'], df.shape[0]), replace=False)
+        sample = df.iloc[np.sort(positions), df.columns.get_indexer(columns)]
+        sample, complete = feature_block(sample, columns)
+        if complete.sum() <= len(columns):
+            return False
+        model = robust_covariance_model(sample[complete], settings['support_fraction'], quantile)
+    else:
+        from scipy.stats import chi2
+        model = model | {'threshold': chi2.ppf(quantile, len(columns))}
+
+    blocks = (df.iloc[start:start + settings['block_rows']] for start in range(0, df.shape[0], settings['block_rows']))
+    outliers = multivariate_outlier_scores(blocks, model, columns)
+    outliers_count = len(outliers)
+
+    data = {'outliers': outliers, 'count': outliers_count}
+
+    if outliers_count > 0:
+        return data
+    else:
+        return False
+
 # Check if the text column has incorrect format
 def column_has_incorrect_text_format(df, column, format):
     # Filter empty values
@@ -100,8 +471,10 @@ def column_has_bad_encoding(df, column):
 
 # Check if the column has incorrect boolean values
 def column_has_incorrect_boolean_values(df, column):
+    # Columns parsed as booleans (e.g. a chunk without text values) are checked as text
+    values = df[column] if df[column].dtype == object else df[column].astype(str)
     # Check if the column has incorrect boolean values
-    incorrect_boolean = ~df[column].isin(['True', 'False'])
+    incorrect_boolean = ~values.isin(['True', 'False'])
     incorrect_boolean_count = incorrect_boolean.sum()
     incorrect_boolean = df.loc[incorrect_boolean, column].unique().tolist()
 
@@ -114,8 +487,10 @@ def column_has_incorrect_boolean_values(df, column):
     
 # Check if the column has incorrect numeric values
 def column_has_incorrect_numeric_values(df, column):
+    # Columns parsed as numbers (e.g. a chunk without text values) are checked as text
+    values = df[column] if df[column].dtype == object else df[column].astype(str)
     # Check if the column has incorrect numeric values
-    incorrect_numeric = ~df[column].str.isnumeric()
+    incorrect_numeric = ~values.str.isnumeric()
     incorrect_numeric_count = incorrect_numeric.sum()
     incorrect_numeric = df.loc[incorrect_numeric, column].unique().tolist()
 
@@ -136,6 +511,10 @@ def column_is_numeric(df, column):
     else:
         return False
 
+# Type anomaly of a column that must be numeric: 1 if the column is not numeric, 0 otherwise
+def column_type_is_not_numeric(df, column):
+    return int(not column_is_numeric(df, column))
+
 # Check if column type is datetime
 def column_is_datetime(df, column):
     # Check if column type is datetime
@@ -179,9 +558,6 @@ def column_has_values_outside_range(df, column, min, max):
 def overview(df):
     ds_prop = dataset_properties(df)
 
-    # Get the summary statistics of numerical columns
-    summary_stats = df.describe()
-
     # Check data types
     # data_types = df.dtypes
     numerics = df.dtypes[df.dtypes == 'int64'].count() + df.dtypes[df.dtypes == 'float64'].count()
@@ -197,7 +573,8 @@ def overview(df):
     total_missing_values_percentage = (total_missing_values / ds_prop['all']) * 100
 
     # Check for duplicates
-    duplicate_rows = df.duplicated().sum()
+    duplicated = df.duplicated()
+    duplicate_rows = duplicated.sum()
     duplicate_rows_percentage = (duplicate_rows / ds_prop['rows']) * 100
 
     # Get the number of unique values per column type and transform it into a list of lists
@@ -225,11 +602,46 @@ def overview(df):
         'total_missing_values_percentage': total_missing_values_percentage,
         'duplicate_rows': duplicate_rows,
         'duplicate_rows_percentage': duplicate_rows_percentage,
+        'duplicate_rows_index': df.index[duplicated],
     }
     data = data | ds_prop | unique_values_per_type
 
     return data
 
+# Number of set bits of every byte value
+POPCOUNT = np.array([bin(value).count('1') for value in range(256)], dtype=np.uint8)
+
+# Nullity matrix summarized in bins of rows: fraction of null values of each column in each bin
+def nullity_density(df, bins=400, chunk_rows=1000000):
+    rows = df.shape[0]
+    bins = max(min(bins, rows), 1)
+    # Rows per bin, a multiple of 8 so every bin starts at the beginning of a byte of the packed bitmap
+    bin_rows = -(-rows // bins)
+    bin_rows = -(-bin_rows // 8) * 8
+    # An empty dataframe has no bins, at least one byte per bin keeps the chunk size valid
+    bin_rows = max(bin_rows, 8)
+    # Chunks contain complete bins, so bins are never split between chunks
+    chunk_rows = max(chunk_rows // bin_rows, 1) * bin_rows
+
+    counts = []
+    for start in range(0, rows, chunk_rows):
+        # Null bitmap of the chunk, packed 8 rows per byte
+        packed = np.packbits(df.iloc[start:start + chunk_rows].isnull().to_numpy(), axis=0)
+        # Null values per bin and column
+        starts = np.arange(0, packed.shape[0], bin_rows // 8)
+        counts.append(np.add.reduceat(POPCOUNT[packed], starts, axis=0, dtype=np.int64))
+    counts = np.concatenate(counts) if counts else np.zeros((0, df.shape[1]), dtype=np.int64)
+
+    # The last bin may contain less rows
+    rows_per_bin = np.full(counts.shape[0], bin_rows)
+    if counts.shape[0]:
+        rows_per_bin[-1] = rows - bin_rows * (counts.shape[0] - 1)
+    density = counts / rows_per_bin[:, None]
+
+    data = {'density': density, 'columns': df.columns.tolist(), 'rows': rows, 'bin_rows': bin_rows}
+
+    return data
+
 # 1 - Completeness: A measure of the absence of blank (null or empty string) values or the presence of non­blank values.
 def completeness(df):
     ds_prop = dataset_properties(df)
@@ -254,95 +666,80 @@ def uniqueness(df):
     return duplicate_rows
 
 
-# 4 - Validity: Data are valid if it conforms to the syntax (format, type, range) of its definition.
-def validity(df):
-    ds_prop = dataset_properties(df)
-    # Count the number of track names that are outliers based on the convention of song naming in English
-    incorrect_track_names = column_has_incorrect_text_format(df, 'track_name', 'lower')
-    incorrect_track_names = incorrect_track_names['count']
-
-    # Count the number of track names that have bad enconding characters or symbols
-    special_character_track_names = column_has_bad_encoding(df, 'track_name')
-    special_character_track_names = special_character_track_names['count']
-
-    # Count the number of anomalies in the column Explicit
-    explicit_anomalies = column_has_incorrect_boolean_values(df, 'explicit')
-    explicit_anomalies = explicit_anomalies['count']
-
-    # Count the number of anomalies in the column total tracks
-    total_tracks_anomalies = column_has_incorrect_numeric_values(df, 'album_total_tracks')
-    total_tracks_anomalies = total_tracks_anomalies['count']
+## Rule definitions
+# Dictionary of the rules checked in each dimension: name -> (dimension, test, arguments, merge)
+# merge combines the counts obtained in several chunks of the same dataset
+def quality_rules():
+    # Taylor Swift's first album was released in 2006, so the year should be greater than or equal 2006 and less than or equal to today's year
+    first_album = datetime(2006,1,1).strftime('%Y-%m-%d')
+    actual_year = datetime.now().strftime('%Y-%m-%d')
 
-    # Data type of album release date must be datetime, and it's an object
-    # album_release_date_type_is_datetime = column_is_datetime(df, 'album_release_date')
+    rules = {
+        # Track names that are outliers based on the convention of song naming in English
+        'track_name_format': ('Validez', column_has_incorrect_text_format, ('track_name', 'lower'), sum),
+        # Track names that have bad enconding characters or symbols
+        'track_name_encoding': ('Validez', column_has_bad_encoding, ('track_name',), sum),
+        'explicit_boolean': ('Validez', column_has_incorrect_boolean_values, ('explicit',), sum),
+        'album_total_tracks_numeric': ('Validez', column_has_incorrect_numeric_values, ('album_total_tracks',), sum),
+        # Data type of instrumentalness audio feature must be numeric, and it's an object
+        'instrumentalness_type': ('Validez', column_type_is_not_numeric, ('audio_features.instrumentalness',), max),
+        # Data in instrumentalness audio feature after being converted to numeric has inconsistent values
+        'instrumentalness_conversion': ('Validez', column_cant_be_converted_to_numeric, ('audio_features.instrumentalness',), sum),
+        'track_id_nulls': ('Validez', column_has_null_values, ('track_id',), sum),
+
+        'danceability_range': ('Precisión', column_has_values_outside_range, ('audio_features.danceability', 0, 1), sum),
+        'energy_range': ('Precisión', column_has_values_outside_range, ('audio_features.energy', 0, 1), sum),
+        'key_range': ('Precisión', column_has_values_outside_range, ('audio_features.key', -1, 11), sum),
+        'loudness_range': ('Precisión', column_has_values_outside_range, ('audio_features.loudness', -60, 0), sum),
+        'acousticness_range': ('Precisión', column_has_values_outside_range, ('audio_features.acousticness', 0, 1), sum),
+        'liveness_range': ('Precisión', column_has_values_outside_range, ('audio_features.liveness', 0, 1), sum),
+        'time_signature_range': ('Precisión', column_has_values_outside_range, ('audio_features.time_signature', 3, 7), sum),
+        'track_popularity_range': ('Precisión', column_has_values_outside_range, ('track_popularity', 0, 100), sum),
+        'artist_popularity_range': ('Precisión', column_has_values_outside_range, ('artist_popularity', 0, 100), sum),
+        # The common duration of pop songs are typically between one and a half to four minutes long.
+        'duration_ms_range': ('Precisión', column_has_values_outside_range, ('duration_ms', 82000, 630000), sum),
+        'album_release_date_range': ('Precisión', column_has_values_outside_range, ('album_release_date', first_album, actual_year), sum),
+    }
 
-    # Data type of instrumentalness audio feature must be numeric, and it's an object
-    instrumentalness_type_is_numeric = column_is_numeric(df, 'audio_features.instrumentalness')
+    return rules
 
-    # Data in instrumentalness audio feature after being converted to numeric has inconsistent values
-    instrumentalness_type_conver_anomalies = column_cant_be_converted_to_numeric(df, 'audio_features.instrumentalness')
-    instrumentalness_type_conver_anomalies = instrumentalness_type_conver_anomalies['count']
+# Number of anomalies in the result of a test
+def rule_count(result):
+    if result is False:
+        return 0
+    elif isinstance(result, dict):
+        return result['count']
+    else:
+        return int(result)
+
+# Results of every rule, each test is run once
+def rules_results(df):
+    results = {}
+    for rule, (dimension, test, args, merge) in quality_rules().items():
+        results[rule] = test(df, *args)
+    return results
+
+# Anomaly counts of every rule of a dimension
+def dimension_counts(df, dimension, results=None):
+    counts = {}
+    for rule, (rule_dimension, test, args, merge) in quality_rules().items():
+        if rule_dimension == dimension:
+            result = results[rule] if results is not None else test(df, *args)
+            counts[rule] = rule_count(result)
+    return counts
 
-    # Count the number of Track.ids blanks
-    track_id_blanks = column_has_null_values(df, 'track_id')
-    track_id_blanks = track_id_blanks['count']
+# 4 - Validity: Data are valid if it conforms to the syntax (format, type, range) of its definition.
+def validity(df, results=None):
+    # Format, encoding, type and blank anomalies of the validity rules
+    invalid_data = sum(dimension_counts(df, 'Validez', results).values())
 
-    invalid_data = incorrect_track_names + special_character_track_names + explicit_anomalies + total_tracks_anomalies + ~instrumentalness_type_is_numeric  + instrumentalness_type_conver_anomalies + track_id_blanks # + ~album_release_date_type_is_datetime
-    
     return invalid_data
 
 
 # 5 - Accuracy: What data is inaccurate?
-def accuracy(df):
-    ds_prop = dataset_properties(df)
-
-    # Count the number of anomalies (values outside 0 - 1) in the column danceability
-    danceability_anomalies = column_has_values_outside_range(df, 'audio_features.danceability', 0, 1)
-    danceability_anomalies = danceability_anomalies['count']
-
-    # Count the number of anomalies (values outside 0 - 1) in the column energy
-    energy_anomalies = column_has_values_outside_range(df, 'audio_features.energy', 0, 1)
-    energy_anomalies = energy_anomalies['count']
-
-    # Count the number of anomalies (values outside 0 - 1) in the column acousticness
-    acousticness_anomalies = column_has_values_outside_range(df, 'audio_features.acousticness', 0, 1)
-    acousticness_anomalies = acousticness_anomalies['count']
-
-    # Count the number of anomalies (values outside 0 - 1) in the column liveness
-    liveness_anomalies = column_has_values_outside_range(df, 'audio_features.liveness', 0, 1)
-    liveness_anomalies = liveness_anomalies['count']
-
-    # Count the number of anomalies (values outside -1 to 11) in the column key
-    key_anomalies = column_has_values_outside_range(df, 'audio_features.key', -1, 11)
-    key_anomalies = key_anomalies['count']
-
-    # Count the number of anomalies (values outside -60 to 0) in the column loudness
-    loudness_anomalies = column_has_values_outside_range(df, 'audio_features.loudness', -60, 0)
-    loudness_anomalies = loudness_anomalies['count']
-
-    # Count the number of anomalies (values outside 3 - 7) in the column time_signature
-    time_signature_anomalies = column_has_values_outside_range(df, 'audio_features.time_signature', 3, 7)
-    time_signature_anomalies = time_signature_anomalies['count']
-
-    # Count the number of anomalies (values outside 0 - 100) in the column Track Popularity
-    popularity_anomalies = column_has_values_outside_range(df, 'track_popularity', 0, 100)
-    popularity_anomalies = popularity_anomalies['count']
-
-    # Count the numver of anomalies (values outside 0 - 100) in the column Artist Popularity
-    artist_popularity_anomalies = column_has_values_outside_range(df, 'artist_popularity', 0, 100)
-    artist_popularity_anomalies = artist_popularity_anomalies['count']
-
-    # The common duration of pop songs are typically between one and a half to four minutes long.
-    duration_ms_anomalies = column_has_values_outside_range(df, 'duration_ms', 82000, 630000)
-    duration_ms_anomalies = duration_ms_anomalies['count']
-
-    # Taylor Swift's first album was released in 2006, so the year should be greater than or equal 2006 and less than or equal to today's year
-    first_album = datetime(2006,1,1).strftime('%Y-%m-%d')
-    actual_year = datetime.now().strftime('%Y-%m-%d')
-    year_anomalies = column_has_values_outside_range(df, 'album_release_date', first_album, actual_year)
-    year_anomalies = year_anomalies['count']
-
-    inaccurate_data = danceability_anomalies + energy_anomalies + key_anomalies + loudness_anomalies + acousticness_anomalies + liveness_anomalies + time_signature_anomalies + popularity_anomalies + artist_popularity_anomalies + duration_ms_anomalies + year_anomalies
+def accuracy(df, results=None):
+    # Values outside the expected range of the accuracy rules
+    inaccurate_data = sum(dimension_counts(df, 'Precisión', results).values())
 
     return inaccurate_data
 
@@ -356,12 +753,107 @@ def timeliness(df):
     # No comprobation of this kind
     return 0
 
-def anomalies_data(df):
-    total_anomalies = completeness(df) + uniqueness(df) + validity(df) + accuracy(df) + consistency(df) + timeliness(df)
-    data = {'Completitud': completeness(df), 'Unicidad': uniqueness(df), 'Validez': validity(df), 'Precisión': accuracy(df), 'Coherencia': consistency(df), 'Temporalidad': timeliness(df), 'Total': total_anomalies}
+def anomalies_data(df, results=None, data_o=None):
+    # Completeness and uniqueness are already part of the overview when it is given
+    missing_values = data_o['total_missing_values'] if data_o is not None else completeness(df)
+    duplicate_rows = data_o['duplicate_rows'] if data_o is not None else uniqueness(df)
+
+    data = {'Completitud': missing_values, 'Unicidad': duplicate_rows, 'Validez': validity(df, results), 'Precisión': accuracy(df, results), 'Coherencia': consistency(df), 'Temporalidad': timeliness(df)}
+    data['Total'] = sum(data.values())
 
     return data
 
+# Anomaly counts of a dataset read in chunks, updated as each chunk arrives
+# Hash of every row that doesn't depend on the types inferred for each chunk: a column read as numbers
+# in one chunk and as text in another ('12' and 12.0) gives the same hash. Missing values, numbers and
+# texts are hashed apart, so 'nan' or '1' written as text in a text column can't be mistaken for them
+def row_hashes(df):
+    hashes = np.zeros(df.shape[0], dtype=np.uint64)
+    for column in df.columns:
+        series = df[column]
+        missing = series.isnull().to_numpy()
+        if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+            numbers = series.to_numpy(dtype=float, na_value=np.nan)
+            text = None
+        else:
+            # Only texts that are numbers are converted, booleans stay 'True' / 'False'
+            text = series.astype(str)
+            numbers = pd.to_numeric(text, errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+        is_number = ~np.isnan(numbers) & ~missing
+        # -0.0 and 0.0 are the same value, as for duplicated()
+        numbers = numbers + 0.0
+
+        values = np.full(df.shape[0], np.uint64(0x9E3779B97F4A7C15))
+        values[is_number] = pd.util.hash_array(numbers[is_number])
+        is_text = ~is_number & ~missing
+        if text is not None and is_text.any():
+            values[is_text] = pd.util.hash_array(text.to_numpy()[is_text].astype(object)) ^ np.uint64(0x5851F42D4C957F2D)
+        # Columns are combined in order, so the position of every value counts
+        hashes = hashes * np.uint64(1000003) ^ values
+    return hashes
+
+class SeenRows():
+    # Sorted hashes of the rows already seen, to find duplicates split across chunks
+
+    def __init__(self):
+        self.hashes = np.empty(0, dtype=np.uint64)
+
+    def add(self, hashes):
+        # Number of rows that are not the first occurrence of their hash
+        unique = np.unique(hashes)
+        positions = np.searchsorted(self.hashes, unique)
+        seen = positions < self.hashes.shape[0]
+        seen[seen] = self.hashes[positions[seen]] == unique[seen]
+        new = unique[~seen]
+        # Two sorted runs, the stable sort merges them in linear time
+        self.hashes = np.sort(np.concatenate([self.hashes, new]), kind='stable')
+        return len(hashes) - len(new)
+
+
+class ChunkedAnalysis():
+
+    def __init__(self):
+        self.rules = quality_rules()
+        self.counts = {}
+        self.rows = 0
+        self.cols = 0
+        self.missing_values = 0
+        self.duplicate_rows = 0
+        self.seen_rows = SeenRows()
+
+    def update(self, chunk):
+        self.rows += chunk.shape[0]
+        self.cols = chunk.shape[1]
+        self.missing_values += chunk.isnull().sum().sum()
+        self.duplicate_rows += self.seen_rows.add(row_hashes(chunk))
+
+        for rule, (dimension, test, args, merge) in self.rules.items():
+            count = rule_count(test(chunk, *args))
+            self.counts[rule] = merge([self.counts[rule], count]) if rule in self.counts else count
+
+    def dimension_total(self, dimension):
+        return sum(count for rule, count in self.counts.items() if self.rules[rule][0] == dimension)
+
+    def anomalies(self):
+        data = {
+            'Completitud': self.missing_values,
+            'Unicidad': self.duplicate_rows,
+            'Validez': self.dimension_total('Validez'),
+            'Precisión': self.dimension_total('Precisión'),
+            'Coherencia': 0,
+            'Temporalidad': 0,
+        }
+        data['Total'] = sum(data.values())
+
+        return data
+
+# Anomalies of a dataset read in chunks, yields the totals accumulated after each chunk
+def anomalies_data_from_chunks(chunks):
+    analysis = ChunkedAnalysis()
+    for chunk in chunks:
+        analysis.update(chunk)
+        yield analysis.anomalies()
+
 ## Data analysis report data
 
 def sources_report():
@@ -385,7 +877,22 @@ def sources_report():
 
     return data
 
-def regards_data(df):
+def regards_data(df, results=None, data_o=None, near_duplicates=None, multivariate_outliers=None):
+    # Every test is run once, the results are shared by the texts below
+    results = results if results is not None else rules_results(df)
+    rows = dataset_properties(df)['rows']
+    all_data = dataset_properties(df)['all']
+    data_o = data_o if data_o is not None else overview(df)
+    near_duplicates = near_duplicates if near_duplicates is not None else dataset_has_near_duplicate_tracks(df)
+    near_pairs = near_duplicates['pairs'] if near_duplicates else pd.DataFrame(columns=['first', 'second'])
+    # The examples with different names show best what the check finds
+    renamed = df.loc[near_pairs['first'], 'track_name'].to_numpy() != df.loc[near_pairs['second'], 'track_name'].to_numpy()
+    near_pairs = near_pairs[renamed].head(3) if renamed.any() else near_pairs.head(3)
+    multivariate_outliers = multivariate_outliers if multivariate_outliers is not None else dataset_has_multivariate_outliers(df)
+    outlier_rows = multivariate_outliers['outliers'].index[:3] if multivariate_outliers else []
+    # The release year texts use their own upper limit
+    year_anomalies = column_has_values_outside_range(df, 'album_release_date', '2006-01-01', '2024-01-01')
+
     null_value = df[df.isnull().any(axis=1)].head(1)
     null_index = null_value.index[0]
     null_column = null_value.columns[null_value.isnull().any()][0]
@@ -394,28 +901,38 @@ def regards_data(df):
     anomalies = {
         "Id de canción nulo:": 
         f"""
-        Se encontraron {column_has_null_values(df, 'track_id')['count']} canciones con el id nulo de {dataset_properties(df)['rows']} datos. <br/>
+        Se encontraron {results['track_id_nulls']['count']} canciones con el id nulo de {rows} datos. <br/>
         <br/>
         Ejemplo: <br/>
         <br/>
-        {df.loc[column_has_null_values(df, 'track_id')['nulls'], 'track_id'].head(1).to_string()}<br/>
+        {df.loc[results['track_id_nulls']['nulls'], 'track_id'].head(1).to_string()}<br/>
         <br/>
         """,
 
         "Filas duplicadas:":
         f"""
-        Se encontraron {dataset_has_duplicate_rows(df)['count']} filas duplicadas de {dataset_properties(df)['rows']}. <br/>
+        Se encontraron {data_o['duplicate_rows']} filas duplicadas de {rows}. <br/>
         <br/>
         Ejemplo: <br/>
         <br/>
         5 Indices de filas duplicadas: <br/>
-        {dataset_has_duplicate_rows(df)['duplicates'].head().index.to_list()}<br/>
+        {data_o['duplicate_rows_index'][:5].to_list()}<br/>
+        <br/>
+        """,
+
+        "Canciones casi duplicadas:":
+        f"""
+        Se encontraron {near_duplicates['count'] if near_duplicates else 0} canciones casi duplicadas de {rows}: nombres similares y características de audio casi iguales, con distinto id de canción. Los sufijos de versión como "(Taylor's Version)" o "- Remastered" no se tienen en cuenta en los nombres. <br/>
+        <br/>
+        Ejemplo: <br/>
+        <br/>
+        {[[df.loc[first, 'track_name'], df.loc[second, 'track_name']] for first, second in zip(near_pairs['first'], near_pairs['second'])]}<br/>
         <br/>
         """,
 
         "Valores nulos:": 
         f"""
-        Se encontraron {completeness(df)} valores nulos de {dataset_properties(df)['all']} datos. <br/>
+        Se encontraron {data_o['total_missing_values']} valores nulos de {all_data} datos. <br/>
         <br/>
         Ejemplo: <br/>
         <br/>
@@ -426,11 +943,11 @@ def regards_data(df):
 
         "Formato incorrecto en nombres de canciones según la convencion de nombramiento en inglés:": 
         f"""
-        Se encontraron {column_has_incorrect_text_format(df, 'track_name', 'lower')['count']} nombres de canciones con formato incorrecto de {dataset_properties(df)['rows']} datos. <br/>
+        Se encontraron {results['track_name_format']['count']} nombres de canciones con formato incorrecto de {rows} datos. <br/>
         <br/>
         Ejemplo: <br/>
         <br/>
-        incorrect_track_names = {column_has_incorrect_text_format(df, 'track_name', 'lower')['incorrect_format'][:4]}<br/>
+        incorrect_track_names = {results['track_name_format']['incorrect_format'][:4]}<br/>
         <br/>
         NOTA: <br/>
         Puede no ser necesariamente una anomalía. Es importante destacar que, en la industria musical, la creatividad y la expresión artística a menudo influyen en la elección de nombres de canciones, lo que puede llevar a variaciones en el formato. Este hallazgo se menciona con la precaución de que la divergencia del formato convencional puede ser intencional y parte del estilo artístico. <br/>
@@ -438,28 +955,28 @@ def regards_data(df):
 
         "Caracteres mal codificados en nombres de canciones:":
         f"""
-        Se encontraron {column_has_bad_encoding(df, 'track_name')['count']} nombres de canciones con caracteres mal codificados de {dataset_properties(df)['rows']} datos. <br/>
+        Se encontraron {results['track_name_encoding']['count']} nombres de canciones con caracteres mal codificados de {rows} datos. <br/>
         <br/>
         Ejemplo: <br/>
         <br/>
-        track_name_anomalies = {column_has_bad_encoding(df, 'track_name')['bad_encoding'][41:45]}<br/>
+        track_name_anomalies = {results['track_name_encoding']['bad_encoding'][41:45]}<br/>
         <br/>""",
 
         "Datos no booleanos en la columna ‘explicit’:": f"""
-        Se encontraron {column_has_incorrect_boolean_values(df, 'explicit')['count']} datos no booleanos en la columna ‘explicit’ de {dataset_properties(df)['rows']} datos. <br/>
+        Se encontraron {results['explicit_boolean']['count']} datos no booleanos en la columna ‘explicit’ de {rows} datos. <br/>
         <br/>
         Ejemplo: <br/>
         <br/>
-        explicit_anomalies = {column_has_incorrect_boolean_values(df, 'explicit')['incorrect_boolean']}<br/>
+        explicit_anomalies = {results['explicit_boolean']['incorrect_boolean']}<br/>
         <br/>
         <br/>""",
 
         "Datos no numéricos en la columna ‘album_total_tracks’:": f"""
-        Se encontraron {column_has_incorrect_numeric_values(df, 'album_total_tracks')['count']} datos no numéricos en la columna ‘album_total_tracks’ de {dataset_properties(df)['rows']} datos. <br/>
+        Se encontraron {results['album_total_tracks_numeric']['count']} datos no numéricos en la columna ‘album_total_tracks’ de {rows} datos. <br/>
         <br/>
         Ejemplo: <br/>
         <br/>
-        album_total_tracks_anomalies = {column_has_incorrect_numeric_values(df, 'album_total_tracks')['incorrect_numeric']}<br/>
+        album_total_tracks_anomalies = {results['album_total_tracks_numeric']['incorrect_numeric']}<br/>
         <br/>""",
 
         # "Formato diferente a fecha en la columna ‘album_release_date’:": f"""
@@ -480,100 +997,161 @@ def regards_data(df):
         <br/>""",
 
         "Datos no convertibles a numéricos en la columna ‘audio_features.instrumentalness’:": f"""
-        Se encontraron {column_cant_be_converted_to_numeric(df, 'audio_features.instrumentalness')['count']} datos no convertibles a numéricos en la columna ‘audio_features.instrumentalness’ de {dataset_properties(df)['rows']} datos. <br/>
+        Se encontraron {results['instrumentalness_conversion']['count']} datos no convertibles a numéricos en la columna ‘audio_features.instrumentalness’ de {rows} datos. <br/>
         <br/>
         Ejemplo: <br/>
         <br/>
-        instrumentalness_type_conver_anomalies = {column_cant_be_converted_to_numeric(df, 'audio_features.instrumentalness')['cant_be_converted']} <br/>
+        instrumentalness_type_conver_anomalies = {results['instrumentalness_conversion']['cant_be_converted']} <br/>
          <br/>""",
 
         "Valores fuera del rango [0,1] en la columna 'audio_features.danceability':": f"""
-        Se encontraron {column_has_values_outside_range(df, 'audio_features.danceability', 0, 1)['count']} valores fuera del rango [0,1] en la columna 'audio_features.danceability' de {dataset_properties(df)['rows']} datos. <br/>
+        Se encontraron {results['danceability_range']['count']} valores fuera del rango [0,1] en la columna 'audio_features.danceability' de {rows} datos. <br/>
         <br/>
         Ejemplo: <br/>
         <br/>
-        danceability_anomalies = {column_has_values_outside_range(df, 'audio_features.danceability', 0, 1)['outside_range']}<br/>
+        danceability_anomalies = {results['danceability_range']['outside_range']}<br/>
         <br/>""",
 
         "Valores fuera del rango [0,1] en la columna 'audio_features.energy’:": f"""
-        Se encontraron {column_has_values_outside_range(df, 'audio_features.energy', 0, 1)['count']} valores fuera del rango [0,1] en la columna 'audio_features.energy’ de {dataset_properties(df)['rows']} datos. <br/>
+        Se encontraron {results['energy_range']['count']} valores fuera del rango [0,1] en la columna 'audio_features.energy’ de {rows} datos. <br/>
         <br/>
         Ejemplo: <br/>
         <br/>
-        energy_anomalies = {column_has_values_outside_range(df, 'audio_features.energy', 0, 1)['outside_range']}<br/>
+        energy_anomalies = {results['energy_range']['outside_range']}<br/>
         <br/>""",
 
         "Valores fuera del rango [0,1] en la columna 'audio_features.liveness’:": f"""
-        Se encontraron {column_has_values_outside_range(df, 'audio_features.liveness', 0, 1)['count']} valores fuera del rango [0,1] en la columna 'audio_features.liveness’ de {dataset_properties(df)['rows']} datos. <br/>
+        Se encontraron {results['liveness_range']['count']} valores fuera del rango [0,1] en la columna 'audio_features.liveness’ de {rows} datos. <br/>
         <br/>
         Ejemplo: <br/>
         <br/>
-        liveness_anomalies = {column_has_values_outside_range(df, 'audio_features.liveness', 0, 1)['outside_range']}<br/>
+        liveness_anomalies = {results['liveness_range']['outside_range']}<br/>
         <br/>""",
 
         "Valores fuera del rango [3,7] en la columna 'audio_features.time_signature’:": f"""
-        Se encontraron {column_has_values_outside_range(df, 'audio_features.time_signature', 3, 7)['count']} valores fuera del rango [3,7] en la columna 'audio_features.time_signature’ de {dataset_properties(df)['rows']} datos. <br/>
+        Se encontraron {results['time_signature_range']['count']} valores fuera del rango [3,7] en la columna 'audio_features.time_signature’ de {rows} datos. <br/>
         <br/>
         Ejemplo: <br/>
         <br/>
-        time_signature_anomalies = {column_has_values_outside_range(df, 'audio_features.time_signature', 3, 7)['outside_range']}<br/>
+        time_signature_anomalies = {results['time_signature_range']['outside_range']}<br/>
         <br/>""",
 
         "Valores fuera del rango [-1,11] en la columna 'audio_features.key’:": f"""
-        Se encontraron {column_has_values_outside_range(df, 'audio_features.key', -1, 11)['count']} valores fuera del rango [-1,11] en la columna 'audio_features.key’ de {dataset_properties(df)['rows']} datos. <br/>
+        Se encontraron {results['key_range']['count']} valores fuera del rango [-1,11] en la columna 'audio_features.key’ de {rows} datos. <br/>
         <br/>
         Ejemplo: <br/>
         <br/>
-        key_anomalies = {column_has_values_outside_range(df, 'audio_features.key', -1, 11)['outside_range']}<br/>
+        key_anomalies = {results['key_range']['outside_range']}<br/>
         <br/>""",
 
         "Valores fuera del rango [-60,0] en la columna 'audio_features.loudness’:": f"""
-        Se encontraron {column_has_values_outside_range(df, 'audio_features.loudness', -60, 0)['count']} valores fuera del rango [-60,0] en la columna 'audio_features.loudness’ de {dataset_properties(df)['rows']} datos. <br/>
+        Se encontraron {results['loudness_range']['count']} valores fuera del rango [-60,0] en la columna 'audio_features.loudness’ de {rows} datos. <br/>
         <br/>
         Ejemplo: <br/>
         <br/>
-        loudness_anomalies = {column_has_values_outside_range(df, 'audio_features.loudness', -60, 0)['outside_range']}<br/>
+        loudness_anomalies = {results['loudness_range']['outside_range']}<br/>
         <br/>""",
 
         "Valores fuera del rango [0,100] en la columna 'track_popularity’:": f"""
-        Se encontraron {column_has_values_outside_range(df, 'track_popularity', 0, 100)['count']} valores fuera del rango [0,100] en la columna 'track_popularity’ de {dataset_properties(df)['rows']} datos. <br/>
+        Se encontraron {results['track_popularity_range']['count']} valores fuera del rango [0,100] en la columna 'track_popularity’ de {rows} datos. <br/>
         <br/>
         Ejemplo: <br/>
         <br/>
-        track_popularity_anomalies = {column_has_values_outside_range(df, 'track_popularity', 0, 100)['outside_range']}<br/>
+        track_popularity_anomalies = {results['track_popularity_range']['outside_range']}<br/>
         <br/>""",
 
         "Valores fuera del rango [0,100] en la columna 'artist_popularity’:": f"""
-        Se encontraron {column_has_values_outside_range(df, 'artist_popularity', 0, 100)['count']} valores fuera del rango [0,100] en la columna 'artist_popularity’ de {dataset_properties(df)['rows']} datos. <br/>
+        Se encontraron {results['artist_popularity_range']['count']} valores fuera del rango [0,100] en la columna 'artist_popularity’ de {rows} datos. <br/>
         <br/>
         Ejemplo: <br/>
         <br/>
-        artist_popularity_anomalies = {column_has_values_outside_range(df, 'artist_popularity', 0, 100)['outside_range']}<br/>
+        artist_popularity_anomalies = {results['artist_popularity_range']['outside_range']}<br/>
         <br/>""",
 
         "Valores fuera del rango [82000, 630000] en la columna ‘duration_ms’:": f"""
-        Se encontraron {column_has_values_outside_range(df, 'duration_ms', 82000, 630000)['count']} valores fuera del rango [82000, 630000] en la columna ‘duration_ms’ de {dataset_properties(df)['rows']} datos. <br/>
+        Se encontraron {results['duration_ms_range']['count']} valores fuera del rango [82000, 630000] en la columna ‘duration_ms’ de {rows} datos. <br/>
         <br/>
         Ejemplo: <br/>
         <br/>
-        duration_ms_anomalies = {column_has_values_outside_range(df, 'duration_ms', 82000, 630000)['outside_range']}<br/>
+        duration_ms_anomalies = {results['duration_ms_range']['outside_range']}<br/>
         <br/>
         Nota: <br/>
         Los limites superior e inferior de 630,000 y 82,000 milisegundos se eligen basados en la duración de la canción más larga y más corta de Taylor Swift, que tienen aproximadamente 10 minutos y 1 minuto y 22 segundos respectivamente. <br/>
         <br/>""",
 
         "Valores fuera del rango [2006, 2024] en la columna ‘album_release_date’:": f"""
-        Se encontraron {column_has_values_outside_range(df, 'album_release_date', '2006-01-01', '2024-01-01')['count']} valores fuera del rango [2006, 2024] en la columna ‘album_release_date’ de {dataset_properties(df)['rows']} datos. <br/>
+        Se encontraron {year_anomalies['count']} valores fuera del rango [2006, 2024] en la columna ‘album_release_date’ de {rows} datos. <br/>
         <br/>
         Ejemplo: <br/>
         <br/>
-        year_anomalies = {column_has_values_outside_range(df, 'album_release_date', '2006-01-01', '2024-01-01')['outside_range']}<br/>
+        year_anomalies = {year_anomalies['outside_range']}<br/>
+        <br/>""",
+
+        "Combinaciones atípicas de características de audio:": f"""
+        Se encontraron {multivariate_outliers['count'] if multivariate_outliers else 0} canciones cuya combinación de características de audio (danceability, energy, loudness, speechiness, acousticness, liveness, valence, tempo) está lejos del resto de los datos, aunque cada valor esté dentro de su rango, de {rows} datos. <br/>
+        <br/>
+        Ejemplo: <br/>
+        <br/>
+        audio_features_outliers = {df.loc[outlier_rows, 'track_name'].to_dict()}<br/>
+        <br/>
+        Nota: <br/>
+        La distancia de cada canción se calcula con una covarianza robusta (determinante de covarianza mínima) ajustada sobre una muestra, por lo que los valores atípicos no alteran el modelo. Las canciones con una distancia superior al cuantil {multivariate_settings['quantile'] * 100:g}% se consideran atípicas. <br/>
         <br/>""",
     }
 
     return anomalies
 
-def analysis_stats(df):
+## Anomalous rows
+# Boolean mask of the rows that break each kind of test, with the same criteria as the test
+def text_format_mask(df, column, format):
+    # The tests only consider rows without empty values
+    complete = df.notnull().all(axis=1)
+    text = df[column].where(complete).astype('string')
+    if format == 'lower':
+        mask = text.str.islower()
+    elif format == 'upper':
+        mask = text.str.isupper()
+    elif format == 'title':
+        mask = text.str.istitle()
+    else:
+        return pd.Series(False, index=df.index)
+    return mask.fillna(False).astype(bool)
+
+def text_values(df, column):
+    # Columns parsed as numbers or booleans are checked as text
+    return df[column] if df[column].dtype == object else df[column].astype(str)
+
+anomaly_masks = {
+    column_has_null_values: lambda df, column: df[column].isnull(),
+    column_has_incorrect_text_format: text_format_mask,
+    column_has_bad_encoding: lambda df, column: df.notnull().all(axis=1) & df[column].apply(lambda value: isinstance(value, str) and utils_io.contains_bad_encoding(value)),
+    column_has_incorrect_boolean_values: lambda df, column: ~text_values(df, column).isin(['True', 'False']),
+    column_has_incorrect_numeric_values: lambda df, column: ~text_values(df, column).str.isnumeric().fillna(False).astype(bool),
+    column_cant_be_converted_to_numeric: lambda df, column: ~df[column].apply(func=utils_io.can_be_converted),
+    column_has_values_outside_range: lambda df, column, min, max: ~df[column].between(min, max, inclusive='both'),
+}
+
+# Rules that can list their anomalous rows: the rules with a row mask, nulls and duplicates
+def appendix_rules():
+    rules = {'null_values': ('Completitud', None, (), sum), 'duplicate_rows': ('Unicidad', None, (), sum)}
+    rules |= {rule: definition for rule, definition in quality_rules().items() if definition[1] in anomaly_masks}
+    return rules
+
+def anomaly_mask(df, rule):
+    if rule == 'null_values':
+        return df.isnull().any(axis=1)
+    elif rule == 'duplicate_rows':
+        return df.duplicated()
+    dimension, test, args, merge = quality_rules()[rule]
+    return anomaly_masks[test](df, *args)
+
+# Anomalous rows of a rule, yielded in pages so they can be laid out without holding all of them
+def anomalous_rows(df, rule, page_rows=1000):
+    positions = np.flatnonzero(anomaly_mask(df, rule).to_numpy())
+    for start in range(0, len(positions), page_rows):
+        yield df.iloc[positions[start:start + page_rows]]
+
+def analysis_stats(df, anomalies=None):
     ds_prop = dataset_properties(df)
     # Analized columns
     analized = [ 
@@ -602,9 +1180,114 @@ def analysis_stats(df):
     not_analyzed = [column for column in df.columns if column not in analized]
 
     data_notanaly = len(not_analyzed) * ds_prop['rows']
-    data_analy = anomalies_data(df)['Total']
+    data_analy = anomalies['Total'] if anomalies is not None else anomalies_data(df)['Total']
     good_data = ds_prop['all'] - data_notanaly - data_analy
 
     stats = {'notAnalyzed': data_notanaly , 'analyzed': data_analy, 'good': good_data}
 
-    return stats
\ No newline at end of file
+    return stats
+
+# Every statistic used by the sections of the report, computed once for the whole dataset
+def report_context(df):
+    data_o = overview(df)
+    results = rules_results(df)
+    anomalies = anomalies_data(df, results, data_o)
+    near_duplicates = dataset_has_near_duplicate_tracks(df)
+    multivariate_outliers = dataset_has_multivariate_outliers(df)
+
+    context = {
+        'overview': data_o,
+        'results': results,
+        'anomalies': anomalies,
+        'near_duplicates': near_duplicates,
+        'multivariate_outliers': multivariate_outliers,
+        'stats': analysis_stats(df, anomalies),
+        'regards': regards_data(df, results, data_o, near_duplicates, multivariate_outliers),
+        'sources': sources_report(),
+        'nullity': nullity_density(df),
+    }
+
+    return context
+
+# Statistics of every column for the profiling report, computed with vectorized pandas operations
+def column_profile(series, rows, top=10, bins=20):
+    values = series.dropna()
+    count = len(values)
+    # Frequencies of the distinct values, the text statistics are computed over them instead of every row
+    frequencies = values.value_counts()
+    distinct = len(frequencies)
+    missing = rows - count
+
+    if pd.api.types.is_bool_dtype(series):
+        kind = 'Booleano'
+    elif pd.api.types.is_numeric_dtype(series):
+        kind = 'Numérico'
+    elif pd.api.types.is_datetime64_any_dtype(series):
+        kind = 'Fecha'
+    else:
+        kind = 'Texto'
+
+    profile = {
+        'type': kind,
+        'count': count,
+        'missing': missing,
+        'missing_percentage': missing / rows * 100 if rows else 0,
+        'distinct': distinct,
+        'distinct_percentage': distinct / count * 100 if count else 0,
+        # Most frequent values and their counts
+        'top_values': [[str(value), int(freq)] for value, freq in frequencies.head(top).items()],
+    }
+
+    if kind == 'Numérico' and count:
+        quantiles = values.quantile([0.05, 0.25, 0.5, 0.75, 0.95]).tolist()
+        finite = values[np.isfinite(values)]
+        hist, edges = np.histogram(finite, bins=bins) if len(finite) else (np.array([]), np.array([]))
+        profile |= {
+            'mean': values.mean(),
+            'std': values.std(),
+            'min': values.min(),
+            'p5': quantiles[0],
+            'p25': quantiles[1],
+            'median': quantiles[2],
+            'p75': quantiles[3],
+            'p95': quantiles[4],
+            'max': values.max(),
+            'zeros': int((values == 0).sum()),
+            'negatives': int((values < 0).sum()),
+            'histogram': {'counts': hist.tolist(), 'edges': edges.tolist()},
+        }
+    elif kind == 'Texto' and count:
+        lengths = frequencies.index.astype(str).str.len().to_numpy()
+        weights = frequencies.to_numpy()
+        profile |= {'min_length': lengths.min(), 'mean_length': (lengths * weights).sum() / count, 'max_length': lengths.max()}
+
+    return profile
+
+# Warnings of the profiling report: name -> (condition, message)
+profile_alerts = {
+    'constant': (lambda p: p['distinct'] == 1, 'tiene un valor constante'),
+    'unique': (lambda p: p['count'] > 0 and p['distinct'] == p['count'], 'tiene valores únicos'),
+    'missing': (lambda p: p['missing_percentage'] > 5, 'tiene {missing} ({missing_percentage:.1f}%) valores faltantes'),
+    'zeros': (lambda p: p.get('zeros', 0) > 0.1 * p['count'], 'tiene {zeros} valores en cero'),
+    'cardinality': (lambda p: p['type'] == 'Texto' and p['distinct'] > 50 and p['distinct'] != p['count'], 'tiene una alta cardinalidad: {distinct} valores distintos'),
+}
+
+def profile_data(df, data_o=None, top=10, bins=20, sample_rows=10):
+    data_o = data_o if data_o is not None else overview(df)
+    rows = data_o['rows']
+
+    columns = {column: column_profile(df[column], rows, top, bins) for column in df.columns}
+    alerts = [[column, name, message.format(**profile)]
+              for column, profile in columns.items()
+              for name, (condition, message) in profile_alerts.items() if condition(profile)]
+
+    profile = {
+        'overview': data_o,
+        'columns': columns,
+        'alerts': alerts,
+        'head': df.head(sample_rows),
+        'tail': df.tail(sample_rows),
+        'duplicates': df.loc[data_o['duplicate_rows_index'][:sample_rows]],
+    }
+
+    return profile
@@ -1,27 +1,219 @@
-from io import StringIO, BytesIO
+import argparse
+import html
+import pickle
+import time
 from pathlib import Path
 
-import utils_io
+import numpy as np
 import pandas as pd
-from ydata_profiling import ProfileReport
 
+from data_quality_analysis import profile_data
+import utils_io
+
+# Profiling report of the whole dataset, a single self-contained HTML file with the sections
+# of the former ydata_profiling report: overview, alerts, variables, missing values, sample and
+# duplicate rows. The statistics come from the quality engine, so it takes seconds instead of minutes
 
 
 base = Path(__file__).parent.parent
-       
-# Directory to save the generated report
-output_dir = base / 'output/doc/'
+# Reports of previous runs, stored by the fingerprint of the profiled data and the sampling
+profile_cache_dir = base / '.cache' / 'profiling'
+
+style = """
+body { font-family: Helvetica, Arial, sans-serif; margin: 0 auto; max-width: 1100px; color: #222; }
+h1 { text-align: center; }
+h2 { border-bottom: 2px solid #386cb0; padding-bottom: 4px; margin-top: 40px; }
+table { border-collapse: collapse; font-size: 13px; }
+td, th { padding: 3px 10px; text-align: left; border-bottom: 1px solid #eee; }
+.variable { display: flex; gap: 30px; border-bottom: 1px solid #ccc; padding: 14px 0; }
+.variable h3 { margin: 0 0 6px 0; }
+.type { color: #777; font-size: 12px; }
+.alert { color: #bf5b17; }
+.sample { overflow-x: auto; }
+"""
+
+
+def fmt(value):
+    # Numbers with at most 4 decimals, the rest as escaped text
+    if isinstance(value, (float, np.floating)):
+        return f'{value:,.4f}'.rstrip('0').rstrip('.')
+    if isinstance(value, (int, np.integer)):
+        return f'{value:,}'
+    return html.escape(str(value))
+
+def table(rows):
+    return '<table>' + ''.join(f'<tr><th>{fmt(key)}</th><td>{fmt(value)}</td></tr>' for key, value in rows) + '</table>'
+
+def bars(counts, width=260, height=90, color='#7fc97f'):
+    # Inline SVG bar chart, no images or external files
+    if not counts:
+        return ''
+    top = max(max(counts), 1)
+    step = width / len(counts)
+    rects = ''.join(
+        f'<rect x="{i * step:.1f}" y="{height - value / top * height:.1f}" width="{step * 0.9:.1f}" height="{value / top * height:.1f}" fill="{color}"><title>{value}</title></rect>'
+        for i, value in enumerate(counts))
+    return f'<svg width="{width}" height="{height}">{rects}</svg>'
+
+def variable_html(column, profile):
+    summary = [
+        ('Distintos', profile['distinct']),
+        ('Distintos (%)', profile['distinct_percentage']),
+        ('Faltantes', profile['missing']),
+        ('Faltantes (%)', profile['missing_percentage']),
+    ]
+    if profile['type'] == 'Numérico' and profile['count']:
+        summary += [('Media', profile['mean']), ('Mínimo', profile['min']), ('Máximo', profile['max']), ('Ceros', profile['zeros']), ('Negativos', profile['negatives'])]
+        details = table([
+            ('Desviación estándar', profile['std']),
+            ('Percentil 5', profile['p5']),
+            ('Q1', profile['p25']),
+            ('Mediana', profile['median']),
+            ('Q3', profile['p75']),
+            ('Percentil 95', profile['p95']),
+        ])
+        histogram = profile['histogram']
+        chart = bars(histogram['counts'])
+        if histogram['edges']:
+            chart += f'<div class="type">{fmt(histogram["edges"][0])} — {fmt(histogram["edges"][-1])}</div>'
+    else:
+        if profile['type'] == 'Texto' and profile['count']:
+            summary += [('Longitud mínima', profile['min_length']), ('Longitud media', profile['mean_length']), ('Longitud máxima', profile['max_length'])]
+        details = table(profile['top_values'])
+        chart = bars([freq for value, freq in profile['top_values']], color='#beaed4')
+
+    return f"""
+    <div class="variable">
+        <div style="width: 220px"><h3>{fmt(column)}</h3><div class="type">{profile['type']}</div></div>
+        <div>{table(summary)}</div>
+        <div>{details}</div>
+        <div>{chart}</div>
+    </div>"""
+
+def frame_html(df):
+    if df.empty:
+        return '<p>Sin registros</p>'
+    return f'<div class="sample">{df.to_html(border=0, na_rep="", max_cols=None)}</div>'
+
+def sample_dataset(df, rows=None, fraction=None, strata='album_id', seed=0):
+    """Sample of the dataset with the same proportion of rows of every album
+
+    :param rows: Approximate number of rows of the sample
+    :param fraction: Fraction of the rows of the sample, used if rows is not specified
+    :param strata: Column whose groups keep their proportions
+    :param seed: Seed of the random sample, the same data gives the same sample
+    :return: Sampled dataframe in the original order, or df if no sampling is needed
+    """
+    if rows is not None:
+        fraction = rows / len(df) if len(df) else 1
+    if fraction is None or fraction >= 1:
+        return df
+    sample = df.groupby(strata, group_keys=False, dropna=False).sample(frac=fraction, random_state=seed)
+    return sample.sort_index()
+
+def profile_html(profile, title="Profiling Report", total_rows=None):
+    data_o = profile['overview']
+    columns = profile['columns']
+
+    types = pd.Series([p['type'] for p in columns.values()]).value_counts()
+    overview_rows = [
+        ('Número de variables', data_o['cols']),
+        ('Número de observaciones', data_o['rows']),
+        ('Celdas vacías', data_o['total_missing_values']),
+        ('Celdas vacías (%)', data_o['total_missing_values_percentage']),
+        ('Filas duplicadas', data_o['duplicate_rows']),
+        ('Filas duplicadas (%)', data_o['duplicate_rows_percentage']),
+    ]
+    alerts = ''.join(f'<li><b>{fmt(column)}</b> <span class="alert">{fmt(message)}</span></li>' for column, name, message in profile['alerts'])
+    variables = ''.join(variable_html(column, p) for column, p in columns.items())
+    missing = [(column, p['count']) for column, p in columns.items()]
+    sampled = ''
+    if total_rows is not None and total_rows != data_o['rows']:
+        sampled = f'<p class="alert">Informe calculado con una muestra de {fmt(data_o["rows"])} de {fmt(total_rows)} filas, estratificada por álbum.</p>'
+
+    return f"""<!DOCTYPE html>
+<html lang="es">
+<head><meta charset="utf-8"><title>{fmt(title)}</title><style>{style}</style></head>
+<body>
+<h1>{fmt(title)}</h1>
+{sampled}
+<h2>Resumen</h2>
+<div class="variable"><div>{table(overview_rows)}</div><div>{table(types.items())}</div></div>
+<h2>Alertas</h2>
+<ul>{alerts or '<li>Sin alertas</li>'}</ul>
+<h2>Variables</h2>
+{variables}
+<h2>Valores faltantes</h2>
+<p>Valores presentes por variable</p>
+{bars([count for column, count in missing], width=900, height=160, color='#386cb0')}
+{table(missing)}
+<h2>Muestra</h2>
+<h3>Primeras filas</h3>
+{frame_html(profile['head'])}
+<h3>Últimas filas</h3>
+{frame_html(profile['tail'])}
+<h2>Filas duplicadas</h2>
+{frame_html(profile['duplicates'])}
+<p class="type">Generado el {time.strftime('%Y-%m-%d %H:%M:%S')}</p>
+</body>
+</html>
+"""
+
+
+def profiling_report(df, rows=None, fraction=None, directory=None, title="Profiling Report"):
+    """HTML profiling report of the dataset, reused from a previous run when the data didn't change
+
+    :param rows: Rows of a stratified sample to profile instead of the whole dataset
+    :param fraction: Fraction of the rows of the sample, used if rows is not specified
+    :param directory: Cache directory. If not specified then profile_cache_dir is used
+    :return: HTML of the report and its statistics
+    """
+    directory = Path(directory or profile_cache_dir)
+    fingerprint = utils_io.object_fingerprint([utils_io.df_fingerprint(df), rows, fraction, title])
+    html_path = directory / f'{fingerprint}.html'
+    stats_path = directory / f'{fingerprint}.pkl'
+    if html_path.exists() and stats_path.exists():
+        with open(stats_path, 'rb') as f:
+            profile = pickle.load(f)
+        return html_path.read_text(encoding='utf-8'), profile
+
+    sample = sample_dataset(df, rows, fraction)
+    profile = profile_data(sample)
+    if len(sample) != len(df):
+        title = f"{title} (muestra)"
+    report = profile_html(profile, title, total_rows=len(df))
+
+    directory.mkdir(parents=True, exist_ok=True)
+    with open(stats_path, 'wb') as f:
+        pickle.dump(profile, f)
+    html_path.write_text(report, encoding='utf-8')
+
+    return report, profile
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Profiling report of the dataset')
+    parser.add_argument('--method', default='url', help="Dataset source: 's3', 'url', 'local' or 'parquet'")
+    parser.add_argument('--sample-rows', type=int, help='Profile a sample of this many rows, stratified by album')
+    parser.add_argument('--sample-fraction', type=float, help='Profile a sample with this fraction of the rows, stratified by album')
+    args = parser.parse_args()
 
-# Read the CSV file using the selected method
-df = utils_io.get_dataset('url')
+    start = time.time()
+    # Directory to save the generated report
+    output_dir = base / 'output/doc/'
+    output_dir.mkdir(parents=True, exist_ok=True)
 
-# Perform data analysis using ydata_profiling library
-profile = ProfileReport(df, title="Profiling Report", correlations={"auto": {"calculate": False}}, missing_diagrams={"Heatmap": False})
+    # Read the CSV file using the selected method
+    df = utils_io.get_dataset(args.method)
 
-profile.to_file(output_dir / "profilling_report.html")
+    report_path = output_dir / "profilling_report.html"
+    report, profile = profiling_report(df, args.sample_rows, args.sample_fraction)
+    with open(report_path, 'w', encoding='utf-8') as f:
+        f.write(report)
+    print(f"Profiling report generated in {time.time() - start:.2f} seconds")
 
-try:
-    bucket = 'dataqualitychallenge'
-    utils_io.upload_file(output_dir / "profilling_report.html", bucket, 'profilling_report.html')
-except Exception as e:
-    print("Error uploading dataset to S3: ", e)
\ No newline at end of file
+    try:
+        bucket = 'dataqualitychallenge'
+        utils_io.upload_file(report_path, bucket, 'profilling_report.html')
+    except Exception as e:
+        print("Error uploading dataset to S3: ", e)
@@ -0,0 +1,168 @@
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from data_quality_analysis import *
+import run_history
+import utils_io
+
+# Headless version of the data quality report: the same checks of report_generator.py,
+# written as a compact results document, without charts, locale setup or PDF layout.
+
+base = Path(__file__).parent.parent
+
+
+# Anomaly examples of a rule result, at most `limit` of them
+def rule_examples(result, limit):
+    if not isinstance(result, dict):
+        return []
+    for key, value in result.items():
+        if key == 'count':
+            continue
+        # Boolean masks are reported as the index of the anomalous rows
+        if isinstance(value, pd.Series) and value.dtype == bool:
+            return value.index[value].tolist()[:limit]
+        if isinstance(value, pd.DataFrame):
+            return value.index.tolist()[:limit]
+        return list(value[:limit])
+    return []
+
+def quality_results(df, examples=5):
+    start = time.time()
+    data_o = overview(df)
+    # Every rule is timed, the run history keeps the time of each check
+    results, timings = {}, {}
+    for rule, (dimension, test, args, merge) in quality_rules().items():
+        rule_start = time.perf_counter()
+        results[rule] = test(df, *args)
+        timings[rule] = time.perf_counter() - rule_start
+    rule_start = time.perf_counter()
+    near_duplicates = dataset_has_near_duplicate_tracks(df)
+    timings['near_duplicate_tracks'] = time.perf_counter() - rule_start
+    rule_start = time.perf_counter()
+    multivariate_outliers = dataset_has_multivariate_outliers(df)
+    timings['audio_features_outliers'] = time.perf_counter() - rule_start
+    anomalies = anomalies_data(df, results, data_o)
+    stats = analysis_stats(df, anomalies)
+
+    document = results_document(data_o, results, anomalies, stats, examples, timings, near_duplicates, multivariate_outliers)
+    document['seconds'] = time.time() - start
+
+    return document
+
+# Results document from statistics that were already computed, as the report context
+def results_document(data_o, results, anomalies, stats, examples=5, timings=None, near_duplicates=None, multivariate_outliers=None):
+    all_data = data_o['all']
+
+    rules = []
+    for rule, (dimension, test, args, merge) in quality_rules().items():
+        count = rule_count(results[rule])
+        rules.append({
+            'rule': rule,
+            'dimension': dimension,
+            'column': args[0],
+            'count': count,
+            'percentage': count / data_o['rows'] * 100,
+            'seconds': timings.get(rule) if timings is not None else None,
+            'examples': rule_examples(results[rule], examples),
+        })
+    # Sub-check of the uniqueness, it is not part of the Unicidad total (exact duplicate rows)
+    near_count = near_duplicates['count'] if near_duplicates else 0
+    rules.append({
+        'rule': 'near_duplicate_tracks',
+        'dimension': 'Unicidad',
+        'column': 'track_name',
+        'count': near_count,
+        'percentage': near_count / data_o['rows'] * 100,
+        'seconds': timings.get('near_duplicate_tracks') if timings is not None else None,
+        'examples': near_duplicates['pairs'][['first', 'second']].head(examples).values.tolist() if near_duplicates else [],
+    })
+    # Sub-check of the accuracy, it is not part of the Precisión total (values outside their range)
+    outliers_count = multivariate_outliers['count'] if multivariate_outliers else 0
+    rules.append({
+        'rule': 'audio_features_outliers',
+        'dimension': 'Precisión',
+        'column': 'audio_features',
+        'count': outliers_count,
+        'percentage': outliers_count / data_o['rows'] * 100,
+        'seconds': timings.get('audio_features_outliers') if timings is not None else None,
+        'examples': multivariate_outliers['outliers'].index[:examples].tolist() if multivariate_outliers else [],
+    })
+
+    document = {
+        'generated': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'dataset': {'rows': data_o['rows'], 'cols': data_o['cols'], 'all': all_data},
+        'overview': {
+            'numerics': data_o['numerics'],
+            'strings': data_o['strings'],
+            'date_time': data_o['date_time'],
+            'total_missing_values': data_o['total_missing_values'],
+            'total_missing_values_percentage': data_o['total_missing_values_percentage'],
+            'duplicate_rows': data_o['duplicate_rows'],
+            'duplicate_rows_percentage': data_o['duplicate_rows_percentage'],
+            'duplicate_rows_examples': data_o['duplicate_rows_index'][:examples].tolist(),
+        },
+        'dimensions': {dimension: {'count': count, 'percentage': count / all_data * 100} for dimension, count in anomalies.items()},
+        # Same overall score of the report: percentage of data without anomalies
+        'score': (1 - anomalies['Total'] / all_data) * 100,
+        'stats': stats,
+        'rules': rules,
+    }
+
+    return document
+
+def json_default(value):
+    # Numpy numbers and arrays are written as plain JSON values
+    if isinstance(value, (np.generic, np.ndarray)):
+        return value.tolist()
+    return str(value)
+
+def write_results(document, path, format='json'):
+    if format == 'json':
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(document, f, ensure_ascii=False, indent=1, default=json_default)
+    elif format == 'arrow':
+        import pyarrow as pa
+        import pyarrow.feather as feather
+
+        # One row per rule, the rest of the document is kept in the schema metadata
+        rules = pd.DataFrame(document['rules'])
+        rules['examples'] = rules['examples'].apply(lambda values: json.dumps(values, ensure_ascii=False, default=json_default))
+        summary = {key: value for key, value in document.items() if key != 'rules'}
+        table = pa.Table.from_pandas(rules, preserve_index=False)
+        table = table.replace_schema_metadata({'data_quality': json.dumps(summary, ensure_ascii=False, default=json_default)})
+        feather.write_feather(table, path)
+    else:
+        raise ValueError(f'Invalid format: {format}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Data quality results without the PDF report')
+    parser.add_argument('--method', default='url', help="Dataset source: 's3', 'url', 'local' or 'parquet'")
+    parser.add_argument('--format', default='json', choices=['json', 'arrow'], help='Format of the results document')
+    parser.add_argument('--examples', type=int, default=5, help='Maximum examples per rule')
+    parser.add_argument('--output', help='Path of the results document')
+    parser.add_argument('--no-history', action='store_true', help='Do not append the results to the run history')
+    args = parser.parse_args()
+
+    try:
+        start = time.time()
+        df = utils_io.get_dataset(args.method)
+        document = quality_results(df, args.examples)
+
+        extension = 'json' if args.format == 'json' else 'arrow'
+        output = Path(args.output) if args.output else base / 'output' / 'doc' / f'data_quality_results.{extension}'
+        write_results(document, output, args.format)
+        if not args.no_history:
+            run_history.record_run(document, fingerprint=utils_io.df_fingerprint(df))
+
+        print(f"Results written to {output} in {time.time() - start:.2f} seconds (score {document['score']:.1f})")
+
+    except ValueError as ve:
+        print(f"Error: {ve}")
+        sys.exit(1)
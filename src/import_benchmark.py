@@ -0,0 +1,55 @@
+import argparse
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+# Import time benchmark of a checks-only run.
+# Fails (exit code 1) when importing the analysis takes longer than the startup budget,
+# or when one of the heavy dependencies is loaded by the import.
+
+src_path = Path(__file__).parent
+
+# Modules only needed for downloads, uploads, charts or the PDF
+heavy_modules = ['boto3', 'botocore', 'requests', 'matplotlib', 'seaborn', 'reportlab', 'missingno', 'tqdm', 'tkinter', 'ydata_profiling']
+
+check_code = f"""
+import sys, time
+start = time.perf_counter()
+import data_quality_analysis
+elapsed = time.perf_counter() - start
+loaded = [module for module in {heavy_modules!r} if module in sys.modules]
+print(elapsed, ','.join(loaded))
+"""
+
+def measure(runs):
+    # Every run is a new interpreter, so nothing is already imported
+    times = []
+    loaded = set()
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', check_code], cwd=src_path, capture_output=True, text=True, check=True).stdout.split()
+        times.append(float(output[0]))
+        if len(output) > 1:
+            loaded.update(output[1].split(','))
+    return times, sorted(loaded)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Import time benchmark of a checks-only run')
+    parser.add_argument('--budget', type=float, default=1.0, help='Maximum median import time in seconds')
+    parser.add_argument('--runs', type=int, default=5, help='Number of interpreters started')
+    args = parser.parse_args()
+
+    times, loaded = measure(args.runs)
+    median = statistics.median(times)
+    print(f"Import of data_quality_analysis: median {median:.3f} s, min {min(times):.3f} s, max {max(times):.3f} s (budget {args.budget:.3f} s)")
+
+    failed = False
+    if loaded:
+        print(f"Heavy modules loaded by a checks-only run: {', '.join(loaded)}")
+        failed = True
+    if median > args.budget:
+        print(f"Startup budget exceeded by {median - args.budget:.3f} s")
+        failed = True
+
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,158 @@
+import argparse
+import sqlite3
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+# Persistent index of the identifiers of every dataset of the catalogue, to find the tracks and albums
+# that appear in several artist files (features, compilations, re-records) and the references to
+# tracks that don't exist. The index is a SQLite B-tree on disk: every lookup takes logarithmic
+# time and only one batch of keys is in memory, however large the catalogue grows.
+
+base = Path(__file__).parent.parent
+key_index_path = base / 'output' / 'key_index.db'
+# Identifier columns of the index
+index_keys = ['track_id', 'album_id', 'audio_features.id']
+# Columns that reference an identifier: column -> referenced identifier
+key_references = {'audio_features.id': 'track_id'}
+
+schema = """
+CREATE TABLE IF NOT EXISTS keys (
+    key_type TEXT NOT NULL,
+    key TEXT NOT NULL,
+    dataset TEXT NOT NULL,
+    row INTEGER NOT NULL,
+    PRIMARY KEY (key_type, key, dataset)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS keys_dataset ON keys (dataset);
+"""
+
+
+def connect(path=None):
+    path = Path(path or key_index_path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    connection = sqlite3.connect(path, timeout=30)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.executescript(schema)
+    return connection
+
+def dataset_keys(df, column):
+    # Distinct keys of a column and the first row where each one appears
+    values = df[column].dropna().astype(str)
+    values = values[~values.duplicated()]
+    return zip(values.tolist(), values.index.tolist())
+
+def index_dataset(df, dataset, path=None, batch_size=50000):
+    """Add (or replace) the keys of a dataset in the index
+
+    :param df: Dataset
+    :param dataset: Name of the dataset in the index
+    :param path: Index database. If not specified then key_index_path is used
+    :return: Number of keys stored
+    """
+    connection = connect(path)
+    stored = 0
+    with connection:
+        connection.execute('DELETE FROM keys WHERE dataset = ?', (dataset,))
+        for column in index_keys:
+            if column not in df.columns:
+                continue
+            batch = []
+            for key, row in dataset_keys(df, column):
+                batch.append((column, key, dataset, int(row)))
+                if len(batch) >= batch_size:
+                    connection.executemany('INSERT INTO keys VALUES (?, ?, ?, ?)', batch)
+                    stored += len(batch)
+                    batch = []
+            connection.executemany('INSERT INTO keys VALUES (?, ?, ?, ?)', batch)
+            stored += len(batch)
+    connection.close()
+    return stored
+
+def lookup_batches(connection, key_type, keys, batch_size):
+    # Keys are looked up in batches through a temporary table joined with the index
+    connection.execute('CREATE TEMP TABLE IF NOT EXISTS lookup (key TEXT PRIMARY KEY, row INTEGER)')
+    batch = []
+    for item in keys:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield from lookup_batch(connection, key_type, batch)
+            batch = []
+    if batch:
+        yield from lookup_batch(connection, key_type, batch)
+
+def lookup_batch(connection, key_type, batch):
+    connection.execute('DELETE FROM lookup')
+    connection.executemany('INSERT INTO lookup VALUES (?, ?)', batch)
+    return connection.execute(
+        """SELECT lookup.key, lookup.row, keys.dataset, keys.row
+           FROM lookup JOIN keys ON keys.key_type = ? AND keys.key = lookup.key""",
+        (key_type,)).fetchall()
+
+def cross_dataset_duplicates(df, dataset, path=None, batch_size=5000):
+    """Keys of the dataset that already exist in other datasets of the index
+
+    :param df: Dataset
+    :param dataset: Name of the dataset, its own entries in the index are ignored
+    :param path: Index database. If not specified then key_index_path is used
+    :return: Dataframe with the key column, key, row and the other dataset and row where it appears
+    """
+    connection = connect(path)
+    found = []
+    for column in index_keys:
+        if column not in df.columns:
+            continue
+        for key, row, other, other_row in lookup_batches(connection, column, dataset_keys(df, column), batch_size):
+            if other != dataset:
+                found.append((column, key, row, other, other_row))
+    connection.close()
+    return pd.DataFrame(found, columns=['column', 'key', 'row', 'other_dataset', 'other_row'])
+
+def dangling_references(df, dataset, path=None, batch_size=5000):
+    """Values of the reference columns that don't exist in the dataset nor in any dataset of the index
+
+    :return: Dataframe with the reference column, value and first row where it appears
+    """
+    connection = connect(path)
+    found = []
+    for column, referenced in key_references.items():
+        if column not in df.columns:
+            continue
+        # References resolved inside the dataset don't need a lookup
+        local = set(df[referenced].dropna().astype(str)) if referenced in df.columns else set()
+        pending = [(key, row) for key, row in dataset_keys(df, column) if key not in local]
+        resolved = {key for key, row, other, other_row in lookup_batches(connection, referenced, pending, batch_size)}
+        found += [(column, key, row) for key, row in pending if key not in resolved]
+    connection.close()
+    return pd.DataFrame(found, columns=['column', 'value', 'row'])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Index of the identifiers of the catalogue, and checks across datasets')
+    parser.add_argument('action', choices=['add', 'check'], help='add: store the keys of the dataset, check: look for cross-dataset duplicates and dangling references')
+    parser.add_argument('source', help='Path of the csv file')
+    parser.add_argument('--name', help='Name of the dataset in the index (default: file name)')
+    parser.add_argument('--index', help='Index database')
+    args = parser.parse_args()
+
+    name = args.name or Path(args.source).name
+    try:
+        df = pd.read_csv(args.source)
+        if args.action == 'add':
+            stored = index_dataset(df, name, args.index)
+            print(f"{stored} keys of {name} stored in the index")
+        else:
+            duplicates = cross_dataset_duplicates(df, name, args.index)
+            dangling = dangling_references(df, name, args.index)
+            for column, group in duplicates.groupby('column'):
+                print(f"{column}: {group['key'].nunique()} keys also in {', '.join(sorted(group['other_dataset'].unique()))}")
+            for column, group in dangling.groupby('column'):
+                print(f"{column}: {len(group)} values without a {key_references[column]}")
+            if duplicates.empty and dangling.empty:
+                print(f"No cross-dataset duplicates or dangling references in {name}")
+            else:
+                sys.exit(1)
+    except (OSError, ValueError, sqlite3.Error) as e:
+        print(f"Error: {e}")
+        sys.exit(2)
@@ -0,0 +1,294 @@
+import argparse
+import multiprocessing
+import os
+import re
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from data_quality_analysis import *
+
+# Partitioned execution of the quality checks for datasets too large for one pandas dataframe.
+# The coordinator writes the dataset once as an uncompressed Arrow file, one record batch per
+# partition of rows. Every worker process memory maps the file, so the partitions are read from
+# the page cache without being copied between processes, and returns partial results that the
+# coordinator merges: anomaly counts of every rule, null counts, row hashes for the duplicates
+# and HyperLogLog sketches of the distinct values of every column.
+
+base = Path(__file__).parent.parent
+partitions_dir = base / '.cache' / 'partitions'
+# Registers of the HyperLogLog sketches are 2 ** hll_precision, the error is about 1.04 / sqrt(2 ** hll_precision)
+hll_precision = 12
+
+
+def hll_registers(values, precision=hll_precision):
+    # HyperLogLog sketch of the non null values of a column
+    registers = np.zeros(2 ** precision, dtype=np.uint8)
+    values = values[values.notna()]
+    if values.empty:
+        return registers
+    hashes = pd.util.hash_array(values.to_numpy())
+    index = (hashes >> np.uint64(64 - precision)).astype(np.int64)
+    rest = hashes << np.uint64(precision)
+    # Position of the first set bit of the remaining bits (bit length from the float exponent)
+    bit_length = np.frexp(rest.astype(np.float64))[1]
+    rank = np.where(rest == 0, 64 - precision + 1, 64 - bit_length + 1).astype(np.uint8)
+    np.maximum.at(registers, index, rank)
+    return registers
+
+def hll_estimate(registers):
+    m = len(registers)
+    alpha = 0.7213 / (1 + 1.079 / m)
+    estimate = alpha * m * m / np.sum(2.0 ** -registers.astype(np.float64))
+    zeros = np.count_nonzero(registers == 0)
+    # Linear counting for small cardinalities
+    if estimate <= 2.5 * m and zeros:
+        estimate = m * np.log(m / zeros)
+    return int(round(estimate))
+
+
+## Coordinator
+# Values read as missing by pandas.read_csv
+pandas_na_values = ['', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+                    '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null']
+
+def text_dates(batch):
+    import pyarrow as pa
+
+    # Dates are checked as text by the accuracy rules
+    dates = [pa.types.is_date(field.type) or pa.types.is_timestamp(field.type) for field in batch.schema]
+    if not any(dates):
+        return batch
+    columns = [column.cast(pa.string()) if date else column for column, date in zip(batch.columns, dates)]
+    return pa.RecordBatch.from_arrays(columns, names=batch.schema.names)
+
+class ColumnTypeChanged(Exception):
+    # A csv column has a value of another type than the one inferred from the first block
+    def __init__(self, column, column_type):
+        super().__init__(f'{column} has values that are not {column_type}')
+        self.column = column
+        self.column_type = column_type
+
+def wider_type(column_type):
+    # Type a column is read with after a value of another type: integers can still be floats, as
+    # pandas reads them, anything else is read as text
+    import pyarrow as pa
+
+    return pa.float64() if pa.types.is_integer(column_type) else pa.string()
+
+def source_batches(source, partition_rows, block_size, column_types=None):
+    # Record batches of the source, a csv file is parsed a block at a time
+    import pyarrow as pa
+    import pyarrow.csv as pv
+
+    if isinstance(source, pd.DataFrame):
+        schema = pa.Schema.from_pandas(source, preserve_index=False)
+        for start in range(0, source.shape[0], partition_rows):
+            yield pa.RecordBatch.from_pandas(source.iloc[start:start + partition_rows], schema=schema, preserve_index=False)
+        return
+
+    # The missing values and text timestamps of pandas.read_csv. The column types are inferred from
+    # the first block of the file, except the ones in column_types
+    read_options = pv.ReadOptions(block_size=block_size)
+    convert_options = pv.ConvertOptions(timestamp_parsers=[], strings_can_be_null=True, null_values=pandas_na_values,
+                                        column_types=column_types or {})
+    # The file is read through a python file object: arrow files read ahead far more than one block
+    with open(source, 'rb') as raw:
+        stream = pa.CompressedInputStream(raw, 'gzip') if str(source).endswith('.gz') else raw
+        with pv.open_csv(stream, read_options=read_options, convert_options=convert_options) as reader:
+            try:
+                yield from reader
+            except pa.ArrowInvalid as e:
+                match = re.search(r'CSV column #(\d+)', str(e))
+                if match is None:
+                    raise ValueError(f'{source}: {e}')
+                field = reader.schema.field(int(match.group(1)))
+                raise ColumnTypeChanged(field.name, field.type)
+
+def write_partitions(source, path, partition_rows=1000000, block_size=16 * 1024 * 1024):
+    """Write the dataset as an Arrow file with one record batch per partition
+
+    The source is read and written a batch at a time, so the coordinator holds about one partition
+    in memory however large the dataset is. A csv column with a value of another type than the one
+    inferred from the first block is read with a wider type, and the file is written again.
+
+    :param source: Path of a csv file, or a dataframe
+    :param path: Arrow file to write
+    :param partition_rows: Rows of each partition
+    :param block_size: Bytes of the csv parsed at a time
+    :return: Number of partitions
+    """
+    column_types = {}
+    while True:
+        try:
+            return write_batches(source_batches(source, partition_rows, block_size, column_types), path, partition_rows)
+        except ColumnTypeChanged as e:
+            column_types[e.column] = wider_type(e.column_type)
+
+def write_batches(batches, path, partition_rows):
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    writer = None
+    partitions = 0
+    pending, pending_rows = [], 0
+    try:
+        for batch in batches:
+            batch = text_dates(batch)
+            if writer is None:
+                writer = ipc.new_file(path, batch.schema)
+            pending.append(batch)
+            pending_rows += batch.num_rows
+            # Blocks of the csv don't match the partitions, they are regrouped in batches of partition_rows
+            while pending_rows >= partition_rows:
+                table = pa.Table.from_batches(pending)
+                writer.write_batch(table.slice(0, partition_rows).combine_chunks().to_batches()[0])
+                partitions += 1
+                pending = table.slice(partition_rows).to_batches()
+                pending_rows -= partition_rows
+        if pending_rows:
+            writer.write_batch(pa.Table.from_batches(pending).combine_chunks().to_batches()[0])
+            partitions += 1
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is None:
+        raise ValueError('The dataset has no rows')
+    return partitions
+
+def merge_partials(partials, columns):
+    rules = quality_rules()
+    counts = {}
+    for partial in partials:
+        for rule, count in partial['counts'].items():
+            counts[rule] = rules[rule][3]([counts[rule], count]) if rule in counts else count
+
+    rows = sum(partial['rows'] for partial in partials)
+    missing = np.sum([partial['missing'] for partial in partials], axis=0)
+    hashes = np.concatenate([partial['hashes'] for partial in partials])
+    duplicate_rows = len(hashes) - len(np.unique(hashes))
+    registers = np.max([partial['registers'] for partial in partials], axis=0)
+    distinct = {column: hll_estimate(registers[i]) for i, column in enumerate(columns)}
+
+    return counts, rows, missing, duplicate_rows, distinct
+
+def partitioned_analysis(source, workers=None, partition_rows=1000000, directory=None):
+    """Anomalies and overview statistics of a dataset computed by a pool of worker processes
+
+    :param source: Path of a csv file, or a dataframe
+    :param workers: Worker processes. If not specified then one per CPU
+    :param partition_rows: Rows of each partition
+    :param directory: Folder of the partitions file. If not specified then partitions_dir is used
+    :return: Dictionary with the 'overview' statistics, the 'anomalies' (as anomalies_data) and the 'counts' of every rule
+    """
+    import pyarrow.ipc as ipc
+
+    path = Path(directory or partitions_dir) / f'{os.getpid()}.arrow'
+    try:
+        partitions = write_partitions(source, path, partition_rows)
+        with ipc.open_file(path) as reader:
+            schema = reader.schema
+        dtypes = schema.empty_table().to_pandas().dtypes
+        columns = list(schema.names)
+
+        workers = min(workers or os.cpu_count(), partitions)
+        if workers > 1:
+            with multiprocessing.Pool(workers, initializer=open_partitions, initargs=(str(path),)) as pool:
+                partials = pool.map(partition_partials, range(partitions))
+        else:
+            open_partitions(str(path))
+            partials = [partition_partials(i) for i in range(partitions)]
+    finally:
+        close_partitions()
+        if path.exists():
+            path.unlink()
+
+    counts, rows, missing, duplicate_rows, distinct = merge_partials(partials, columns)
+    cols = len(columns)
+    all_data = rows * cols
+
+    # Same statistics of overview(), the distinct values are estimated
+    unique_values = {
+        'num_types': [[column, distinct[column]] for column in columns if dtypes[column] in ('int64', 'float64')] or [['Sin valores', '']],
+        'str_types': [[column, distinct[column]] for column in columns if dtypes[column] == object] or [['Sin valores', '']],
+        'date_types': [['Sin valores', '']],
+    }
+    data_o = {
+        'numerics': int(sum(dtype in ('int64', 'float64') for dtype in dtypes)),
+        'strings': int(sum(dtype == object for dtype in dtypes)),
+        'date_time': 0,
+        'total_missing_values': int(missing.sum()),
+        'missing_values': dict(zip(columns, missing.tolist())),
+        'total_missing_values_percentage': missing.sum() / all_data * 100 if all_data else 0,
+        'duplicate_rows': int(duplicate_rows),
+        'duplicate_rows_percentage': duplicate_rows / rows * 100 if rows else 0,
+        'rows': rows,
+        'cols': cols,
+        'all': all_data,
+    } | unique_values
+
+    validity = sum(count for rule, count in counts.items() if quality_rules()[rule][0] == 'Validez')
+    accuracy = sum(count for rule, count in counts.items() if quality_rules()[rule][0] == 'Precisión')
+    anomalies = {'Completitud': data_o['total_missing_values'], 'Unicidad': data_o['duplicate_rows'], 'Validez': validity, 'Precisión': accuracy, 'Coherencia': 0, 'Temporalidad': 0}
+    anomalies['Total'] = sum(anomalies.values())
+
+    return {'overview': data_o, 'anomalies': anomalies, 'counts': counts}
+
+
+## Workers
+# Memory mapped partitions file of the worker process
+_reader = None
+
+def open_partitions(path):
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+
+    global _reader
+    _reader = ipc.open_file(pa.memory_map(path, 'r'))
+
+def close_partitions():
+    global _reader
+    _reader = None
+
+def partition_partials(index):
+    # Partial results of one partition, every one of them can be merged with the ones of other partitions
+    batch = _reader.get_batch(index)
+    df = batch.to_pandas()
+
+    counts = {rule: rule_count(test(df, *args)) for rule, (dimension, test, args, merge) in quality_rules().items()}
+    partial = {
+        'rows': df.shape[0],
+        'counts': counts,
+        'missing': df.isnull().sum().to_numpy(),
+        # Every partition has the same column types, so rows can be hashed without converting them to text
+        'hashes': pd.util.hash_pandas_object(df, index=False).to_numpy(),
+        'registers': np.stack([hll_registers(df[column]) for column in df.columns]),
+    }
+
+    return partial
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Quality checks of a large dataset in a pool of worker processes')
+    parser.add_argument('source', nargs='?', default=str(base / 'output' / 'dataset.csv'), help='Path of the csv file')
+    parser.add_argument('--workers', type=int, help='Worker processes (default: one per CPU)')
+    parser.add_argument('--partition-rows', type=int, default=1000000, help='Rows of each partition')
+    args = parser.parse_args()
+
+    try:
+        start = time.time()
+        result = partitioned_analysis(args.source, args.workers, args.partition_rows)
+        seconds = time.time() - start
+
+        data_o = result['overview']
+        print(f"{data_o['rows']} rows analyzed in {seconds:.2f} seconds")
+        for dimension, count in result['anomalies'].items():
+            print(f"{dimension:<15}{count:>12}")
+
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
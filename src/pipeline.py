@@ -0,0 +1,200 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from pathlib import Path
+
+import pandas as pd
+
+import run_history
+import utils_io
+import spotify_data_processing as processing
+
+# The processing script, the PDF report and the profiling report run in one process.
+# The dataset is read once and shared by every stage instead of being uploaded and
+# downloaded again by each script, and stages whose inputs didn't change are skipped.
+
+base = Path(__file__).parent.parent
+# Fingerprint of the inputs of the last successful run of every stage
+pipeline_state_path = base / '.cache' / 'pipeline' / 'state.json'
+bucket = 'dataqualitychallenge'
+# Every stage reads and writes in the repository folder, whatever the working directory is
+csv_path = base / 'output' / processing.csv_name
+parquet_path = base / 'output' / 'dataset'
+report_path = base / 'output' / 'doc' / 'data_quality_report.pdf'
+profiling_path = base / 'output' / 'doc' / 'profilling_report.html'
+
+
+def load_state(path):
+    if not path.exists():
+        return {}
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_state(path, state):
+    # Write to a temporary file first so a crash never leaves a broken state
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix('.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=1)
+    os.replace(tmp_path, path)
+
+def value_fingerprint(value):
+    if isinstance(value, pd.DataFrame):
+        return utils_io.df_fingerprint(value)
+    # Files generated by a stage are described by their content, not by their path
+    if isinstance(value, Path):
+        return utils_io.file_fingerprint(value)
+    return utils_io.object_fingerprint(value)
+
+def read_dataset():
+    # The csv is memory mapped, and read with the same types the other scripts get from get_dataset
+    return pd.read_csv(csv_path, memory_map=True)
+
+
+## Stages
+def source_stage():
+    # Path of the downloaded json, named by the hash of its content
+    return utils_io.drive_download(processing.json_link)
+
+def dataset_stage(json_path):
+    with open(json_path, encoding='utf-8') as f:
+        data = json.load(f)
+    processing.save_dataset(processing.normalize_dataset(data), csv_path, parquet_path)
+    return read_dataset()
+
+def report_stage(dataset):
+    from report_generator import DataProfilingPDF
+
+    start = time.time()
+    report = DataProfilingPDF(dataset=dataset, path=str(report_path))
+    run_history.record_run(report.results_document(time.time() - start), fingerprint=utils_io.df_fingerprint(dataset))
+    return report_path
+
+def profiling_stage(dataset):
+    from extra_profiling_report import profiling_report
+
+    profiling_path.parent.mkdir(parents=True, exist_ok=True)
+    report, profile = profiling_report(dataset)
+    profiling_path.write_text(report, encoding='utf-8')
+    return profiling_path
+
+# Upload stages fail when the upload fails, so they are not recorded as done and run again next time
+def upload_dataset_stage(dataset):
+    if not processing.upload_dataset(dataset):
+        raise RuntimeError(f"{processing.csv_name} was not uploaded")
+    return True
+
+def upload_stage(object_name):
+    def upload(path):
+        if not utils_io.upload_file(path, bucket, object_name):
+            raise RuntimeError(f"{object_name} was not uploaded")
+        return True
+    return upload
+
+def pipeline_stages(upload=True):
+    # name -> (function, dependencies, outputs, load)
+    # A stage is skipped when the fingerprints of its dependencies match the last run and its outputs
+    # exist, load() then gives the value of the stage to the stages that depend on it
+    stages = {
+        'source': (source_stage, [], [], None),
+        'dataset': (dataset_stage, ['source'], [csv_path, parquet_path], read_dataset),
+        'report': (report_stage, ['dataset'], [report_path], None),
+        'profiling': (profiling_stage, ['dataset'], [profiling_path], None),
+    }
+    # Uploads are stages of their own, a run without them doesn't mark the artifacts as uploaded
+    if upload:
+        stages['upload_dataset'] = (upload_dataset_stage, ['dataset'], [], None)
+        stages['upload_report'] = (upload_stage('data_quality_report.pdf'), ['report'], [], None)
+        stages['upload_profiling'] = (upload_stage('profilling_report.html'), ['profiling'], [], None)
+
+    return stages
+
+
+def run_stage(name, stage, values, fingerprints, state, force):
+    function, dependencies, outputs, load = stage
+    key = utils_io.object_fingerprint([name] + [fingerprints[dependency] for dependency in dependencies])
+
+    # Stages without dependencies always run, they are the ones that check the external inputs
+    if dependencies and not force and state.get(name) == key and all(os.path.exists(output) for output in outputs):
+        if load is not None:
+            value = load()
+        elif outputs:
+            value = Path(outputs[0]) if len(outputs) == 1 else [Path(output) for output in outputs]
+        else:
+            value = True
+        # A single write, so the lines of stages running at the same time are not mixed
+        print(f"Skipped: {name} (unchanged)\n", end='')
+    else:
+        start = time.time()
+        value = function(*[values[dependency] for dependency in dependencies])
+        print(f"Finished: {name} in {time.time() - start:.2f} seconds\n", end='')
+
+    return value, value_fingerprint(value), key
+
+def run_pipeline(stages, force=False, max_workers=None, state_path=None):
+    """Run the stages in the order of their dependencies, independent stages at the same time
+
+    :param stages: Dictionary of stage names and their (function, dependencies, outputs, load) tuples
+    :param force: Run every stage even if its inputs didn't change
+    :param max_workers: Threads of the pool
+    :param state_path: File with the fingerprints of the last run. If not specified then pipeline_state_path is used
+    :return: Values of the finished stages, and the names of the failed ones
+    """
+    state_path = Path(state_path or pipeline_state_path)
+    state = load_state(state_path)
+    values, fingerprints, failed = {}, {}, set()
+    pending = dict(stages)
+    running = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while pending or running:
+            for name, stage in list(pending.items()):
+                dependencies = stage[1]
+                # Stages that depend on a failed stage are not run
+                if any(dependency in failed for dependency in dependencies):
+                    print(f"Not run: {name} (a dependency failed)")
+                    failed.add(name)
+                    del pending[name]
+                elif all(dependency in values for dependency in dependencies):
+                    running[executor.submit(run_stage, name, stage, values, fingerprints, state, force)] = name
+                    del pending[name]
+            if not running:
+                # The remaining stages depend on stages that don't exist
+                failed.update(pending)
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    values[name], fingerprints[name], state[name] = future.result()
+                except Exception as e:
+                    print(f"Error in {name}: {e}\n", end='')
+                    failed.add(name)
+                    state.pop(name, None)
+
+    save_state(state_path, state)
+
+    return values, failed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Dataset processing, PDF report and profiling report in one process')
+    parser.add_argument('--force', action='store_true', help='Run every stage even if its inputs did not change')
+    parser.add_argument('--no-upload', action='store_true', help='Do not upload the results to S3')
+    parser.add_argument('--workers', type=int, help='Stages that can run at the same time')
+    args = parser.parse_args()
+
+    start = time.time()
+    values, failed = run_pipeline(pipeline_stages(upload=not args.no_upload), args.force, args.workers)
+    print(f"Pipeline finished in {time.time() - start:.2f} seconds")
+
+    if failed:
+        print(f"Failed stages: {', '.join(sorted(failed))}")
+        sys.exit(1)
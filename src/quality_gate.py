@@ -0,0 +1,243 @@
+import argparse
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from data_quality_analysis import *
+import run_history
+import utils_io
+
+# Fail-fast version of the quality checks for an ingest gate. Only the checks that have a threshold
+# are run, the cheapest and most likely to fail first, and the dataset is read in chunks that stop
+# as soon as a threshold is certainly exceeded. Counts only grow from one chunk to the next, so a
+# count over its limit (or over the limit for the largest possible number of rows) can't go back.
+
+base = Path(__file__).parent.parent
+
+# Relative cost per row of each test, vectorized comparisons are cheap and python functions
+# applied to every value are expensive
+gate_costs = {
+    column_type_is_not_numeric: 0,
+    column_has_null_values: 1,
+    column_has_values_outside_range: 2,
+    column_has_incorrect_boolean_values: 2,
+    column_has_incorrect_numeric_values: 4,
+    column_cant_be_converted_to_numeric: 10,
+    column_has_incorrect_text_format: 15,
+    column_has_bad_encoding: 20,
+}
+# Units of the dimensions that are not made of rules
+missing_cost = 5
+duplicates_cost = 25
+
+
+def parse_threshold(value):
+    # '5%' is a percentage (of the rows for a rule, of the cells for a dimension), '10' a number of anomalies
+    value = str(value).strip()
+    if value.endswith('%'):
+        return float(value[:-1]), True
+    return float(value), False
+
+def csv_row_bound(path, block_size=16 * 1024 * 1024):
+    # Largest possible number of rows of a csv file: its lines minus the header. Quoted line breaks
+    # only make the real number smaller, so it is a safe bound for percentage thresholds
+    lines = 0
+    last = b''
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            lines += block.count(b'\n')
+            last = block[-1:]
+    if last and last != b'\n':
+        lines += 1
+    return max(lines - 1, 0)
+
+def source_chunks(source, chunk_rows=50000):
+    """Chunks of a dataset and the largest possible number of rows, if it is known
+
+    :param source: Path of a csv or parquet file, or a method of get_dataset_chunks ('s3', 'url' or 'local')
+    :return: Iterator of dataframes, and the bound of the rows (None if unknown)
+    """
+    if source in ('s3', 'url', 'local'):
+        return utils_io.get_dataset_chunks(source, chunk_rows), None
+    if source.endswith('.parquet'):
+        import pyarrow.parquet as pq
+
+        parquet_file = pq.ParquetFile(source)
+        batches = parquet_file.iter_batches(batch_size=chunk_rows)
+        return (batch.to_pandas() for batch in batches), parquet_file.metadata.num_rows
+    bound = csv_row_bound(source) if not source.endswith('.gz') else None
+    return pd.read_csv(source, chunksize=chunk_rows), bound
+
+
+class QualityGate():
+    """Thresholds of rules (see quality_rules) and dimensions checked with fail-fast evaluation
+
+    :param thresholds: Dictionary of rule or dimension names and their limits, a number of anomalies or a percentage ('5%')
+    :param history: Run history used to estimate how likely each check is to fail. If not specified then the
+                    default history is used when it exists
+    :param dataset: Name of the dataset in the run history
+    """
+
+    def __init__(self, thresholds, history=None, dataset='dataset.csv'):
+        self.rules = quality_rules()
+        dimensions = {dimension for dimension, test, args, merge in self.rules.values()} | {'Completitud', 'Unicidad'}
+        unknown = [name for name in thresholds if name not in self.rules and name not in dimensions]
+        if unknown:
+            raise ValueError(f"Unknown rules or dimensions: {', '.join(unknown)}")
+        self.thresholds = {name: parse_threshold(value) for name, value in thresholds.items()}
+
+        # Units of evaluation needed by every threshold: rule names, 'missing' and 'duplicates'
+        self.units = {}
+        for name in self.thresholds:
+            if name in self.rules:
+                self.units[name] = [name]
+            elif name == 'Completitud':
+                self.units[name] = ['missing']
+            elif name == 'Unicidad':
+                self.units[name] = ['duplicates']
+            else:
+                self.units[name] = [rule for rule, (dimension, *_) in self.rules.items() if dimension == name]
+        self.order = self.evaluation_order(history, dataset)
+
+    def unit_cost(self, unit):
+        if unit == 'missing':
+            return missing_cost
+        if unit == 'duplicates':
+            return duplicates_cost
+        return gate_costs.get(self.rules[unit][1], 10)
+
+    def evaluation_order(self, history, dataset):
+        # Fraction of its limit that every threshold used in the previous runs, checks that were close
+        # to their limit (or over it) are the most likely to reject the delivery
+        pressure = {}
+        history = Path(history or run_history.history_path)
+        if history.exists():
+            for name, (limit, percentage) in self.thresholds.items():
+                values = [row[1] if percentage else row[0] for row in self.history_values(history, dataset, name)]
+                if values and limit > 0:
+                    pressure[name] = statistics.median(values) / limit
+                elif values:
+                    pressure[name] = 1.0 if statistics.median(values) > 0 else 0.0
+
+        # Units sorted by cost over the likelihood of failing, the cheapest and most selective first
+        score = {}
+        for name, units in self.units.items():
+            for unit in units:
+                likelihood = pressure.get(name, 0.0) + 0.01
+                score[unit] = min(score.get(unit, float('inf')), self.unit_cost(unit) / likelihood)
+        return sorted(score, key=lambda unit: (score[unit], unit))
+
+    def history_values(self, history, dataset, name):
+        # Counts and percentages of the last runs, the percentage of a rule is over the rows
+        connection = run_history.connect(history)
+        rows = connection.execute(
+            'SELECT count, percentage FROM checks WHERE dataset = ? AND check_name = ? ORDER BY timestamp DESC LIMIT 30',
+            (dataset, name)).fetchall()
+        connection.close()
+        return rows
+
+    def exceeded(self, name, counts, rows, cols):
+        # Threshold certainly exceeded with the counts so far. Percentages are compared with the largest
+        # possible number of rows (or cells) until the end of the dataset
+        limit, percentage = self.thresholds[name]
+        count = sum(counts[unit] for unit in self.units[name] if unit in counts)
+        if not percentage:
+            return count > limit, count
+        if rows is None:
+            return False, count
+        total = rows * cols if name not in self.rules else rows
+        return total > 0 and count / total * 100 > limit, count
+
+    def check(self, chunks, row_bound=None):
+        """Evaluate the thresholds over the chunks of a dataset, stopping at the first one exceeded
+
+        :param chunks: Iterator of dataframes
+        :param row_bound: Largest possible number of rows of the dataset, if known
+        :return: Dictionary with 'passed', the 'failed' threshold, its 'count' and 'limit', and the 'rows' read
+        """
+        counts = {}
+        seen_rows = SeenRows()
+        rows = cols = 0
+        start = time.time()
+
+        for chunk in chunks:
+            rows += chunk.shape[0]
+            cols = chunk.shape[1]
+            bound = max(row_bound, rows) if row_bound is not None else None
+
+            for unit in self.order:
+                if unit == 'missing':
+                    count = int(chunk.isnull().sum().sum())
+                    counts[unit] = counts.get(unit, 0) + count
+                elif unit == 'duplicates':
+                    # Same row hashes as ChunkedAnalysis, they don't depend on the types inferred for each chunk.
+                    # Every row that is not the first occurrence of its hash is a duplicate
+                    counts[unit] = counts.get(unit, 0) + seen_rows.add(row_hashes(chunk))
+                else:
+                    dimension, test, args, merge = self.rules[unit]
+                    count = rule_count(test(chunk, *args))
+                    counts[unit] = merge([counts[unit], count]) if unit in counts else count
+
+                # Only the thresholds that use this unit can change
+                for name, units in self.units.items():
+                    if unit in units:
+                        exceeded, count = self.exceeded(name, counts, bound, cols)
+                        if exceeded:
+                            return self.result(False, name, count, rows, start)
+
+        # End of the dataset: the real number of rows is known
+        for name in self.thresholds:
+            exceeded, count = self.exceeded(name, counts, rows, cols)
+            if exceeded:
+                return self.result(False, name, count, rows, start)
+        return self.result(True, None, None, rows, start)
+
+    def result(self, passed, name, count, rows, start):
+        limit = None
+        if name is not None:
+            value, percentage = self.thresholds[name]
+            limit = f'{value:g}%' if percentage else f'{value:g}'
+        return {'passed': passed, 'failed': name, 'count': count, 'limit': limit, 'rows': rows, 'seconds': time.time() - start}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fail-fast quality gate with thresholds per rule or dimension')
+    parser.add_argument('source', nargs='?', default='local', help="Path of a csv or parquet file, or 's3', 'url' or 'local'")
+    parser.add_argument('--max', action='append', default=[], metavar='NAME=LIMIT',
+                        help="Limit of a rule or dimension, a number or a percentage: track_id_nulls=0, 'Precisión=5%%'")
+    parser.add_argument('--thresholds', help='JSON file with a dictionary of rule or dimension limits')
+    parser.add_argument('--chunk-rows', type=int, default=50000, help='Rows of each chunk')
+    args = parser.parse_args()
+
+    try:
+        thresholds = {}
+        if args.thresholds:
+            with open(args.thresholds, encoding='utf-8') as f:
+                thresholds = json.load(f)
+        for item in args.max:
+            name, _, limit = item.partition('=')
+            thresholds[name] = limit
+        if not thresholds:
+            raise ValueError('No thresholds, use --max or --thresholds')
+
+        gate = QualityGate(thresholds)
+        chunks, row_bound = source_chunks(args.source, args.chunk_rows)
+        result = gate.check(chunks, row_bound)
+
+        if result['passed']:
+            print(f"PASSED: {result['rows']} rows checked in {result['seconds']:.2f} seconds")
+        else:
+            print(f"FAILED: {result['failed']} has {result['count']} anomalies, limit {result['limit']} "
+                  f"(stopped after {result['rows']} rows, {result['seconds']:.2f} seconds)")
+            sys.exit(1)
+
+    except ValueError as ve:
+        print(f"Error: {ve}")
+        sys.exit(2)
@@ -1,11 +1,11 @@
+import copy
 import time
 import sys
 import locale
 from datetime import datetime, timedelta
 from pathlib import Path
-import tkinter as tk
-from tkinter.messagebox import showinfo
 from io import StringIO, BytesIO
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from reportlab.platypus import (SimpleDocTemplate, Paragraph, PageBreak, Image, Spacer, Table, TableStyle, KeepTogether)
 from reportlab.lib.enums import TA_LEFT, TA_CENTER, TA_RIGHT, TA_JUSTIFY
@@ -21,43 +21,45 @@ from tqdm import tqdm
 from colorama import just_fix_windows_console, Fore, Style
 
 from data_quality_analysis import *
+from headless_report import results_document
+import run_history
 import utils_io
-import missingno
 
 
 just_fix_windows_console()
 
 base = Path(__file__).parent.parent
-# StringIO buffer to capture error prints
-error_buffer = StringIO()
 
 # Set the locale to English
 locale.setlocale(locale.LC_ALL, 'es_ES.UTF-8')
 
 # Class for the header and footer of the canvas
+# The header and footer are drawn as each page is finished, the total of pages is unknown
+# at that point, so every footer references a form that is only filled in when the document is saved.
+# Memory per page stays constant instead of keeping a copy of the canvas state for every page
 class FooterCanvas(canvas.Canvas):
     
     def __init__(self, *args, **kwargs):
         canvas.Canvas.__init__(self, *args, **kwargs)
-        self.pages = []
         self.width, self.height = LETTER
 
     def showPage(self):
-        self.pages.append(dict(self.__dict__))
-        self._startPage()
+        if (self._pageNumber > 2):
+            self.draw_canvas()
+        canvas.Canvas.showPage(self)
 
     def save(self):
-        page_count = len(self.pages)
-        for page in self.pages:
-            self.__dict__.update(page)
-            # self.draw_canvas(page_count)
-            if (self._pageNumber > 2):
-                self.draw_canvas(page_count)
-            canvas.Canvas.showPage(self)
+        # Every page has been shown, the current page number is the one after the last page
+        page_count = self._pageNumber - 1
+        self.beginForm('pageCount')
+        self.setFontSize(9)
+        self.setFillColor(black)
+        self.drawString(0, 0, "%s" % page_count)
+        self.endForm()
         canvas.Canvas.save(self)
 
-    def draw_canvas(self, page_count):
-        page = "Página %s de %s" % (self._pageNumber, page_count)
+    def draw_canvas(self):
+        page = "Página %s de " % self._pageNumber
         x = 128
 
         self.saveState()
@@ -80,170 +82,284 @@ class FooterCanvas(canvas.Canvas):
         self.setStrokeColorRGB(0, 0, 0)
         self.setFillColor(black)
         self.drawString(LETTER[0] / 2.2, 45, page)
+        # The total of pages is drawn right after the text by the deferred form
+        self.translate(LETTER[0] / 2.2 + self.stringWidth(page), 45)
+        self.doForm('pageCount')
         self.restoreState()
 
+# List of flowables that is filled from a generator as the document consumes it.
+# SimpleDocTemplate.build takes the flowables from the front of the list and checks its length
+# before each one, so only a few flowables exist at any time
+class LazyFlowables(list):
+
+    def __init__(self, flowables, generator, low_water=8):
+        list.__init__(self, flowables)
+        self.generator = generator
+        self.low_water = low_water
+
+    def __len__(self):
+        while self.generator is not None and list.__len__(self) < self.low_water:
+            try:
+                self.append(next(self.generator))
+            except StopIteration:
+                self.generator = None
+        return list.__len__(self)
+
 # DataProfilingPDF class
 class DataProfilingPDF():
 
-    def __init__(self):
-        # Read the CSV file using the selected method
-        self.dataset = utils_io.get_dataset('url')
+    def __init__(self, appendix=False, dataset=None, path=None, context=None, section_cache=None, max_workers=None, chart_backend='png'):
+        # Read the CSV file using the selected method, unless the dataset is given
+        self.dataset = dataset if dataset is not None else utils_io.get_dataset('url')
 
         title = "data_quality_report"
-        # Directory to save the generated report
+        # Directory to save the generated report, the path can also be an in-memory file
         self.output_dir = base / 'output/doc/'
-        self.path = str(self.output_dir / f"{title}.pdf")
+        self.path = path if path is not None else str(self.output_dir / f"{title}.pdf")
 
         # Document properties and list of elements
         self.styleSheet = getSampleStyleSheet()
         self.justify_text = ParagraphStyle('BodyText', parent=self.styleSheet['BodyText'], alignment=TA_JUSTIFY)
         self.elements = []
         self.width, self.height = LETTER
+        # StringIO buffer to capture error prints, one per report so a long running process can build many
+        self.error_buffer = StringIO()
 
          # Standard plot size
         self.plot_width = 1.7 * inch
         self.plot_height = 1.7 * inch
 
-        self.anomalies = anomalies_data(self.dataset)
+        # Appendix with every anomalous row, laid out page by page while the document is built
+        self.appendix = appendix
+        self.appendix_page_rows = 40
+
+        # Statistics of every section, computed once before the sections are built
+        self.context = context if context is not None else report_context(self.dataset)
+        # Flowables of previous builds: section -> (fingerprint of its inputs, flowables)
+        self.section_cache = section_cache
+        self.anomalies = self.context['anomalies']
+        # Charts are rendered by matplotlib as PNG images ('png'), or the pies and donuts
+        # are drawn as native PDF graphics ('vector')
+        self.chart_backend = chart_backend
+        self.chart_kinds = self.chart_specs()
+        images = self.chart_kinds
+        if chart_backend == 'vector':
+            images = {name: chart for name, chart in images.items() if chart[0] not in utils_io.vector_chart_functions}
+        # Every PNG chart of the report, rendered at the same time or read from the cache
+        self.charts = utils_io.render_charts(images)
              
         def build_report():
             # Template on which the report will be generated
             self.doc = SimpleDocTemplate(self.path, pagesize=LETTER, leftMargin=0.7 * inch, title=title)
-            self.doc.build(self.elements, canvasmaker=FooterCanvas)
+            flowables = LazyFlowables(self.elements, self.appendix_flowables()) if self.appendix else self.elements
+            self.doc.build(flowables, canvasmaker=FooterCanvas)
 
         # Dictionary of processes, the order defines the position in which they will be presented in the report.
-        # Important: build_report must always be at the end
+        # Each section lists the keys of the context it is built from
         processes = {
-            "First Page": self.firstPage,
-            "Table of contents": self.secondPage,
-            "Sources Report": self.sources,
-            "Regards": self.regards,
-            "Data Overview ": self.overview,
-            "Scores": self.scores,
-            "Unique Value Analysis": self.graph_overview,
-            "Nullity Matrix": self.nullity,
-            # "Examples": self.examples,
-            "Create Report": build_report,
+            "First Page": (self.firstPage, []),
+            "Table of contents": (self.secondPage, []),
+            "Sources Report": (self.sources, ['sources']),
+            "Regards": (self.regards, ['regards']),
+            "Data Overview ": (self.overview, ['overview', 'stats', 'anomalies', 'near_duplicates']),
+            "Scores": (self.scores, ['overview', 'anomalies']),
+            "Unique Value Analysis": (self.graph_overview, ['overview']),
+            "Nullity Matrix": (self.nullity, ['nullity']),
+            # "Examples": (self.examples, []),
         }
 
-        # Progress bar and script execution
-        for key, process in tqdm(processes.items(), desc="Total Progress", position=0):
-            tqdm.write(f"\rProcessing: {key} ...")
-            process()
+        # The sections are independent until the document is built, they run at the same time and
+        # their flowables are collected in the declared order. build_report is always at the end
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {key: executor.submit(self.run_section, key, process, inputs) for key, (process, inputs) in processes.items()}
+            # Progress bar of the finished sections
+            with tqdm(total=len(futures), desc="Total Progress", position=0) as progress:
+                for future in as_completed(futures.values()):
+                    progress.update(1)
+            for key, future in futures.items():
+                self.elements.extend(future.result())
+        tqdm.write("\rProcessing: Create Report ...")
+        build_report()
 
         # List of errors found
-        error_buffer.seek(0)
+        self.error_buffer.seek(0)
         print(f"{Fore.RED}\nErrors:{Style.RESET_ALL}")
-        print(f"{Fore.RED}{error_buffer.read()}{Style.RESET_ALL}")
-        error_buffer.close()
+        print(f"{Fore.RED}{self.error_buffer.read()}{Style.RESET_ALL}")
+        self.error_buffer.close()
+
+
+    # Flowables of a section, a failing section is left out of the report and its error captured
+    def run_section(self, key, process, inputs):
+        tqdm.write(f"\rProcessing: {key} ...")
+        try:
+            return self.build_section(key, process, inputs)
+        except Exception as e:
+            self.error_buffer.write(f"{key}: {type(e).__name__}: {e}\n")
+            return []
+
+    # Flowables of a section, reused from a previous build when its inputs didn't change
+    def build_section(self, key, process, inputs):
+        if self.section_cache is None:
+            return process()
+
+        fingerprint = utils_io.object_fingerprint([self.appendix, self.chart_backend] + [self.context[name] for name in inputs])
+        cached = self.section_cache.get(key)
+        if cached is None or cached[0] != fingerprint:
+            cached = (fingerprint, process())
+            self.section_cache[key] = cached
+        # The document modifies the flowables while it lays them out, every build gets its own copy
+        return copy.deepcopy(cached[1])
+
+    # Results document of the report statistics, as the one of headless_report.py
+    def results_document(self, seconds=None):
+        context = self.context
+        document = results_document(context['overview'], context['results'], context['anomalies'], context['stats'], near_duplicates=context['near_duplicates'], multivariate_outliers=context['multivariate_outliers'])
+        document['seconds'] = seconds
+        return document
+
+    # Charts of the report: name -> (kind, *plot arguments)
+    def chart_specs(self):
+        stats = self.context['stats']
+        all_data = self.context['overview']['all']
+        categories = {key: value for key, value in self.anomalies.items() if value > 0 and key != 'Total'}
+
+        charts = {
+            'summary': ('pie', [stats['good'], stats['notAnalyzed'], stats['analyzed']], "Resumen de análisis", ["Datos buenos", "Datos no analizados", "Datos anomalías"]),
+            'anomaly_types': ('pie', list(categories.values()), "Tipos de anomalías", list(categories.keys())),
+        }
+        for key, value in categories.items():
+            charts[f'score_{key}'] = ('donut', [all_data, value], key)
+
+        nullity = self.context['nullity']
+        charts['nullity'] = ('nullity', nullity['density'], nullity['columns'], nullity['rows'])
+
+        return charts
 
+    # Flowable of a chart with the selected backend
+    def chart(self, name, width, height):
+        kind, *args = self.chart_kinds[name]
+        if self.chart_backend == 'vector' and kind in utils_io.vector_chart_functions:
+            return utils_io.vector_chart_functions[kind](*args, width, height)
+        return Image(self.charts[name], width=width, height=height)
 
     # Portada
     def firstPage(self):
+        elements = []
+
         spacer = Spacer(30, 100)
-        self.elements.append(spacer)
+        elements.append(spacer)
 
         psHeaderText = ParagraphStyle('Hed0', fontSize=22, alignment=TA_CENTER, borderWidth=3, textColor=black)
         text = 'Informe Calidad de Datos'
         # Flowable element for the title
         paragraphReportHeader = Paragraph(text, psHeaderText)
-        self.elements.append(paragraphReportHeader)
+        elements.append(paragraphReportHeader)
 
         spacer = Spacer(30, 450)
-        self.elements.append(spacer)
+        elements.append(spacer)
 
         psDetalle = ParagraphStyle('Resumen', fontSize=16, leading=14, justifyBreaks=1, alignment=TA_CENTER, justifyLastLine=1)
         text = f"""
         Grupo R5 - Direción de Analítica<br/>
         """
         paragraphReportSummary = Paragraph(text, psDetalle)
-        self.elements.append(paragraphReportSummary)
+        elements.append(paragraphReportSummary)
+
+        elements.append(PageBreak())
 
-        self.elements.append(PageBreak())
+        return elements
 
     def secondPage(self):
+        elements = []
 
         psHeaderText = ParagraphStyle('Hed0', fontSize=22, alignment=TA_CENTER, borderWidth=3, textColor=black)
         text = 'Reporte de anomalías'
         paragraphReportHeader = Paragraph(text, psHeaderText)
-        self.elements.append(paragraphReportHeader)
+        elements.append(paragraphReportHeader)
 
 
         spacer = Spacer(30, 250)
-        self.elements.append(spacer)
+        elements.append(spacer)
 
         psHeaderText = ParagraphStyle('Hed0', fontSize=15, leftIndent=50, leading=20, alignment=TA_LEFT, borderWidth=3, textColor=black)
         text = '1. Fuente de datos'
         paragraphReportHeader = Paragraph(text, psHeaderText)
-        self.elements.append(paragraphReportHeader)
+        elements.append(paragraphReportHeader)
 
         spacer = Spacer(10, 2)
-        self.elements.append(spacer)
+        elements.append(spacer)
 
         psHeaderText = ParagraphStyle('Hed0', fontSize=15, leftIndent=50, leading=20, alignment=TA_LEFT, borderWidth=3, textColor=black)
         text = '2. Consideraciones y ejemplos de anomalías'
         paragraphReportHeader = Paragraph(text, psHeaderText)
-        self.elements.append(paragraphReportHeader)
+        elements.append(paragraphReportHeader)
 
 
         psHeaderText = ParagraphStyle('Hed0', fontSize=15, leftIndent=50, leading=20, alignment=TA_LEFT, borderWidth=3, textColor=black)
         text = '3. Estadísticas (Métricas)'
         paragraphReportHeader = Paragraph(text, psHeaderText)
-        self.elements.append(paragraphReportHeader)        
+        elements.append(paragraphReportHeader)        
         
         spacer = Spacer(10, 2)
-        self.elements.append(spacer)
+        elements.append(spacer)
 
-        # psHeaderText = ParagraphStyle('Hed0', fontSize=15, leftIndent=50, leading=20, alignment=TA_LEFT, borderWidth=3, textColor=black)
-        # text = '4. Ejemplos de anomalías'
-        # paragraphReportHeader = Paragraph(text, psHeaderText)
-        # self.elements.append(paragraphReportHeader)
+        if self.appendix:
+            psHeaderText = ParagraphStyle('Hed0', fontSize=15, leftIndent=50, leading=20, alignment=TA_LEFT, borderWidth=3, textColor=black)
+            text = '4. Anexo: registros anómalos'
+            paragraphReportHeader = Paragraph(text, psHeaderText)
+            elements.append(paragraphReportHeader)
 
-        self.elements.append(PageBreak())
+        elements.append(PageBreak())
+
+        return elements
 
     def sources(self):
+        elements = []
 
         psHeaderText = ParagraphStyle('Hed0', fontSize=19, alignment=TA_CENTER, borderWidth=3, textColor=black)
         text = '1. Fuente de datos'
         paragraphReportHeader = Paragraph(text, psHeaderText)
-        self.elements.append(paragraphReportHeader)
+        elements.append(paragraphReportHeader)
 
         spacer = Spacer(30, 50)
-        self.elements.append(spacer)
+        elements.append(spacer)
 
-        data = sources_report()
+        data = self.context['sources']
         source = data['source']
         description = data['description']
         definition = data['definition']
 
         paragraphReport = Paragraph(source, self.styleSheet['Definition'])
-        self.elements.append(paragraphReport)
+        elements.append(paragraphReport)
 
         spacer = Spacer(30, 4)
-        self.elements.append(spacer)
+        elements.append(spacer)
 
         paragraphReport = Paragraph(description, self.justify_text)
-        self.elements.append(paragraphReport)
+        elements.append(paragraphReport)
 
         spacer = Spacer(30, 4)
-        self.elements.append(spacer)
+        elements.append(spacer)
 
         paragraphReport = Paragraph(definition, self.justify_text)
-        self.elements.append(paragraphReport)
+        elements.append(paragraphReport)
+
+        elements.append(PageBreak())
 
-        self.elements.append(PageBreak())
+        return elements
 
     def regards(self):
+        elements = []
 
         psHeaderText = ParagraphStyle('Hed0', fontSize=19, alignment=TA_CENTER, borderWidth=3, textColor=black)
         text = '2. Consideraciones de Anomalías'
         paragraphReportHeader = Paragraph(text, psHeaderText)
-        self.elements.append(paragraphReportHeader)
+        elements.append(paragraphReportHeader)
 
         spacer = Spacer(30, 50)
-        self.elements.append(spacer)
+        elements.append(spacer)
 
-        anomalies = regards_data(self.dataset)
+        anomalies = self.context['regards']
 
         style_normal = self.styleSheet["Normal"]
         style_definition = self.styleSheet["Definition"]
@@ -255,21 +371,31 @@ class DataProfilingPDF():
             value_paragraph = Paragraph(anomalies[anomaly], style_definition)
             paragraphs.extend([key_paragraph, value_paragraph])
 
-        self.elements.extend(paragraphs)
+        elements.extend(paragraphs)
 
         noteParagraph = Paragraph("Nota general:", style_normal)
-        noteText = """
-         No se presentan los registros completos de los datos anómalos en este informe, pero es factible generar un archivo CSV que contenga la información completa de cada anomalía. <br/>"""
+        # With the appendix the full records are part of the report
+        if self.appendix:
+            noteText = """
+         Los registros completos de los datos anómalos se presentan en el Anexo (sección 4), agrupados por regla. También es factible generar un archivo CSV que contenga la información completa de cada anomalía. <br/>"""
+        else:
+            noteText = """
+         No se presentan los registros completos de los datos anómalos en este informe, pero es factible generarlos con la opción --appendix o en un archivo CSV que contenga la información completa de cada anomalía. <br/>"""
         noteTextParagraph = Paragraph(noteText, style_definition)
-        self.elements.append(noteParagraph)
-        self.elements.append(noteTextParagraph)
+        elements.append(noteParagraph)
+        elements.append(noteTextParagraph)
         
-        self.elements.append(PageBreak())
+        elements.append(PageBreak())
+
+        return elements
 
 
     # Section
     def overview(self):
-        data_o = overview(self.dataset)
+        elements = []
+
+        data_o = self.context['overview']
+        near_duplicates = self.context['near_duplicates']
         # Styles for the section title
         psHeaderText = ParagraphStyle('Hed0', fontSize=19, alignment=TA_CENTER, borderWidth=3, textColor=black)
         text = '3. Estadistícas (Métricas)'
@@ -288,6 +414,7 @@ class DataProfilingPDF():
             ["Celdas vacías (%)", f"{data_o['total_missing_values_percentage']:.2f}"],
             ["Filas duplicadas", data_o['duplicate_rows']],
             ["Filas duplicadas (%)", f"{data_o['duplicate_rows_percentage']:.2f}"],
+            ["Canciones casi duplicadas", near_duplicates['count'] if near_duplicates else 0],
         ]
 
         var_type = [
@@ -330,28 +457,10 @@ class DataProfilingPDF():
             ('VALIGN',(0,0),(-1,-1),'TOP'),
         ]))
 
-        data_o = overview(self.dataset)
-        stats = analysis_stats(self.dataset)
-
-        anomalies = stats['analyzed']
-        notAnaliz = stats['notAnalyzed']
-        good_data = stats['good']
-
-        data = [good_data, notAnaliz, anomalies]
-        labels = ["Datos buenos", "Datos no analizados", "Datos anomalías"]
-
-        imgdata = utils_io.pie_plot(data=data, title="Resumen de análisis", labels=labels)
-
-        # Read the image of the graph and set the size it will be saved in
-        img_data = Image(imgdata, width=3 * inch, height=3 * inch)
-
-        data1 = [value for key, value in self.anomalies.items() if value > 0 and key != 'Total']
-        labels1 = [key for key, value in self.anomalies.items() if value > 0 and key != 'Total']
-
-        imgdata1 = utils_io.pie_plot(data=data1, title="Tipos de anomalías", labels=labels1)
+        # Graph in the size it will be saved in
+        img_data = self.chart('summary', 3 * inch, 3 * inch)
 
-        # Read the image of the graph and set the size it will be saved in
-        img_data1 = Image(imgdata1, width=3 * inch, height=3 * inch)
+        img_data1 = self.chart('anomaly_types', 3 * inch, 3 * inch)
 
          # New table that contains the last 2 images
         data = [(img_data, img_data1)]
@@ -365,12 +474,15 @@ class DataProfilingPDF():
 
         # Group all the elements of this section
         block = KeepTogether([paragraphReportHeader, spacer, table, spacer, table1])
-        self.elements.append(block)
+        elements.append(block)
 
         spacer = Spacer(10, 10)
-        self.elements.append(spacer)
+        elements.append(spacer)
+
+        return elements
 
     def scores(self):
+        elements = []
 
         # Styles for the section title
         psHeaderText = ParagraphStyle('Hed0', fontSize=15, alignment=TA_LEFT, borderWidth=3, textColor=black)
@@ -380,7 +492,7 @@ class DataProfilingPDF():
 
         spacer = Spacer(10, 10)
 
-        data_o = overview(self.dataset)
+        data_o = self.context['overview']
         all_data = data_o['all']
         rows = data_o['rows']
 
@@ -395,9 +507,7 @@ class DataProfilingPDF():
         temp_list = []
         for key,value in self.anomalies.items():
             if value > 0 and key != 'Total':
-                graph_data = [all_data, value]
-                img_data = utils_io.donut_plot(graph_data, key)
-                img_key = Image(img_data, width=image_size, height=image_size)
+                img_key = self.chart(f'score_{key}', image_size, image_size)
                 temp_list.append(img_key)
         # Convert the temp list to a tuple
         img_set = tuple(temp_list)
@@ -426,13 +536,17 @@ class DataProfilingPDF():
 
 
         block = KeepTogether([paragraphReportHeader1, spacer, paragraph1, spacer, paragraphReport, spacer, table])
-        self.elements.append(block)
+        elements.append(block)
 
         spacer = Spacer(10, 10)
-        self.elements.append(spacer)
+        elements.append(spacer)
+
+        return elements
 
     def graph_overview(self):
-        data_o = overview(self.dataset)
+        elements = []
+
+        data_o = self.context['overview']
         # Styles for the section title
         psHeaderText2 = ParagraphStyle('Hed1', fontSize=15, alignment=TA_LEFT, borderWidth=3, textColor=black)
         text2 = 'Análisis de valores únicos'
@@ -498,9 +612,13 @@ class DataProfilingPDF():
         ]))
         
         block1 = KeepTogether([paragraphReportHeader2, spacer2, table1])
-        self.elements.append(block1)
+        elements.append(block1)
+
+        return elements
 
     def nullity(self):
+        elements = []
+
         # Styles for the section title
         psHeaderText1 = ParagraphStyle('Hed1', fontSize=15, alignment=TA_LEFT, borderWidth=3, textColor=black)
         text1 = 'Matriz de nulidad'
@@ -509,14 +627,8 @@ class DataProfilingPDF():
 
         spacer1 = Spacer(10, 6)
 
-        # Generate the nullity matrix
-        fig = missingno.matrix(self.dataset, color=(.19,.95,.43))
-        fig_copy = fig.get_figure()
-
-        # Save the image as a stream of in-memory bytes
-        imgdata = BytesIO()
-        fig_copy.savefig(imgdata, format='png', bbox_inches='tight')
-        imgdata.seek(0)  # rewind the data
+        # Nullity matrix rendered from the null density of bins of rows
+        imgdata = self.charts['nullity']
 
         # Read the image of the graph and set the size it will be saved in
         img = Image(imgdata)
@@ -524,12 +636,58 @@ class DataProfilingPDF():
         img.drawWidth = 7.5 * inch
 
         block = KeepTogether([paragraphReportHeader1, spacer1, img])
-        self.elements.append(block)
+        elements.append(block)
 
         spacer = Spacer(10, 20)
-        self.elements.append(spacer)
+        elements.append(spacer)
+
+        elements.append(PageBreak())
 
-        self.elements.append(PageBreak())
+        return elements
+
+    # Generator of the appendix flowables, rows are read from the analysis one page at a time
+    def appendix_flowables(self):
+        start = time.time()
+        total_rows = 0
+
+        psHeaderText = ParagraphStyle('Hed0', fontSize=19, alignment=TA_CENTER, borderWidth=3, textColor=black)
+        yield PageBreak()
+        yield Paragraph('4. Anexo: registros anómalos', psHeaderText)
+        yield Spacer(30, 30)
+
+        psRuleText = ParagraphStyle('Hed1', fontSize=12, alignment=TA_LEFT, borderWidth=3, textColor=black)
+        table_style = TableStyle([
+            ('FONTSIZE', (0, 0), (-1, -1), 6.5),
+            ('TEXTCOLOR', (0, 0), (-1, -1), black),
+            ('LINEBELOW', (0, 0), (-1, 0), 0.5, black),
+            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+            ('TOPPADDING', (0, 0), (-1, -1), 1),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 1),
+        ])
+        id_columns = ['track_id', 'track_name', 'album_name']
+
+        for i, (rule, (dimension, test, args, merge)) in enumerate(appendix_rules().items()):
+            # Identification columns and the column checked by the rule
+            columns = id_columns + [column for column in args[:1] if column not in id_columns]
+            header = ['Fila'] + columns
+
+            count = 0
+            for page in anomalous_rows(self.dataset, rule, self.appendix_page_rows):
+                if count == 0:
+                    yield Paragraph(f"4.{i + 1:02d} {dimension}: {rule}", psRuleText)
+                    yield Spacer(10, 6)
+                rows = [[str(index)] + [str(value)[:40] for value in values] for index, values in zip(page.index, page[columns].itertuples(index=False))]
+                table = Table([header] + rows, repeatRows=1, hAlign='LEFT')
+                table.setStyle(table_style)
+                yield table
+                count += len(page)
+
+            if count:
+                yield Spacer(10, 12)
+            total_rows += count
+
+        elapsed = time.time() - start
+        tqdm.write(f"Appendix: {total_rows} rows in {elapsed:.2f} seconds ({total_rows / max(elapsed, 1e-9):.0f} rows/s)")
 
     # def examples(self):
     #     # Styles for the section title
@@ -553,12 +711,16 @@ class DataProfilingPDF():
 if __name__ == '__main__':
     try:
         start = time.time()
-        report = DataProfilingPDF()
+        # The appendix with every anomalous row is only generated on request, as the vector charts
+        report = DataProfilingPDF(appendix='--appendix' in sys.argv, chart_backend='vector' if '--vector-charts' in sys.argv else 'png')
         end = time.time()
         exc_time = end - start
 
         print(f"Report generated in {exc_time:.2f} seconds")
 
+        # Append the results of the run to the run history
+        run_history.record_run(report.results_document(exc_time), fingerprint=utils_io.df_fingerprint(report.dataset))
+
         # Upload csv dataset to S3
         bucket = 'dataqualitychallenge'
         utils_io.upload_file(report.doc.filename, bucket, 'data_quality_report.pdf')
@@ -0,0 +1,144 @@
+import argparse
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+
+from data_quality_analysis import report_context
+from headless_report import results_document, json_default
+from report_generator import DataProfilingPDF
+import utils_io
+
+# Long running version of report_generator.py: the dataset, its statistics and the flowables
+# of every section stay in memory between requests. A request only recomputes what depends
+# on data that changed, an unchanged dataset is answered with the PDF of the previous build.
+
+
+class ReportService():
+
+    def __init__(self, method='url', refresh=60, appendix=False):
+        self.method = method
+        # Seconds during which the loaded dataset is used without reading it again
+        self.refresh = refresh
+        self.appendix = appendix
+
+        self.lock = threading.Lock()
+        self.dataset = None
+        self.fingerprint = None
+        self.loaded = 0
+        self.context = None
+        self.section_cache = {}
+        self.pdf = None
+        self.results = None
+        self.builds = 0
+        self.build_seconds = None
+
+    def load(self):
+        # Reload the dataset when the refresh interval is over, everything built from it is
+        # discarded only when its content changed
+        if self.dataset is not None and time.time() - self.loaded < self.refresh:
+            return
+        dataset = utils_io.get_dataset(self.method)
+        fingerprint = utils_io.df_fingerprint(dataset)
+        self.loaded = time.time()
+        if fingerprint == self.fingerprint:
+            return
+        self.dataset = dataset
+        self.fingerprint = fingerprint
+        self.context = report_context(dataset)
+        self.pdf = None
+        self.results = None
+
+    def report(self):
+        with self.lock:
+            self.load()
+            if self.pdf is None:
+                start = time.time()
+                file = BytesIO()
+                # Sections whose statistics didn't change are reused from the section cache
+                DataProfilingPDF(self.appendix, self.dataset, file, self.context, self.section_cache)
+                self.pdf = file.getvalue()
+                self.builds += 1
+                self.build_seconds = time.time() - start
+            return self.pdf
+
+    def quality_results(self):
+        with self.lock:
+            self.load()
+            if self.results is None:
+                # Built from the statistics of the report context, the checks are not run again
+                start = time.time()
+                context = self.context
+                document = results_document(context['overview'], context['results'], context['anomalies'], context['stats'], near_duplicates=context['near_duplicates'], multivariate_outliers=context['multivariate_outliers'])
+                document['seconds'] = time.time() - start
+                self.results = json.dumps(document, ensure_ascii=False, default=json_default).encode('utf-8')
+            return self.results
+
+    def status(self):
+        with self.lock:
+            return json.dumps({
+                'method': self.method,
+                'fingerprint': self.fingerprint,
+                'rows': None if self.dataset is None else len(self.dataset),
+                'builds': self.builds,
+                'build_seconds': self.build_seconds,
+                'cached_sections': list(self.section_cache),
+            }).encode('utf-8')
+
+
+def make_handler(service):
+
+    class ReportHandler(BaseHTTPRequestHandler):
+
+        routes = {
+            '/report': (service.report, 'application/pdf'),
+            '/results': (service.quality_results, 'application/json'),
+            '/status': (service.status, 'application/json'),
+        }
+
+        def do_GET(self):
+            route = self.routes.get(self.path.split('?')[0])
+            if route is None:
+                self.send_error(404)
+                return
+            process, content_type = route
+            try:
+                body = process()
+            except Exception as e:
+                self.send_error(500, str(e))
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return ReportHandler
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Data quality report service with the dataset kept in memory')
+    parser.add_argument('--method', default='url', help="Dataset source: 's3', 'url', 'local' or 'parquet'")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8050)
+    parser.add_argument('--refresh', type=float, default=60, help='Seconds between checks of the dataset')
+    parser.add_argument('--appendix', action='store_true', help='Include the appendix with every anomalous row')
+    args = parser.parse_args()
+
+    try:
+        service = ReportService(args.method, args.refresh, args.appendix)
+        # Warm start: the first request doesn't wait for the dataset or the first build
+        start = time.time()
+        service.report()
+        print(f"Report service ready in {time.time() - start:.2f} seconds on http://{args.host}:{args.port}")
+
+        server = ThreadingHTTPServer((args.host, args.port), make_handler(service))
+        server.serve_forever()
+
+    except ValueError as ve:
+        print(f"Error: {ve}")
+        sys.exit(1)
+    except KeyboardInterrupt:
+        pass
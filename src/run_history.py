@@ -0,0 +1,161 @@
+import argparse
+import sqlite3
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# History of the quality results of every run, in a SQLite database next to the reports.
+# The checks table is indexed by dataset, check and time, so the queries of a check or a time
+# window read only the rows they need however many years of runs are stored.
+
+base = Path(__file__).parent.parent
+history_path = base / 'output' / 'quality_history.db'
+
+schema = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY,
+    dataset TEXT NOT NULL,
+    fingerprint TEXT,
+    timestamp REAL NOT NULL,
+    seconds REAL,
+    rows INTEGER,
+    cols INTEGER,
+    score REAL
+);
+CREATE TABLE IF NOT EXISTS checks (
+    run_id INTEGER NOT NULL REFERENCES runs (run_id),
+    dataset TEXT NOT NULL,
+    timestamp REAL NOT NULL,
+    check_name TEXT NOT NULL,
+    dimension TEXT,
+    count INTEGER NOT NULL,
+    percentage REAL,
+    seconds REAL
+);
+CREATE INDEX IF NOT EXISTS runs_dataset_timestamp ON runs (dataset, timestamp);
+CREATE INDEX IF NOT EXISTS checks_dataset_check_timestamp ON checks (dataset, check_name, timestamp);
+CREATE INDEX IF NOT EXISTS checks_run ON checks (run_id);
+"""
+
+
+def connect(path=None):
+    path = Path(path or history_path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    connection = sqlite3.connect(path, timeout=30)
+    # Readers don't wait for a run that is being recorded
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.executescript(schema)
+    return connection
+
+def record_run(document, dataset='dataset.csv', fingerprint=None, path=None):
+    """Append the results document of a run (see headless_report.quality_results) to the history
+
+    Every rule is stored as a check, and every dimension total as a check named after the dimension
+
+    :param document: Results document of the run
+    :param dataset: Name of the validated dataset
+    :param fingerprint: Content hash of the dataset
+    :param path: History database. If not specified then history_path is used
+    :return: Id of the run
+    """
+    timestamp = time.time()
+    checks = [(rule['rule'], rule['dimension'], int(rule['count']), float(rule['percentage']), rule.get('seconds'))
+              for rule in document['rules']]
+    checks += [(dimension, dimension, int(values['count']), float(values['percentage']), None)
+               for dimension, values in document['dimensions'].items()]
+
+    with connect(path) as connection:
+        cursor = connection.execute(
+            'INSERT INTO runs (dataset, fingerprint, timestamp, seconds, rows, cols, score) VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (dataset, fingerprint, timestamp, document.get('seconds'), int(document['dataset']['rows']),
+             int(document['dataset']['cols']), float(document['score'])))
+        run_id = cursor.lastrowid
+        connection.executemany(
+            'INSERT INTO checks (run_id, dataset, timestamp, check_name, dimension, count, percentage, seconds) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            [(run_id, dataset, timestamp) + check for check in checks])
+    connection.close()
+
+    return run_id
+
+def last_runs(dataset='dataset.csv', limit=10, path=None):
+    connection = connect(path)
+    rows = connection.execute(
+        'SELECT run_id, timestamp, fingerprint, rows, score, seconds FROM runs WHERE dataset = ? ORDER BY timestamp DESC LIMIT ?',
+        (dataset, limit)).fetchall()
+    connection.close()
+    return rows
+
+def check_trend(check, dataset='dataset.csv', days=30, path=None):
+    # Daily average count of a check during the last days
+    since = time.time() - days * 86400
+    connection = connect(path)
+    rows = connection.execute(
+        """SELECT date(timestamp, 'unixepoch') AS day, AVG(count), MIN(count), MAX(count), COUNT(*)
+           FROM checks WHERE dataset = ? AND check_name = ? AND timestamp >= ?
+           GROUP BY day ORDER BY day""",
+        (dataset, check, since)).fetchall()
+    connection.close()
+    return rows
+
+def regressions(dataset='dataset.csv', threshold=10.0, days=7, path=None):
+    """Checks of the last run whose count rose more than threshold percent over their median of the previous days
+
+    :param threshold: Increase in percentage over the median
+    :param days: Days before the last run that make up the baseline
+    :return: List of (check, count, median, increase percentage), the largest increases first
+    """
+    connection = connect(path)
+    last = connection.execute(
+        'SELECT run_id, timestamp FROM runs WHERE dataset = ? ORDER BY timestamp DESC LIMIT 1', (dataset,)).fetchone()
+    if last is None:
+        connection.close()
+        return []
+    run_id, timestamp = last
+
+    found = []
+    for check, count in connection.execute('SELECT check_name, count FROM checks WHERE run_id = ?', (run_id,)).fetchall():
+        # Range scan of the (dataset, check_name, timestamp) index
+        baseline = [value for value, in connection.execute(
+            'SELECT count FROM checks WHERE dataset = ? AND check_name = ? AND timestamp >= ? AND timestamp < ?',
+            (dataset, check, timestamp - days * 86400, timestamp))]
+        if not baseline:
+            continue
+        median = statistics.median(baseline)
+        if median == 0:
+            increase = float('inf') if count > 0 else 0.0
+        else:
+            increase = (count - median) / median * 100
+        if increase > threshold:
+            found.append((check, count, median, increase))
+    connection.close()
+
+    return sorted(found, key=lambda item: item[3], reverse=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Queries over the history of quality results')
+    parser.add_argument('query', choices=['runs', 'trend', 'regressions'])
+    parser.add_argument('--dataset', default='dataset.csv', help='Name of the dataset')
+    parser.add_argument('--check', help='Rule or dimension of the trend query')
+    parser.add_argument('--days', type=int, help='Days of the trend, or of the regression baseline (default 30 and 7)')
+    parser.add_argument('--threshold', type=float, default=10.0, help='Increase in percentage over the median that is a regression')
+    parser.add_argument('--limit', type=int, default=10, help='Runs listed')
+    parser.add_argument('--history', help='History database')
+    args = parser.parse_args()
+
+    if args.query == 'runs':
+        for run_id, timestamp, fingerprint, rows, score, seconds in last_runs(args.dataset, args.limit, args.history):
+            print(f"{run_id:>6}  {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(timestamp))}  {rows:>9} rows  score {score:5.1f}  {(fingerprint or '')[:12]}")
+    elif args.query == 'trend':
+        if not args.check:
+            print("Error: --check is required by the trend query")
+            sys.exit(1)
+        for day, average, minimum, maximum, runs in check_trend(args.check, args.dataset, args.days or 30, args.history):
+            print(f"{day}  average {average:10.1f}  min {minimum:>8}  max {maximum:>8}  runs {runs}")
+    else:
+        found = regressions(args.dataset, args.threshold, args.days or 7, args.history)
+        for check, count, median, increase in found:
+            print(f"{check:<40} {count:>8}  median {median:>10.1f}  +{increase:.1f}%")
+        # A non-zero exit lets schedulers alert on regressions
+        sys.exit(1 if found else 0)
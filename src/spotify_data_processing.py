@@ -14,24 +14,42 @@ output_path = os.path.join(base_path, 'output')
 json_link = "https://drive.google.com/file/d/1O-z8fCDXy5IleKfU6wRAJZjyz_FIGv9F"
 csv_name = 'dataset.csv'
 csv_path = os.path.join(output_path, csv_name)
-
-# Get json data from Google Drive using the link
-data = utils_io.get_json_from_drive(json_link)
-
-# Normalize json data
-tracks = pd.json_normalize(data, record_path=['albums','tracks'], meta=['artist_id','artist_name','artist_popularity',['albums','album_id']])
-albums = pd.json_normalize(data, record_path=['albums'])
-
-# Merge dataframes into one dataset
-dataset = tracks.merge(albums, left_on='albums.album_id', right_on='album_id')
-dataset = dataset.drop(columns=['tracks','albums.album_id'])
-
-# Save dataset to csv file locally
-dataset.to_csv(csv_path, index=False)
-
-try:
-    # Upload csv dataset to S3
-    bucket = 'dataqualitychallenge'
-    utils_io.df_to_s3(dataset, bucket, csv_name)
-except Exception as e:
-    print("Error uploading dataset to S3: ", e)
\ No newline at end of file
+# Partitioned parquet version of the dataset
+parquet_path = os.path.join(output_path, 'dataset')
+
+def normalize_dataset(data):
+    # Normalize json data
+    tracks = pd.json_normalize(data, record_path=['albums','tracks'], meta=['artist_id','artist_name','artist_popularity',['albums','album_id']])
+    albums = pd.json_normalize(data, record_path=['albums'])
+
+    # Merge dataframes into one dataset
+    dataset = tracks.merge(albums, left_on='albums.album_id', right_on='album_id')
+    dataset = dataset.drop(columns=['tracks','albums.album_id'])
+
+    return dataset
+
+def save_dataset(dataset, csv_path=csv_path, parquet_path=parquet_path):
+    # Save dataset to csv file locally
+    os.makedirs(os.path.dirname(csv_path), exist_ok=True)
+    dataset.to_csv(csv_path, index=False)
+    # Save dataset as parquet files partitioned by artist and album release year
+    utils_io.dataset_to_parquet(dataset, parquet_path)
+
+def upload_dataset(dataset):
+    try:
+        # Upload csv dataset to S3
+        bucket = 'dataqualitychallenge'
+        utils_io.df_to_s3(dataset, bucket, csv_name)
+    except Exception as e:
+        print("Error uploading dataset to S3: ", e)
+        return False
+    return True
+
+
+if __name__ == '__main__':
+    # Get json data from Google Drive using the link
+    data = utils_io.get_json_from_drive(json_link)
+
+    dataset = normalize_dataset(data)
+    save_dataset(dataset)
+    upload_dataset(dataset)
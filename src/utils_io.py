@@ -1,25 +1,79 @@
-from io import StringIO, BytesIO
+from io import StringIO, BytesIO, RawIOBase, BufferedReader
 from pathlib import Path
+from datetime import datetime
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
 import os
+import zlib
 import re
-from urllib.request import urlopen
+import shutil
+import threading
 
-import requests
 import json
 import logging
-import boto3
-from botocore.exceptions import ClientError
-import matplotlib.pyplot as plt
-import seaborn as sns
+import numpy as np
 import pandas as pd
 
+# boto3, requests and matplotlib take most of the import time of this module, they are imported
+# in the functions that use them so a run that only checks the data doesn't load them
 
-def upload_file(file_name, bucket, object_name=None):
+
+# Multipart transfer settings for S3, large artifacts are split in parts sent concurrently
+s3_part_size = 8 * 1024 * 1024
+s3_max_concurrency = 10
+# Endpoint of an S3 compatible service (e.g. a local stand-in). If not specified then AWS is used
+s3_endpoint_url = os.environ.get('S3_ENDPOINT_URL')
+_s3_lock = threading.Lock()
+_s3_session = None
+_s3_clients = {}
+
+
+def get_s3_client(endpoint_url=None):
+    """Return the shared S3 client, created on first use
+
+    The boto3 session is not thread safe, so it is created once under a lock and
+    only used to build the clients. Clients are thread safe and keep a pool of
+    connections, so they are reused by every transfer of the process.
+
+    :param endpoint_url: S3 endpoint. If not specified then s3_endpoint_url is used
+    :return: boto3 S3 client
+    """
+    global _s3_session
+    import boto3
+    from botocore.config import Config
+
+    endpoint_url = endpoint_url or s3_endpoint_url
+
+    client = _s3_clients.get(endpoint_url)
+    if client is None:
+        with _s3_lock:
+            client = _s3_clients.get(endpoint_url)
+            if client is None:
+                if _s3_session is None:
+                    _s3_session = boto3.session.Session()
+                # Enough connections for every part of several concurrent transfers
+                config = Config(max_pool_connections=s3_max_concurrency * 4)
+                client = _s3_session.client('s3', endpoint_url=endpoint_url, config=config)
+                _s3_clients[endpoint_url] = client
+    return client
+
+def s3_transfer_config(part_size=None, concurrency=None):
+    from boto3.s3.transfer import TransferConfig
+
+    # Files bigger than one part are sent as concurrent multipart transfers
+    part_size = part_size or s3_part_size
+    concurrency = concurrency or s3_max_concurrency
+    return TransferConfig(multipart_threshold=part_size, multipart_chunksize=part_size, max_concurrency=concurrency, use_threads=True)
+
+def upload_file(file_name, bucket, object_name=None, part_size=None, concurrency=None):
     """Upload a file to an S3 bucket
 
     :param file_name: File to upload
     :param bucket: Bucket to upload to
     :param object_name: S3 object name. If not specified then file_name is used
+    :param part_size: Size of the multipart upload parts. If not specified then s3_part_size is used
+    :param concurrency: Parts uploaded at the same time. If not specified then s3_max_concurrency is used
     :return: True if file was uploaded, else False
     """
 
@@ -27,45 +81,475 @@ def upload_file(file_name, bucket, object_name=None):
     if object_name is None:
         object_name = os.path.basename(file_name)
 
-    # Upload the file
-    s3_client = boto3.client('s3')
+    from botocore.exceptions import ClientError
+    from boto3.exceptions import S3UploadFailedError
+
+    # Upload the file, the transfer manager wraps the client errors in S3UploadFailedError
+    s3_client = get_s3_client()
     try:
-        response = s3_client.upload_file(file_name, bucket, object_name)
+        response = s3_client.upload_file(str(file_name), bucket, object_name, Config=s3_transfer_config(part_size, concurrency))
+    except (ClientError, S3UploadFailedError) as e:
+        logging.error(e)
+        return False
+    return True
+
+def download_file(bucket, object_name, file_name, part_size=None, concurrency=None):
+    """Download a file from an S3 bucket
+
+    :param bucket: Bucket to download from
+    :param object_name: S3 object name
+    :param file_name: Local path where the file is saved
+    :param part_size: Size of the ranged requests. If not specified then s3_part_size is used
+    :param concurrency: Parts downloaded at the same time. If not specified then s3_max_concurrency is used
+    :return: True if file was downloaded, else False
+    """
+    from botocore.exceptions import ClientError
+
+    s3_client = get_s3_client()
+    try:
+        s3_client.download_file(bucket, object_name, str(file_name), Config=s3_transfer_config(part_size, concurrency))
     except ClientError as e:
         logging.error(e)
         return False
     return True
 
-def df_to_s3(df, bucket, csv_name):
-    # Save dataframe to csv file in memory
-    csv_buffer = StringIO()
-    df.to_csv(csv_buffer, index=False)
+def upload_artifacts(files, bucket, part_size=None, concurrency=None):
+    """Upload several files to an S3 bucket in parallel
 
-    # Upload csv file to s3 bucket
-    s3_resource = boto3.resource('s3')
-    s3_resource.Object(bucket, csv_name).put(Body=csv_buffer.getvalue())
+    :param files: Dictionary of S3 object names and the local files to upload
+    :param bucket: Bucket to upload to
+    :param part_size: Size of the multipart upload parts
+    :param concurrency: Parts uploaded at the same time for each file
+    :return: Dictionary of S3 object names and True if the file was uploaded, else False
+    """
+    if not files:
+        return {}
+    with ThreadPoolExecutor(max_workers=len(files)) as executor:
+        futures = {name: executor.submit(upload_file, path, bucket, name, part_size, concurrency) for name, path in files.items()}
+    return {name: future.result() for name, future in futures.items()}
+
+def run_artifacts():
+    # Files generated by a complete run of the scripts, named as they are stored in S3
+    base_path = Path(__file__).parent.parent
+    files = {
+        'dataset.csv': base_path / 'output' / 'dataset.csv',
+        'data_quality_report.pdf': base_path / 'output' / 'doc' / 'data_quality_report.pdf',
+        'profilling_report.html': base_path / 'output' / 'doc' / 'profilling_report.html',
+    }
+    return {name: path for name, path in files.items() if path.exists()}
+
+# Minimum size of the parts of an S3 multipart upload, except the last one
+s3_min_part_size = 5 * 1024 * 1024
+
+
+class S3MultipartWriter(RawIOBase):
+    """Writable file object that sends its content to S3 as a multipart upload
+
+    Data is accumulated until a part is complete, then the part is uploaded in a
+    background thread. At most `concurrency` parts are in flight, so memory stays at a
+    few part sized buffers whatever the amount of data written. Content smaller than one
+    part is sent with a single put_object call.
+    """
+
+    def __init__(self, bucket, key, part_size=None, concurrency=None):
+        self.bucket = bucket
+        self.key = key
+        self.part_size = max(part_size or s3_part_size, s3_min_part_size)
+        self.concurrency = concurrency or s3_max_concurrency
+        self.client = get_s3_client()
+        self.buffer = bytearray()
+        self.position = 0
+        self.upload_id = None
+        self.futures = []
+        self.executor = None
+        # Blocks the writer while all the upload slots are busy
+        self.slots = threading.BoundedSemaphore(self.concurrency)
+
+    def writable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def write(self, data):
+        self.buffer.extend(data)
+        self.position += len(data)
+        while len(self.buffer) >= self.part_size:
+            part = bytes(self.buffer[:self.part_size])
+            del self.buffer[:self.part_size]
+            self._send_part(part)
+        return len(data)
+
+    def _send_part(self, part):
+        # The multipart upload is created with the first complete part
+        if self.upload_id is None:
+            response = self.client.create_multipart_upload(Bucket=self.bucket, Key=self.key)
+            self.upload_id = response['UploadId']
+            self.executor = ThreadPoolExecutor(max_workers=self.concurrency)
+
+        self.slots.acquire()
+        part_number = len(self.futures) + 1
+        self.futures.append(self.executor.submit(self._upload_part, part_number, part))
+
+    def _upload_part(self, part_number, part):
+        try:
+            response = self.client.upload_part(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id, PartNumber=part_number, Body=part)
+            return {'PartNumber': part_number, 'ETag': response['ETag']}
+        finally:
+            self.slots.release()
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if self.upload_id is None:
+                # Small content, a single request is enough
+                self.client.put_object(Bucket=self.bucket, Key=self.key, Body=bytes(self.buffer))
+            else:
+                if self.buffer:
+                    self._send_part(bytes(self.buffer))
+                parts = [future.result() for future in self.futures]
+                self.client.complete_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id, MultipartUpload={'Parts': parts})
+        except Exception:
+            self.abort()
+            raise
+        finally:
+            self.buffer = bytearray()
+            if self.executor is not None:
+                self.executor.shutdown()
+            super().close()
+
+    def abort(self):
+        # Discard the parts already uploaded so they are not billed as storage
+        if self.upload_id is not None:
+            if self.executor is not None:
+                self.executor.shutdown(cancel_futures=True)
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+            self.upload_id = None
+        self.buffer = bytearray()
+        super().close()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+
+
+def _stream_compressor(compression):
+    # Incremental compressors with the same compress / flush interface
+    if compression is None:
+        return None
+    elif compression == 'gzip':
+        return zlib.compressobj(wbits=31)
+    elif compression == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise ValueError('zstd compression requires the zstandard package')
+        return zstandard.ZstdCompressor().compressobj()
+    else:
+        raise ValueError(f'Invalid compression: {compression}')
+
+def df_to_s3(df, bucket, csv_name, file_format='csv', compression=None, batch_rows=50000, part_size=None, concurrency=None):
+    """Upload a dataframe to an S3 bucket without building the whole file in memory
+
+    The dataframe is encoded in batches of rows that are written straight into a
+    multipart upload, so only a few parts are held in memory at any time.
+
+    :param df: Dataframe to upload
+    :param bucket: Bucket to upload to
+    :param csv_name: S3 object name
+    :param file_format: 'csv' or 'parquet'
+    :param compression: None, 'gzip' or 'zstd'. For parquet it is the codec of the columns
+    :param batch_rows: Rows encoded at a time
+    :param part_size: Size of the multipart upload parts. If not specified then s3_part_size is used
+    :param concurrency: Parts uploaded at the same time. If not specified then s3_max_concurrency is used
+    """
+    with S3MultipartWriter(bucket, csv_name, part_size, concurrency) as writer:
+        if file_format == 'csv':
+            compressor = _stream_compressor(compression)
+            # Always write at least the header, even for an empty dataframe
+            for start in range(0, max(len(df), 1), batch_rows):
+                batch = df.iloc[start:start + batch_rows].to_csv(index=False, header=start == 0).encode('utf-8')
+                writer.write(compressor.compress(batch) if compressor else batch)
+            if compressor:
+                writer.write(compressor.flush())
+
+        elif file_format == 'parquet':
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            # One row group per batch, all of them with the schema of the whole dataframe
+            schema = pa.Schema.from_pandas(df, preserve_index=False)
+            with pq.ParquetWriter(writer, schema, compression=compression or 'none') as parquet_writer:
+                for start in range(0, len(df), batch_rows):
+                    batch = pa.Table.from_pandas(df.iloc[start:start + batch_rows], schema=schema, preserve_index=False)
+                    parquet_writer.write_table(batch)
+        else:
+            raise ValueError(f'Invalid file format: {file_format}')
+
+def memory_file_to_s3(file, bucket, file_name, part_size=None, concurrency=None):
+    # Text buffers are encoded, binary buffers are uploaded from the beginning
+    if isinstance(file, StringIO):
+        file = BytesIO(file.getvalue().encode('utf-8'))
+    file.seek(0)
 
-def memory_file_to_s3(file, bucket, file_name):
     # Upload csv file to s3 bucket
-    s3_resource = boto3.resource('s3')
-    s3_resource.Object(bucket, file_name).put(Body=file.getvalue())
+    get_s3_client().upload_fileobj(file, bucket, file_name, Config=s3_transfer_config(part_size, concurrency))
 
 
-def get_json_from_drive(link):
+# Local cache for downloaded inputs, shared by every script of the repository
+cache_dir = Path(__file__).parent.parent / '.cache' / 'downloads'
+# Maximum size of the cached payloads, the least recently used ones are evicted first
+cache_max_bytes = 512 * 1024 * 1024
+_cache_lock = threading.Lock()
+
+
+def _load_cache_index(directory):
+    # The index maps each url to the content hash of its payload and its validators
+    index_path = directory / 'index.json'
+    if not index_path.exists():
+        return {}
+    try:
+        with open(index_path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _save_cache_index(directory, index):
+    # Write to a temporary file first so a crash never leaves a broken index
+    index_path = directory / 'index.json'
+    tmp_path = directory / 'index.json.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f, indent=1)
+    os.replace(tmp_path, index_path)
+
+def _evict_cache(directory, index, max_bytes, keep):
+    # Size of every stored payload, payloads shared by several urls are counted once
+    sizes = {entry['sha256']: entry['size'] for entry in index.values()}
+    total = sum(sizes.values())
+
+    # Remove the least recently used urls until the cache fits in the limit
+    for url, entry in sorted(index.items(), key=lambda item: item[1]['last_access']):
+        if total <= max_bytes:
+            break
+        if url == keep:
+            continue
+        del index[url]
+        # Delete the payload only if no other url points to it
+        if all(other['sha256'] != entry['sha256'] for other in index.values()):
+            (directory / entry['sha256']).unlink(missing_ok=True)
+            total -= sizes[entry['sha256']]
+
+def _touch_cache_entry(directory, url, entry):
+    # Update the last access time used by the LRU eviction
+    with _cache_lock:
+        index = _load_cache_index(directory)
+        entry['last_access'] = datetime.now().timestamp()
+        index[url] = entry
+        _save_cache_index(directory, index)
+    return directory / entry['sha256']
+
+def cached_download(url, directory=None, max_bytes=None, max_age=None, chunk_size=1024 * 1024):
+    """Download a url into the local cache and return the path of the cached payload
+
+    Payloads are stored by their content hash and revalidated with conditional
+    requests (ETag / Last-Modified), so an unchanged remote file is not transferred again.
+
+    :param url: Url to download
+    :param directory: Cache directory. If not specified then cache_dir is used
+    :param max_bytes: Size limit of the cache. If not specified then cache_max_bytes is used
+    :param max_age: Seconds during which a cached payload is used without revalidation
+    :param chunk_size: Size of the blocks streamed to disk
+    :return: Path of the cached file
+    """
+    import requests
+
+    directory = Path(directory or cache_dir)
+    max_bytes = cache_max_bytes if max_bytes is None else max_bytes
+    directory.mkdir(parents=True, exist_ok=True)
+
+    with _cache_lock:
+        index = _load_cache_index(directory)
+    entry = index.get(url)
+    if entry is not None and not (directory / entry['sha256']).exists():
+        entry = None
+
+    now = datetime.now().timestamp()
+    # Fresh enough payloads are served without contacting the server
+    if entry is not None and max_age is not None and now - entry['fetched'] < max_age:
+        return _touch_cache_entry(directory, url, entry)
+
+    # Conditional request with the validators of the cached payload
+    headers = {}
+    if entry is not None:
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+
+    try:
+        response = requests.get(url, headers=headers, stream=True, timeout=60)
+    except requests.RequestException as e:
+        # Work offline with the cached copy if there is one
+        if entry is None:
+            raise
+        logging.warning(f"Using cached copy of {url}: {e}")
+        return _touch_cache_entry(directory, url, entry)
+
+    with response:
+        if response.status_code == 304 and entry is not None:
+            entry['fetched'] = now
+            return _touch_cache_entry(directory, url, entry)
+        response.raise_for_status()
+
+        # Stream the body to a temporary file while hashing it
+        sha256 = hashlib.sha256()
+        size = 0
+        tmp_path = directory / f'{os.getpid()}-{threading.get_ident()}.part'
+        with open(tmp_path, 'wb') as f:
+            for block in response.iter_content(chunk_size=chunk_size):
+                sha256.update(block)
+                size += len(block)
+                f.write(block)
+
+        # Content addressed storage, an identical payload is stored only once
+        digest = sha256.hexdigest()
+        if (directory / digest).exists():
+            tmp_path.unlink()
+        else:
+            os.replace(tmp_path, directory / digest)
+
+        entry = {
+            'sha256': digest,
+            'size': size,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'fetched': now,
+        }
+
+    with _cache_lock:
+        index = _load_cache_index(directory)
+        entry['last_access'] = now
+        index[url] = entry
+        _evict_cache(directory, index, max_bytes, keep=url)
+        _save_cache_index(directory, index)
+
+    return directory / digest
+
+
+def object_fingerprint(value):
+    # Content hash of a python object (dataframes, arrays, dictionaries of statistics, ...)
+    import pickle
+    return hashlib.sha256(pickle.dumps(value, protocol=4)).hexdigest()
+
+def df_fingerprint(df):
+    # Content hash of a dataframe: column names, types and the hash of every row
+    sha256 = hashlib.sha256()
+    sha256.update(json.dumps([[str(column), str(dtype)] for column, dtype in df.dtypes.items()]).encode('utf-8'))
+    sha256.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return sha256.hexdigest()
+
+def file_fingerprint(path, chunk_size=1024 * 1024):
+    # Content hash of a file, read in blocks
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk_size), b''):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+def drive_download(link):
     # Get the url id
     url_id = link.split('/')[-1]
     # Construct the url to download the json file
     url = "https://drive.google.com/uc?id=" + url_id
 
-    # Download the json file
-    response = requests.get(url)
+    # Download the json file, or reuse the cached copy if it didn't change
+    return cached_download(url)
+
+def get_json_from_drive(link):
+    json_path = drive_download(link)
     # Convert the response to json format
-    json_data = response.json()
+    with open(json_path, encoding='utf-8') as f:
+        json_data = json.load(f)
 
     # Return the json data
     return json_data
 
-def get_dataset(method):
+# Partition columns of the parquet dataset, derived from artist_id and album_release_date
+parquet_partitions = ['artist', 'release_year']
+# Position of every row in the original dataset, the partitions are read back in this order
+parquet_row_column = 'row_number'
+
+def dataset_to_parquet(df, dataset_path, compression='zstd'):
+    """Save the dataset as parquet files partitioned by artist and album release year
+
+    Column statistics are stored in every file, so readers can skip row groups and
+    partitions that don't match their filters. The dataset is written to a temporary folder
+    that replaces the previous one, so no partition of an older dataset is left behind.
+
+    :param df: Dataset to save
+    :param dataset_path: Root folder of the partitioned dataset
+    :param compression: Codec of the parquet columns
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    df = df.copy()
+    # Columns with mixed python types are saved as text, as they are read back from the csv
+    for column in df.select_dtypes(include=object).columns:
+        df[column] = df[column].where(df[column].isnull(), df[column].astype(str))
+
+    df['artist'] = df['artist_id']
+    df['release_year'] = pd.to_datetime(df['album_release_date'], errors='coerce').dt.year.astype('Int64')
+    df[parquet_row_column] = np.arange(df.shape[0], dtype=np.int64)
+
+    dataset_path = Path(dataset_path)
+    temporary_path = dataset_path.with_name(f'{dataset_path.name}.tmp-{os.getpid()}')
+    stale_path = dataset_path.with_name(f'{dataset_path.name}.old-{os.getpid()}')
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    try:
+        pq.write_to_dataset(table, temporary_path, partition_cols=parquet_partitions, compression=compression,
+                            write_statistics=True)
+        if dataset_path.exists():
+            os.replace(dataset_path, stale_path)
+        os.replace(temporary_path, dataset_path)
+    finally:
+        shutil.rmtree(temporary_path, ignore_errors=True)
+        shutil.rmtree(stale_path, ignore_errors=True)
+
+def parquet_to_df(dataset_path, columns=None, filters=None):
+    """Read the partitioned parquet dataset
+
+    :param dataset_path: Root folder of the partitioned dataset
+    :param columns: Columns to read. If not specified then all the columns of the dataset are read
+    :param filters: pyarrow filters, e.g. [('artist', '=', artist_id), ('release_year', '>=', 2019)].
+        Filters on the partition columns skip the folders that don't match
+    :return: Dataframe in the order of the original dataset, indexed by the row of each record in it
+    """
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+
+    partitioning = ds.partitioning(pa.schema([('artist', pa.string()), ('release_year', pa.int32())]), flavor='hive')
+    dataset = ds.dataset(dataset_path, format='parquet', partitioning=partitioning)
+
+    # Partition columns are only part of the folder names, not of the original dataset
+    if columns is None:
+        columns = [column for column in dataset.schema.names if column not in parquet_partitions + [parquet_row_column]]
+    expression = pq.filters_to_expression(filters) if filters else None
+
+    # Partitions are read grouped by folder, the row numbers restore the order and the index of the dataset
+    ordered = parquet_row_column in dataset.schema.names
+    read_columns = list(columns) + [parquet_row_column] if ordered and parquet_row_column not in columns else list(columns)
+    df = dataset.to_table(columns=read_columns, filter=expression).to_pandas()
+    if ordered:
+        df = df.sort_values(parquet_row_column).set_index(parquet_row_column)
+        df.index.name = None
+    return df
+
+def get_dataset(method, columns=None, filters=None):
     try:
         method = method.lower()
         if method == 's3':
@@ -73,8 +557,7 @@ def get_dataset(method):
         elif method == 'url':         
             # Get the csv file from the url
             url = "https://dataqualitychallenge.s3.us-east-2.amazonaws.com/dataset.csv"
-            with urlopen(url) as conn:
-                df = pd.read_csv(conn)
+            df = pd.read_csv(cached_download(url))
 
         elif method == 'local':
             # Paths to input and output folders | Local version
@@ -83,19 +566,145 @@ def get_dataset(method):
             csv_name = 'dataset.csv'
             csv_path = os.path.join(output_path, csv_name)
             df = pd.read_csv(csv_path)
+
+        elif method == 'parquet':
+            # Partitioned dataset generated by the processing script, only the needed files are read
+            dataset_path = os.path.join(Path(os.getcwd()), 'output', 'dataset')
+            df = parquet_to_df(dataset_path, columns, filters)
         return df
     except:
         raise ValueError('Invalid method')
-        
+
+def get_dataset_chunks(method, chunk_rows=50000):
+    """Read the dataset as an iterator of dataframes, so the analysis can start with the first rows
+
+    :param method: 's3', 'url' or 'local', as in get_dataset
+    :param chunk_rows: Rows of each dataframe
+    :return: Iterator of dataframes
+    """
+    method = method.lower()
+    if method == 's3':
+        return iter_remote_csv('s3://dataqualitychallenge/dataset.csv', chunk_rows)
+    elif method == 'url':
+        return iter_remote_csv("https://dataqualitychallenge.s3.us-east-2.amazonaws.com/dataset.csv", chunk_rows)
+    elif method == 'local':
+        csv_path = os.path.join(Path(os.getcwd()), 'output', 'dataset.csv')
+        return pd.read_csv(csv_path, chunksize=chunk_rows)
+    else:
+        raise ValueError('Invalid method')
 
 
 def csv_from_s3(bucket, csv_name):
     # Download csv file from s3 bucket
-    s3 = boto3.client('s3')
+    s3 = get_s3_client()
     obj = s3.get_object(Bucket=bucket, Key=csv_name)
     df = pd.read_csv(obj['Body'])
     return df
 
+
+class RemoteRangeReader(RawIOBase):
+    """Readable file object that downloads a remote file by byte ranges
+
+    The next `prefetch` ranges are always being downloaded in background threads,
+    so the reader parses a range while the following ones are still in flight.
+
+    :param source: 's3://bucket/key' or an http(s) url that accepts range requests
+    :param range_size: Size of each range. If not specified then s3_part_size is used
+    :param prefetch: Ranges downloaded ahead of the reader
+    """
+
+    def __init__(self, source, range_size=None, prefetch=4):
+        import requests
+
+        self.source = source
+        self.range_size = range_size or s3_part_size
+        if source.startswith('s3://'):
+            self.bucket, self.key = source[len('s3://'):].split('/', 1)
+            self.size = get_s3_client().head_object(Bucket=self.bucket, Key=self.key)['ContentLength']
+        else:
+            response = requests.head(source, allow_redirects=True, timeout=60)
+            response.raise_for_status()
+            self.size = int(response.headers['Content-Length'])
+
+        self.executor = ThreadPoolExecutor(max_workers=prefetch)
+        self.pending = deque()
+        self.next_offset = 0
+        self.block = b''
+        self.block_position = 0
+        for _ in range(prefetch):
+            self._schedule_range()
+
+    def readable(self):
+        return True
+
+    def _schedule_range(self):
+        if self.next_offset < self.size:
+            end = min(self.next_offset + self.range_size, self.size) - 1
+            self.pending.append(self.executor.submit(self._fetch_range, self.next_offset, end))
+            self.next_offset = end + 1
+
+    def _fetch_range(self, start, end):
+        byte_range = f'bytes={start}-{end}'
+        if self.source.startswith('s3://'):
+            obj = get_s3_client().get_object(Bucket=self.bucket, Key=self.key, Range=byte_range)
+            return obj['Body'].read()
+
+        import requests
+
+        response = requests.get(self.source, headers={'Range': byte_range}, timeout=60)
+        response.raise_for_status()
+        if response.status_code != 206:
+            raise ValueError(f'The server of {self.source} does not accept range requests')
+        return response.content
+
+    def readinto(self, buffer):
+        # Move to the next range once the current one is consumed
+        while self.block_position >= len(self.block):
+            if not self.pending:
+                return 0
+            self.block = self.pending.popleft().result()
+            self.block_position = 0
+            self._schedule_range()
+
+        size = min(len(buffer), len(self.block) - self.block_position)
+        buffer[:size] = self.block[self.block_position:self.block_position + size]
+        self.block_position += size
+        return size
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        super().close()
+
+
+def iter_remote_csv(source, chunk_rows=50000, range_size=None, prefetch=4):
+    """Parse a remote csv file in chunks of rows while it is still being downloaded
+
+    :param source: 's3://bucket/key' or an http(s) url
+    :param chunk_rows: Rows of each dataframe
+    :param range_size: Size of the downloaded ranges
+    :param prefetch: Ranges downloaded ahead of the parser
+    :return: Iterator of dataframes
+    """
+    import requests
+
+    if source.startswith('s3://'):
+        stream = BufferedReader(RemoteRangeReader(source, range_size, prefetch))
+    else:
+        response = requests.head(source, allow_redirects=True, timeout=60)
+        if response.headers.get('Accept-Ranges') == 'bytes' and 'Content-Length' in response.headers:
+            stream = BufferedReader(RemoteRangeReader(source, range_size, prefetch))
+        else:
+            # Without range support the body is still parsed while it is streamed
+            response = requests.get(source, stream=True, timeout=60)
+            response.raise_for_status()
+            response.raw.decode_content = True
+            stream = response.raw
+
+    with stream:
+        with pd.read_csv(stream, chunksize=chunk_rows) as chunks:
+            for chunk in chunks:
+                yield chunk
+
 def contains_bad_encoding(value):
     # Apostrophe bad decoded
     a = '’'.encode('utf-8').decode('cp1252')
@@ -129,40 +738,241 @@ def multiple_row_height(row_height, data):
     return multiple_row_heights
 
 # Auxiliar functions for graph ploting
+def accent_palette():
+    # Colors of the 'Accent' palette, the same ones seaborn.color_palette('Accent') returns
+    import matplotlib
+    return list(matplotlib.colormaps['Accent'].colors)
+
+# Figures are created with the object oriented API, they are not registered in pyplot
+# and are released as soon as the image is saved, so they can be drawn from several threads
 def donut_plot(data, title):
-    # Create a pieplot        
-    plt.subplots()
-    plt.pie(data, colors=sns.color_palette('Accent'))
+    from matplotlib.figure import Figure
+    from matplotlib.patches import Circle
+
+    # Create a pieplot
+    fig = Figure()
+    ax = fig.subplots()
+    ax.pie(data, colors=accent_palette())
     # add a circle at the center to transform it into a donut chart
-    my_circle = plt.Circle((0, 0), 0.7, color='white')
-    p = plt.gcf()
-    p.gca().add_artist(my_circle)
+    my_circle = Circle((0, 0), 0.7, color='white')
+    ax.add_artist(my_circle)
 
     # Set the title of the graph
-    plt.title(title, fontsize=18)
+    ax.set_title(title, fontsize=18)
 
     # Add annotation in the center of the figure
     percentage = (1 - (data[1] / data[0])) * 100
-    plt.text(0, 0, f'{percentage:.1f}%', horizontalalignment='center', verticalalignment='center', fontsize=20)
+    ax.text(0, 0, f'{percentage:.1f}%', horizontalalignment='center', verticalalignment='center', fontsize=20)
 
     # Save the image as a stream of in-memory bytes
     imgdata = BytesIO()
-    plt.savefig(imgdata, format='png', bbox_inches='tight')
+    fig.savefig(imgdata, format='png', bbox_inches='tight')
     imgdata.seek(0)  # rewind the data
 
     return imgdata
 
 def pie_plot(data, title, labels):
-    # Create a pieplot        
-    plt.subplots()
-    plt.pie(data, colors=sns.color_palette('Accent'), labels=labels, autopct='%1.0f%%')
+    from matplotlib.figure import Figure
+
+    # Create a pieplot
+    fig = Figure()
+    ax = fig.subplots()
+    ax.pie(data, colors=accent_palette(), labels=labels, autopct='%1.0f%%')
 
     # Set the title of the graph
-    plt.title(title, fontsize=16)
+    ax.set_title(title, fontsize=16)
+
+    # Save the image as a stream of in-memory bytes
+    imgdata = BytesIO()
+    fig.savefig(imgdata, format='png', bbox_inches='tight')
+    imgdata.seek(0)  # rewind the data
+
+    return imgdata
+
+# Native PDF versions of the pie and donut charts, drawn with reportlab.graphics instead of being
+# rasterized by matplotlib. They are flowables, so they are placed in the report like the images
+accent_colors = ['#7fc97f', '#beaed4', '#fdc086', '#ffff99', '#386cb0', '#f0027f', '#bf5b17', '#666666']
+
+def _pie_wedges(data, radius, inner_radius=0):
+    # Wedges in the same positions of matplotlib: counterclockwise from 3 o'clock
+    from reportlab.graphics.shapes import Wedge
+    from reportlab.lib.colors import HexColor
+
+    total = float(sum(data))
+    angle = 0
+    wedges = []
+    for i, value in enumerate(data):
+        sweep = 360 * value / total
+        wedge = Wedge(0, 0, radius, angle, angle + sweep, radius1=inner_radius or None,
+                      fillColor=HexColor(accent_colors[i % len(accent_colors)]), strokeColor=None)
+        wedges.append((wedge, angle + sweep / 2))
+        angle += sweep
+    return wedges
+
+def _fit_drawing(group, width, height):
+    # Scale the chart into the drawing keeping its aspect ratio, like bbox_inches='tight'
+    from reportlab.graphics.shapes import Drawing
+
+    x0, y0, x1, y1 = group.getBounds()
+    scale = min(width / (x1 - x0), height / (y1 - y0))
+    group.transform = (scale, 0, 0, scale, (width - (x1 + x0) * scale) / 2, (height - (y1 + y0) * scale) / 2)
+    drawing = Drawing(width, height)
+    drawing.add(group)
+    return drawing
+
+def donut_drawing(data, title, width, height):
+    from reportlab.graphics.shapes import Group, String
+
+    radius = 100
+    group = Group()
+    for wedge, middle in _pie_wedges(data, radius, 0.7 * radius):
+        group.add(wedge)
+    group.add(String(0, radius + 14, title, fontName='Helvetica', fontSize=18, textAnchor='middle'))
+
+    # Annotation in the center of the chart
+    percentage = (1 - (data[1] / data[0])) * 100
+    group.add(String(0, -7, f'{percentage:.1f}%', fontName='Helvetica', fontSize=20, textAnchor='middle'))
+
+    return _fit_drawing(group, width, height)
+
+def pie_drawing(data, title, labels, width, height):
+    from reportlab.graphics.shapes import Group, String
+
+    radius = 100
+    group = Group()
+    wedges = _pie_wedges(data, radius)
+    for wedge, middle in wedges:
+        group.add(wedge)
+    # Labels outside the wedges and percentages inside, at the distances matplotlib uses
+    total = float(sum(data))
+    for (wedge, middle), value, label in zip(wedges, data, labels):
+        x, y = np.cos(np.radians(middle)), np.sin(np.radians(middle))
+        anchor = 'start' if x >= 0 else 'end'
+        group.add(String(1.1 * radius * x, 1.1 * radius * y - 4, label, fontName='Helvetica', fontSize=10, textAnchor=anchor))
+        group.add(String(0.6 * radius * x, 0.6 * radius * y - 4, f'{value / total * 100:1.0f}%', fontName='Helvetica', fontSize=10, textAnchor='middle'))
+    group.add(String(0, 1.1 * radius + 18, title, fontName='Helvetica', fontSize=16, textAnchor='middle'))
+
+    return _fit_drawing(group, width, height)
+
+vector_chart_functions = {'donut': donut_drawing, 'pie': pie_drawing}
+
+def nullity_plot(density, columns, rows, color=(.19, .95, .43)):
+    # Nullity matrix drawn from the null density of bins of rows, like missingno.matrix does with every row.
+    # Present values are drawn with the color and missing values in white
+    from matplotlib.figure import Figure
+
+    density = np.asarray(density, dtype=float)
+    image = np.array(color) + density[:, :, None] * (1 - np.array(color))
+
+    fig = Figure(figsize=(25, 10))
+    ax = fig.add_axes([0, 0, 0.95, 1])
+    # An empty dataset has no bins, only the column names are drawn
+    if rows:
+        ax.imshow(image, aspect='auto', interpolation='nearest', extent=(-0.5, len(columns) - 0.5, rows, 0))
+    ax.set_xlim(-0.5, len(columns) - 0.5)
+    ax.set_ylim(max(rows, 1), 0)
+    ax.grid(False)
+
+    # Column names on top, and the first and last row number on the left
+    ax.xaxis.tick_top()
+    ax.set_xticks(range(len(columns)))
+    ax.set_xticklabels(columns, rotation=45, ha='left', fontsize=16)
+    ax.set_yticks([0, rows] if rows else [0])
+    ax.set_yticklabels([1, rows] if rows else [0], fontsize=20)
+    for x in np.arange(0.5, len(columns) - 0.5):
+        ax.axvline(x, linestyle='-', color='white')
+    for side in ['top', 'right', 'bottom', 'left']:
+        ax.spines[side].set_visible(False)
+
+    # Sparkline with the completeness of the rows of every bin
+    completeness = len(columns) - density.sum(axis=1)
+    spark = fig.add_axes([0.95, 0, 0.05, 1])
+    spark.plot(completeness, np.arange(len(completeness)), color=(.25, .25, .25))
+    spark.set_ylim(max(len(completeness), 1) - 0.5, -0.5)
+    spark.set_xlim(0, len(columns) + 1)
+    spark.axis('off')
 
     # Save the image as a stream of in-memory bytes
     imgdata = BytesIO()
-    plt.savefig(imgdata, format='png', bbox_inches='tight')
+    fig.savefig(imgdata, format='png', bbox_inches='tight')
     imgdata.seek(0)  # rewind the data
 
-    return imgdata
\ No newline at end of file
+    return imgdata
+
+# Rendered charts are stored by a hash of their data, style and size
+chart_cache_dir = Path(__file__).parent.parent / '.cache' / 'charts'
+# Maximum size of the cached images, the least recently used ones are evicted first as in the download cache
+chart_cache_max_bytes = 64 * 1024 * 1024
+chart_functions = {'donut': donut_plot, 'pie': pie_plot, 'nullity': nullity_plot}
+
+def chart_key(kind, *args):
+    import matplotlib
+
+    # Everything that changes the image: chart type, data, texts, palette, size and library version
+    description = {
+        'kind': kind,
+        'args': args,
+        'palette': [matplotlib.colors.to_hex(color) for color in accent_palette()],
+        'size': list(matplotlib.rcParams['figure.figsize']),
+        'dpi': matplotlib.rcParams['savefig.dpi'],
+        'version': matplotlib.__version__,
+    }
+    # Numpy values and arrays are described by their complete list of values
+    default = lambda value: value.tolist() if hasattr(value, 'tolist') else str(value)
+    return hashlib.sha256(json.dumps(description, sort_keys=True, default=default).encode('utf-8')).hexdigest()
+
+def render_chart(kind, *args, directory=None, max_bytes=None):
+    """Render a chart, or read it from the cache if the same chart was already rendered
+
+    :param kind: 'donut', 'pie' or 'nullity'
+    :param args: Arguments of the plot function of the chart
+    :param directory: Cache directory. If not specified then chart_cache_dir is used
+    :param max_bytes: Size limit of the cache. If not specified then chart_cache_max_bytes is used
+    :return: PNG image as a stream of in-memory bytes
+    """
+    directory = Path(directory or chart_cache_dir)
+    max_bytes = chart_cache_max_bytes if max_bytes is None else max_bytes
+    key = chart_key(kind, *args)
+
+    # Same index and LRU eviction as the download cache, the images are stored by their chart key
+    with _cache_lock:
+        entry = _load_cache_index(directory).get(key)
+    if entry is not None:
+        # The image may have been evicted by another thread since the index was read
+        try:
+            imgdata = BytesIO((directory / key).read_bytes())
+        except FileNotFoundError:
+            pass
+        else:
+            _touch_cache_entry(directory, key, entry)
+            return imgdata
+
+    imgdata = chart_functions[kind](*args)
+
+    # Write to a temporary file first so another process never reads a partial image
+    directory.mkdir(parents=True, exist_ok=True)
+    tmp_path = directory / f'{os.getpid()}-{threading.get_ident()}.part'
+    tmp_path.write_bytes(imgdata.getvalue())
+    os.replace(tmp_path, directory / key)
+
+    with _cache_lock:
+        index = _load_cache_index(directory)
+        index[key] = {'sha256': key, 'size': len(imgdata.getvalue()), 'last_access': datetime.now().timestamp()}
+        _evict_cache(directory, index, max_bytes, keep=key)
+        _save_cache_index(directory, index)
+    return imgdata
+
+def render_charts(charts, max_workers=None, directory=None, max_bytes=None):
+    """Render several charts at the same time in a pool of threads
+
+    :param charts: Dictionary of chart names and their (kind, *args) tuples
+    :param max_workers: Threads of the pool
+    :param directory: Cache directory. If not specified then chart_cache_dir is used
+    :param max_bytes: Size limit of the cache. If not specified then chart_cache_max_bytes is used
+    :return: Dictionary of chart names and their PNG images
+    """
+    if not charts:
+        return {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {name: executor.submit(render_chart, *chart, directory=directory, max_bytes=max_bytes) for name, chart in charts.items()}
+    return {name: future.result() for name, future in futures.items()}
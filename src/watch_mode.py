@@ -0,0 +1,208 @@
+import argparse
+import queue
+import sys
+import threading
+import time
+from io import BytesIO
+from pathlib import Path
+
+import pandas as pd
+
+from headless_report import quality_results, write_results
+import run_history
+import utils_io
+
+# Continuous validation of dataset deliveries: a folder (or an S3 prefix, for example a local
+# S3 compatible server set with S3_ENDPOINT_URL) is polled for new or changed files, and the
+# quality checks of the headless report run on every file as soon as it stops changing.
+
+base = Path(__file__).parent.parent
+# Files that are validated
+dataset_suffixes = ('.csv', '.csv.gz', '.parquet')
+
+
+def list_directory(source):
+    # Signature of every dataset file: path -> (size, modification time)
+    files = {}
+    for path in Path(source).iterdir():
+        if path.is_file() and path.name.endswith(dataset_suffixes):
+            stat = path.stat()
+            files[str(path)] = (stat.st_size, stat.st_mtime_ns)
+    return files
+
+def list_s3(source):
+    # Signature of every dataset object under the prefix: 's3://bucket/key' -> (size, etag)
+    bucket, _, prefix = source[len('s3://'):].partition('/')
+    s3 = utils_io.get_s3_client()
+    files = {}
+    for page in s3.get_paginator('list_objects_v2').paginate(Bucket=bucket, Prefix=prefix):
+        for obj in page.get('Contents', []):
+            if obj['Key'].endswith(dataset_suffixes):
+                files[f"s3://{bucket}/{obj['Key']}"] = (obj['Size'], obj['ETag'])
+    return files
+
+def delivery_name(path):
+    # Whole file name of a delivery, S3 keys always use '/' and local paths the separator of the system
+    if path.startswith('s3://'):
+        return path.rsplit('/', 1)[-1]
+    return Path(path).name
+
+def read_delivery(path):
+    if path.startswith('s3://'):
+        bucket, _, key = path[len('s3://'):].partition('/')
+        obj = utils_io.get_s3_client().get_object(Bucket=bucket, Key=key)
+        body = obj['Body']
+        if key.endswith('.parquet'):
+            return pd.read_parquet(BytesIO(body.read()))
+        return pd.read_csv(body, compression='gzip' if key.endswith('.gz') else None)
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path)
+    return pd.read_csv(path)
+
+
+class DeliveryWatcher():
+    """Poll a source for dataset files and validate each one in a pool of workers
+
+    A file is queued once its signature stayed the same for `debounce` seconds, so a file that is
+    still being written is validated once, when it is complete. The queue is bounded: when files
+    arrive faster than they are validated the watcher blocks on the full queue and stops polling,
+    the pending deliveries wait in the source instead of in memory.
+
+    :param source: Folder or 's3://bucket/prefix' to watch
+    :param output_dir: Folder of the results documents
+    :param workers: Files validated at the same time
+    :param queue_size: Files waiting for a worker
+    :param debounce: Seconds a file must stay unchanged before it is validated
+    :param interval: Seconds between polls of the source
+    """
+
+    def __init__(self, source, output_dir, workers=2, queue_size=4, debounce=2.0, interval=1.0, examples=5):
+        self.source = str(source)
+        self.output_dir = Path(output_dir)
+        self.workers = workers
+        self.debounce = debounce
+        self.interval = interval
+        self.examples = examples
+        self.list_files = list_s3 if self.source.startswith('s3://') else list_directory
+
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.stop_event = threading.Event()
+        self.lock = threading.Lock()
+        # path -> (signature, time it was first seen with that signature)
+        self.seen = {}
+        # path -> signature of the last validated version
+        self.validated = {}
+        # Files queued or being validated, a file is never queued twice
+        self.in_flight = set()
+
+    def poll(self):
+        # Files whose signature didn't change during the debounce time and were not validated yet
+        now = time.monotonic()
+        files = self.list_files(self.source)
+        ready = []
+        for path, signature in files.items():
+            previous = self.seen.get(path)
+            if previous is None or previous[0] != signature:
+                self.seen[path] = (signature, now)
+                continue
+            with self.lock:
+                if self.validated.get(path) == signature or path in self.in_flight:
+                    continue
+            if now - previous[1] >= self.debounce:
+                ready.append((path, signature))
+        # Files that were removed are forgotten
+        for path in set(self.seen) - set(files):
+            del self.seen[path]
+        return sorted(ready, key=lambda item: self.seen[item[0]][1])
+
+    def enqueue(self, path, signature):
+        with self.lock:
+            self.in_flight.add(path)
+        # Blocks while the queue is full, this is the backpressure on the polling
+        while not self.stop_event.is_set():
+            try:
+                self.queue.put((path, signature), timeout=self.interval)
+                return
+            except queue.Full:
+                continue
+
+    def validate(self, path, signature):
+        start = time.time()
+        df = read_delivery(path)
+        document = quality_results(df, self.examples)
+        document['source'] = {'path': path, 'signature': [str(value) for value in signature]}
+
+        # The whole file name is kept, so a.csv and a.parquet don't write the same results
+        name = delivery_name(path)
+        output = self.output_dir / f'{name}_quality_results.json'
+        write_results(document, output, 'json')
+        run_history.record_run(document, dataset=name, fingerprint=utils_io.df_fingerprint(df))
+        return document, output, time.time() - start
+
+    def worker(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                return
+            path, signature = item
+            try:
+                document, output, seconds = self.validate(path, signature)
+                print(f"Validated {path}: {document['dataset']['rows']} rows, score {document['score']:.1f} in {seconds:.2f} seconds -> {output}\n", end='')
+                with self.lock:
+                    self.validated[path] = signature
+            except Exception as e:
+                # The file is tried again when its signature changes
+                print(f"Error validating {path}: {e}\n", end='')
+                with self.lock:
+                    self.validated[path] = signature
+            finally:
+                with self.lock:
+                    self.in_flight.discard(path)
+                self.queue.task_done()
+
+    def run(self, once=False):
+        """Watch the source until stop() is called, or until every current file is validated if once is set"""
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        threads = [threading.Thread(target=self.worker, daemon=True) for _ in range(self.workers)]
+        for thread in threads:
+            thread.start()
+
+        try:
+            while not self.stop_event.is_set():
+                for path, signature in self.poll():
+                    self.enqueue(path, signature)
+                if once and not self.in_flight and all(self.validated.get(path) == signature for path, (signature, _) in self.seen.items()):
+                    break
+                self.stop_event.wait(self.interval)
+        finally:
+            self.queue.join()
+            for thread in threads:
+                self.queue.put(None)
+            for thread in threads:
+                thread.join()
+
+    def stop(self):
+        self.stop_event.set()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Validate new or changed dataset files as they are delivered')
+    parser.add_argument('source', nargs='?', default=str(base / 'input'), help="Folder or 's3://bucket/prefix' to watch")
+    parser.add_argument('--output', default=str(base / 'output' / 'doc' / 'deliveries'), help='Folder of the results documents')
+    parser.add_argument('--workers', type=int, default=2, help='Files validated at the same time')
+    parser.add_argument('--queue-size', type=int, default=4, help='Files waiting for a worker')
+    parser.add_argument('--debounce', type=float, default=2.0, help='Seconds a file must stay unchanged before it is validated')
+    parser.add_argument('--interval', type=float, default=1.0, help='Seconds between polls of the source')
+    parser.add_argument('--once', action='store_true', help='Validate the current files and exit')
+    args = parser.parse_args()
+
+    watcher = DeliveryWatcher(args.source, args.output, args.workers, args.queue_size, args.debounce, args.interval)
+    print(f"Watching {args.source} ...")
+    try:
+        watcher.run(once=args.once)
+    except KeyboardInterrupt:
+        watcher.stop()
+    except ValueError as ve:
+        print(f"Error: {ve}")
+        sys.exit(1)
@@ -0,0 +1,39 @@
+import json
+
+import utils_io
+
+
+def chart(value):
+    return ('pie', [value, 100 - value], f'Gráfico {value}', ['Válidos', 'Inválidos'])
+
+
+def cached_keys(directory):
+    return set(json.loads((directory / 'index.json').read_text(encoding='utf-8')))
+
+
+def test_cached_chart_is_not_rendered_again(tmp_path, monkeypatch):
+    first = utils_io.render_chart(*chart(10), directory=tmp_path)
+
+    def fail(*args):
+        raise AssertionError('chart rendered again')
+
+    monkeypatch.setitem(utils_io.chart_functions, 'pie', fail)
+    second = utils_io.render_chart(*chart(10), directory=tmp_path)
+
+    assert first.getvalue() == second.getvalue()
+    assert cached_keys(tmp_path) == {utils_io.chart_key(*chart(10))}
+
+
+def test_chart_cache_size_limit(tmp_path):
+    size = len(utils_io.render_chart(*chart(10), directory=tmp_path).getvalue())
+    # Room for about two images
+    max_bytes = int(size * 2.5)
+
+    utils_io.render_chart(*chart(20), directory=tmp_path, max_bytes=max_bytes)
+    # The first chart is used again, so the second one is the least recently used
+    utils_io.render_chart(*chart(10), directory=tmp_path, max_bytes=max_bytes)
+    utils_io.render_chart(*chart(30), directory=tmp_path, max_bytes=max_bytes)
+
+    keys = cached_keys(tmp_path)
+    assert keys == {utils_io.chart_key(*chart(10)), utils_io.chart_key(*chart(30))}
+    assert {path.name for path in tmp_path.iterdir()} == keys | {'index.json'}
@@ -0,0 +1,41 @@
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+import data_quality_analysis
+
+dataset_path = Path(__file__).parent.parent / 'output' / 'dataset.csv'
+
+
+@pytest.mark.parametrize('chunk_rows', [7, 50, 100, 300, 1000])
+def test_chunked_totals_match_the_full_dataset(chunk_rows):
+    expected = data_quality_analysis.anomalies_data(pd.read_csv(dataset_path))
+
+    *_, totals = data_quality_analysis.anomalies_data_from_chunks(pd.read_csv(dataset_path, chunksize=chunk_rows))
+
+    assert totals == expected
+
+
+def test_row_hashes_ignore_the_inferred_types():
+    # The same rows read as numbers in one chunk and as text in another
+    numbers = pd.DataFrame({'total_tracks': [12, 13], 'explicit': [True, False], 'name': ['a', 'b']})
+    text = pd.DataFrame({'total_tracks': ['12', '13.0'], 'explicit': ['True', 'False'], 'name': ['a', 'b']}, dtype=object)
+
+    assert (data_quality_analysis.row_hashes(numbers) == data_quality_analysis.row_hashes(text)).all()
+
+
+def test_row_hashes_tell_missing_values_from_text():
+    df = pd.DataFrame({'name': [None, 'nan', 'None']}, dtype=object)
+
+    assert len(set(data_quality_analysis.row_hashes(df))) == 3
+
+
+def test_seen_rows_counts_duplicates_across_chunks():
+    seen = data_quality_analysis.SeenRows()
+    df = pd.DataFrame({'a': [1, 2, 2, 3, 1, 4]})
+    hashes = data_quality_analysis.row_hashes(df)
+
+    duplicates = seen.add(hashes[:3]) + seen.add(hashes[3:])
+
+    assert duplicates == df.duplicated().sum() == 2
@@ -0,0 +1,120 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import utils_io
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    # Files served by the stand-in: path -> (body, etag, last modified). Every request is logged
+    # as (path, status, request headers)
+    files = {}
+    log = []
+
+    def do_GET(self):
+        body, etag, last_modified = self.files[self.path]
+        if etag is not None and self.headers.get('If-None-Match') == etag:
+            status = 304
+        elif etag is None and last_modified is not None and self.headers.get('If-Modified-Since') == last_modified:
+            status = 304
+        else:
+            status = 200
+        self.log.append((self.path, status, dict(self.headers)))
+
+        self.send_response(status)
+        if etag is not None:
+            self.send_header('ETag', etag)
+        if last_modified is not None:
+            self.send_header('Last-Modified', last_modified)
+        if status == 304:
+            self.end_headers()
+            return
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    StandInHandler.files = {}
+    StandInHandler.log = []
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{httpd.server_address[1]}'
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_etag_revalidation(server, tmp_path):
+    StandInHandler.files['/data.csv'] = (b'a,b\n1,2\n', '"v1"', None)
+
+    first = utils_io.cached_download(f'{server}/data.csv', directory=tmp_path)
+    second = utils_io.cached_download(f'{server}/data.csv', directory=tmp_path)
+
+    assert first == second
+    assert first.read_bytes() == b'a,b\n1,2\n'
+    assert [status for path, status, headers in StandInHandler.log] == [200, 304]
+    assert StandInHandler.log[1][2]['If-None-Match'] == '"v1"'
+
+    # A new version of the file is downloaded again
+    StandInHandler.files['/data.csv'] = (b'a,b\n3,4\n', '"v2"', None)
+    third = utils_io.cached_download(f'{server}/data.csv', directory=tmp_path)
+    assert third.read_bytes() == b'a,b\n3,4\n'
+    assert StandInHandler.log[-1][1] == 200
+
+
+def test_if_modified_since_fallback(server, tmp_path):
+    last_modified = 'Wed, 01 May 2024 10:00:00 GMT'
+    StandInHandler.files['/data.csv'] = (b'x\n1\n', None, last_modified)
+
+    first = utils_io.cached_download(f'{server}/data.csv', directory=tmp_path)
+    second = utils_io.cached_download(f'{server}/data.csv', directory=tmp_path)
+
+    assert first == second
+    assert [status for path, status, headers in StandInHandler.log] == [200, 304]
+    headers = StandInHandler.log[1][2]
+    assert headers['If-Modified-Since'] == last_modified
+    assert 'If-None-Match' not in headers
+
+
+def test_max_age_skips_the_request(server, tmp_path):
+    StandInHandler.files['/data.csv'] = (b'x\n1\n', '"v1"', None)
+
+    utils_io.cached_download(f'{server}/data.csv', directory=tmp_path)
+    utils_io.cached_download(f'{server}/data.csv', directory=tmp_path, max_age=3600)
+
+    assert len(StandInHandler.log) == 1
+
+
+def test_lru_eviction_by_size(server, tmp_path):
+    for name in 'abc':
+        StandInHandler.files[f'/{name}.csv'] = (name.encode() * 100, f'"{name}"', None)
+
+    utils_io.cached_download(f'{server}/a.csv', directory=tmp_path, max_bytes=250)
+    utils_io.cached_download(f'{server}/b.csv', directory=tmp_path, max_bytes=250)
+    # a is used again, so b is the least recently used file
+    utils_io.cached_download(f'{server}/a.csv', directory=tmp_path, max_bytes=250)
+    utils_io.cached_download(f'{server}/c.csv', directory=tmp_path, max_bytes=250)
+
+    index = json.loads((tmp_path / 'index.json').read_text(encoding='utf-8'))
+    assert sorted(index) == [f'{server}/a.csv', f'{server}/c.csv']
+    payloads = sorted(path.name for path in tmp_path.iterdir() if path.name != 'index.json')
+    assert payloads == sorted(entry['sha256'] for entry in index.values())
+    assert sum(entry['size'] for entry in index.values()) <= 250
+
+
+def test_corrupt_index_is_recovered(server, tmp_path):
+    StandInHandler.files['/data.csv'] = (b'x\n1\n', '"v1"', None)
+    (tmp_path / 'index.json').write_text('{"truncated": ', encoding='utf-8')
+
+    path = utils_io.cached_download(f'{server}/data.csv', directory=tmp_path)
+
+    assert path.read_bytes() == b'x\n1\n'
+    index = json.loads((tmp_path / 'index.json').read_text(encoding='utf-8'))
+    assert list(index) == [f'{server}/data.csv']
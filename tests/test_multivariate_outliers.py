@@ -0,0 +1,43 @@
+from pathlib import Path
+
+import pandas as pd
+
+import data_quality_analysis
+
+dataset_path = Path(__file__).parent.parent / 'output' / 'dataset.csv'
+columns = list(data_quality_analysis.multivariate_features)
+
+
+def test_implausible_combination_is_flagged():
+    df = pd.read_csv(dataset_path)
+    # Every value is inside the range of its column, but a very energetic track is not that quiet
+    # and acoustic. The other row has the median of every feature
+    implausible = {
+        'audio_features.danceability': 0.25,
+        'audio_features.energy': 0.94,
+        'audio_features.loudness': -17.5,
+        'audio_features.speechiness': 0.04,
+        'audio_features.acousticness': 0.95,
+        'audio_features.liveness': 0.12,
+        'audio_features.valence': 0.9,
+        'audio_features.tempo': 120,
+    }
+    for column, value in implausible.items():
+        assert df[column].min() <= value <= df[column].max()
+    rows = pd.DataFrame([implausible, df[columns].median().to_dict()], index=['implausible', 'typical'])
+    df = pd.concat([df, rows])
+
+    result = data_quality_analysis.dataset_has_multivariate_outliers(df)
+
+    assert 'implausible' in result['outliers'].index
+    assert 'typical' not in result['outliers'].index
+
+
+def test_sample_smaller_than_the_dataset():
+    df = pd.read_csv(dataset_path)
+
+    result = data_quality_analysis.dataset_has_multivariate_outliers(df, settings={'sample_rows': 300, 'block_rows': 100})
+
+    # Every row is scored, also the ones out of the sample
+    assert result['count'] > 0
+    assert result['outliers'].index.isin(df.index).all()
@@ -0,0 +1,68 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import data_quality_analysis
+
+dataset_path = Path(__file__).parent.parent / 'output' / 'dataset.csv'
+columns = list(data_quality_analysis.near_duplicate_features)
+scales = np.array(list(data_quality_analysis.near_duplicate_features.values()))
+
+
+def tracks(names, features):
+    # Tracks with distinct ids and the scaled audio features of every row, from 0 to 1
+    df = pd.DataFrame(np.asarray(features) * scales, columns=columns)
+    df.insert(0, 'track_name', names)
+    df.insert(0, 'track_id', [f'id{i}' for i in range(len(df))])
+    return df
+
+
+def test_many_copies_of_the_same_track():
+    # Larger than max_bucket, all in the same cells of every band
+    df = tracks(['Love Story'] * 150, np.full((150, len(columns)), 0.5))
+
+    result = data_quality_analysis.dataset_has_near_duplicate_tracks(df)
+
+    assert result['count'] == 149
+    assert len(result['pairs']) == 150 * 149 // 2
+
+
+def test_close_features_on_cell_borders():
+    # Every band has one feature on a border of the grid without shift and the other on a border of
+    # the shifted grid, both tracks differ by 0.002 in every feature
+    tolerance = data_quality_analysis.near_duplicate_settings['feature_tolerance']
+    first = np.where(np.arange(len(columns)) % 2 == 0, 4 * tolerance, 3 * tolerance) - 0.001
+    df = tracks(['Love Story', 'Love Story'], [first, first + 0.002])
+
+    result = data_quality_analysis.dataset_has_near_duplicate_tracks(df)
+
+    assert result['count'] == 1
+    assert result['pairs'][['first', 'second']].values.tolist() == [[0, 1]]
+
+
+def brute_force_pairs(df, settings):
+    # Every pair of rows compared with the same thresholds and MinHash similarity as the check
+    names = data_quality_analysis.normalize_track_names(df['track_name'])
+    features = df[columns].apply(pd.to_numeric, errors='coerce').to_numpy() / scales
+    valid = np.flatnonzero((names != '').to_numpy() & ~np.isnan(features).any(axis=1))
+    signatures = data_quality_analysis.minhash_signatures(names.iloc[valid].tolist(), settings['permutations'])
+    first, second = np.triu_indices(len(valid), 1)
+    similarity = data_quality_analysis.signature_similarity(signatures, first, second)
+    distance = np.abs(features[valid[first]] - features[valid[second]]).max(axis=1)
+    track_ids = df['track_id'].to_numpy()
+    keep = (similarity >= settings['name_threshold']) & (distance <= settings['feature_tolerance']) & (track_ids[valid[first]] != track_ids[valid[second]])
+    return sorted(zip(df.index[valid[first[keep]]], df.index[valid[second[keep]]]))
+
+
+@pytest.mark.parametrize('settings', [{}, {'max_bucket': 2, 'block_rows': 3}])
+def test_same_pairs_as_comparing_every_pair(settings):
+    # Tiny buckets split every bucket with the next bands and compare the rest in blocks
+    df = pd.read_csv(dataset_path)
+
+    result = data_quality_analysis.dataset_has_near_duplicate_tracks(df, settings=settings)
+
+    expected = brute_force_pairs(df, data_quality_analysis.near_duplicate_settings)
+    assert sorted(zip(result['pairs']['first'], result['pairs']['second'])) == expected
+    assert result['count'] == len({second for first, second in expected})
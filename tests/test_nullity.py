@@ -0,0 +1,27 @@
+import numpy as np
+import pandas as pd
+
+import data_quality_analysis
+import utils_io
+
+
+def test_nullity_density_of_an_empty_dataframe():
+    df = pd.DataFrame({'track_name': pd.Series(dtype=object), 'popularity': pd.Series(dtype=float)})
+
+    nullity = data_quality_analysis.nullity_density(df)
+
+    assert nullity['density'].shape == (0, 2)
+    assert nullity['rows'] == 0
+    assert nullity['columns'] == ['track_name', 'popularity']
+    # The chart of an empty dataset is drawn too
+    assert utils_io.nullity_plot(nullity['density'], nullity['columns'], nullity['rows']).getvalue()
+
+
+def test_nullity_density_bins():
+    df = pd.DataFrame({'a': [None] * 3 + [1.0] * 17, 'b': range(20)})
+
+    nullity = data_quality_analysis.nullity_density(df, bins=3)
+
+    # 20 rows in bins of 8 rows, the last bin has 4 rows
+    assert nullity['bin_rows'] == 8
+    np.testing.assert_allclose(nullity['density'], [[3 / 8, 0], [0, 0], [0, 0]])
@@ -0,0 +1,79 @@
+import pandas as pd
+import pytest
+
+import pipeline
+import utils_io
+
+
+@pytest.fixture
+def stages(tmp_path, monkeypatch):
+    # Stand-in stages writing in a temporary folder, the uploads are recorded
+    uploads = []
+    failing = set()
+    monkeypatch.setattr(pipeline, 'csv_path', tmp_path / 'output' / 'dataset.csv')
+    monkeypatch.setattr(pipeline, 'parquet_path', tmp_path / 'output' / 'dataset')
+    monkeypatch.setattr(pipeline, 'report_path', tmp_path / 'output' / 'doc' / 'data_quality_report.pdf')
+    monkeypatch.setattr(pipeline, 'profiling_path', tmp_path / 'output' / 'doc' / 'profilling_report.html')
+
+    def dataset_stage(json_path):
+        pipeline.parquet_path.mkdir(parents=True, exist_ok=True)
+        pd.DataFrame({'track_id': ['a', 'b']}).to_csv(pipeline.csv_path, index=False)
+        return pipeline.read_dataset()
+
+    def artifact_stage(path):
+        def stage(dataset):
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(f'{len(dataset)} rows', encoding='utf-8')
+            return path
+        return stage
+
+    def upload_file(path, bucket, object_name):
+        if object_name in failing:
+            return False
+        uploads.append(object_name)
+        return True
+
+    def upload_dataset(dataset):
+        uploads.append('dataset.csv')
+        return True
+
+    monkeypatch.setattr(pipeline, 'source_stage', lambda: 'source.json')
+    monkeypatch.setattr(pipeline, 'dataset_stage', dataset_stage)
+    monkeypatch.setattr(pipeline, 'report_stage', artifact_stage(pipeline.report_path))
+    monkeypatch.setattr(pipeline, 'profiling_stage', artifact_stage(pipeline.profiling_path))
+    monkeypatch.setattr(utils_io, 'upload_file', upload_file)
+    monkeypatch.setattr(pipeline.processing, 'upload_dataset', upload_dataset)
+
+    def run(upload=True):
+        uploads.clear()
+        values, failed = pipeline.run_pipeline(pipeline.pipeline_stages(upload), state_path=tmp_path / 'state.json')
+        return sorted(uploads), failed
+
+    return run, failing
+
+
+def test_uploads_after_a_run_without_upload(stages):
+    run, failing = stages
+
+    assert run(upload=False) == ([], set())
+    # The artifacts didn't change, but they were never uploaded
+    assert run() == (['data_quality_report.pdf', 'dataset.csv', 'profilling_report.html'], set())
+    assert run() == ([], set())
+
+
+def test_failed_upload_runs_again(stages):
+    run, failing = stages
+
+    failing.add('data_quality_report.pdf')
+    assert run() == (['dataset.csv', 'profilling_report.html'], {'upload_report'})
+    failing.clear()
+    assert run() == (['data_quality_report.pdf'], set())
+
+
+def test_changed_artifact_is_uploaded_again(stages):
+    run, failing = stages
+
+    run()
+    pipeline.report_path.write_text('edited', encoding='utf-8')
+    # The report is not generated again, but its new content is uploaded
+    assert run() == (['data_quality_report.pdf'], set())
@@ -0,0 +1,35 @@
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+import quality_gate
+
+dataset_path = Path(__file__).parent.parent / 'output' / 'dataset.csv'
+
+
+def check(thresholds, chunk_rows, tmp_path):
+    # Without a run history the order of the checks only depends on their cost
+    gate = quality_gate.QualityGate(thresholds, history=tmp_path / 'quality_history.db')
+    chunks, row_bound = quality_gate.source_chunks(str(dataset_path), chunk_rows)
+    return gate.check(chunks, row_bound)
+
+
+@pytest.mark.parametrize('chunk_rows', [7, 50, 100, 300, 100000])
+def test_duplicates_verdict_does_not_depend_on_the_chunk_size(chunk_rows, tmp_path):
+    # The dataset has 54 duplicate rows
+    failed = check({'Unicidad': '53'}, chunk_rows, tmp_path)
+    assert not failed['passed']
+    assert (failed['failed'], failed['count']) == ('Unicidad', 54)
+
+    passed = check({'Unicidad': '54'}, chunk_rows, tmp_path)
+    assert passed['passed']
+    assert passed['rows'] == 575
+
+
+def test_gate_stops_at_the_first_exceeded_threshold(tmp_path):
+    result = check({'Completitud': '0'}, 50, tmp_path)
+
+    assert not result['passed']
+    assert result['failed'] == 'Completitud'
+    assert result['rows'] < 575
@@ -0,0 +1,43 @@
+import json
+import locale
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+import headless_report
+import utils_io
+
+# The report modules set the es_ES.UTF-8 locale when they are imported
+report_service = pytest.importorskip('report_service', exc_type=locale.Error)
+
+dataset_path = Path(__file__).parent.parent / 'output' / 'dataset.csv'
+
+
+def without_times(document):
+    document = json.loads(json.dumps(document, default=headless_report.json_default))
+    document['seconds'] = None
+    for rule in document['rules']:
+        rule['seconds'] = None
+    return document
+
+
+def test_results_use_the_report_context(monkeypatch):
+    df = pd.read_csv(dataset_path)
+    expected = headless_report.quality_results(df)
+    monkeypatch.setattr(utils_io, 'get_dataset', lambda method: df.copy())
+    service = report_service.ReportService('local')
+    service.load()
+
+    # The checks are not run again, the document is built from the cached context
+    def fail(*args):
+        raise AssertionError('check run again')
+
+    rules = {rule: (dimension, fail, args, merge) for rule, (dimension, test, args, merge) in headless_report.quality_rules().items()}
+    monkeypatch.setattr(headless_report, 'quality_rules', lambda: rules)
+    monkeypatch.setattr(headless_report, 'dataset_has_near_duplicate_tracks', fail)
+    monkeypatch.setattr(headless_report, 'dataset_has_multivariate_outliers', fail)
+
+    document = json.loads(service.quality_results())
+
+    assert without_times(document) == without_times(expected)
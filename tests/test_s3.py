@@ -0,0 +1,145 @@
+import gzip
+import time
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+import pytest
+from botocore.exceptions import ClientError
+
+moto = pytest.importorskip('moto')
+
+import utils_io
+
+bucket = 'quality-tests'
+part_size = utils_io.s3_min_part_size
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    # moto replaces S3 inside the process, the shared clients are created again for every test
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'testing')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'testing')
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+    monkeypatch.setattr(utils_io, 's3_endpoint_url', None)
+    monkeypatch.setattr(utils_io, '_s3_session', None)
+    monkeypatch.setattr(utils_io, '_s3_clients', {})
+    with moto.mock_aws():
+        client = utils_io.get_s3_client()
+        client.create_bucket(Bucket=bucket)
+        yield client
+
+
+def object_bytes(client, key):
+    return client.get_object(Bucket=bucket, Key=key)['Body'].read()
+
+
+def test_multipart_upload_keeps_the_order_of_the_parts(s3, monkeypatch):
+    # Three parts with different content, the first one finishes last
+    data = np.random.default_rng(0).integers(0, 256, 2 * part_size + 1000, dtype=np.uint8).tobytes()
+    upload_part = s3.upload_part
+
+    def slow_first_part(**kwargs):
+        if kwargs['PartNumber'] == 1:
+            time.sleep(0.5)
+        return upload_part(**kwargs)
+
+    monkeypatch.setattr(s3, 'upload_part', slow_first_part)
+
+    with utils_io.S3MultipartWriter(bucket, 'data.bin', part_size=part_size, concurrency=3) as writer:
+        # Writes smaller than a part, so parts are cut across several calls
+        for start in range(0, len(data), 1000000):
+            writer.write(data[start:start + 1000000])
+
+    assert object_bytes(s3, 'data.bin') == data
+    assert s3.head_object(Bucket=bucket, Key='data.bin')['ETag'].strip('"').endswith('-3')
+
+
+def test_small_content_is_a_single_put(s3, monkeypatch):
+    create_multipart_upload = []
+    monkeypatch.setattr(s3, 'create_multipart_upload', lambda **kwargs: create_multipart_upload.append(kwargs))
+
+    with utils_io.S3MultipartWriter(bucket, 'small.txt') as writer:
+        writer.write(b'abc')
+
+    assert object_bytes(s3, 'small.txt') == b'abc'
+    assert create_multipart_upload == []
+
+
+def test_failed_part_aborts_the_upload(s3, monkeypatch):
+    upload_part = s3.upload_part
+    abort_multipart_upload = s3.abort_multipart_upload
+    aborted = []
+
+    def failing_second_part(**kwargs):
+        if kwargs['PartNumber'] == 2:
+            raise ClientError({'Error': {'Code': 'InternalError', 'Message': 'part failed'}}, 'UploadPart')
+        return upload_part(**kwargs)
+
+    def spy_abort(**kwargs):
+        aborted.append(kwargs['UploadId'])
+        return abort_multipart_upload(**kwargs)
+
+    monkeypatch.setattr(s3, 'upload_part', failing_second_part)
+    monkeypatch.setattr(s3, 'abort_multipart_upload', spy_abort)
+
+    with pytest.raises(ClientError):
+        with utils_io.S3MultipartWriter(bucket, 'failed.bin', part_size=part_size) as writer:
+            writer.write(b'x' * (3 * part_size))
+
+    assert len(aborted) == 1
+    assert s3.list_multipart_uploads(Bucket=bucket).get('Uploads', []) == []
+    assert 'Contents' not in s3.list_objects_v2(Bucket=bucket)
+
+
+def test_upload_artifacts(s3, tmp_path):
+    large = tmp_path / 'dataset.csv'
+    large.write_bytes(b'y' * (part_size + 1))
+    small = tmp_path / 'report.pdf'
+    small.write_bytes(b'%PDF')
+
+    uploaded = utils_io.upload_artifacts({'dataset.csv': large, 'report.pdf': small}, bucket, part_size=part_size)
+
+    assert uploaded == {'dataset.csv': True, 'report.pdf': True}
+    assert object_bytes(s3, 'dataset.csv') == large.read_bytes()
+    assert object_bytes(s3, 'report.pdf') == b'%PDF'
+    # A failed upload is reported and doesn't stop the others
+    assert utils_io.upload_artifacts({'report.pdf': small}, 'missing-bucket') == {'report.pdf': False}
+
+
+def sample_df(rows):
+    rng = np.random.default_rng(1)
+    return pd.DataFrame({
+        'track_id': [f'id{i}' for i in range(rows)],
+        'popularity': rng.integers(0, 100, rows),
+        'danceability': rng.random(rows),
+        'explicit': rng.random(rows) > 0.5,
+    })
+
+
+def test_df_to_s3_csv_gzip_round_trip(s3):
+    df = sample_df(1000)
+
+    utils_io.df_to_s3(df, bucket, 'dataset.csv.gz', compression='gzip', batch_rows=300)
+
+    body = object_bytes(s3, 'dataset.csv.gz')
+    pd.testing.assert_frame_equal(pd.read_csv(BytesIO(gzip.decompress(body))), df)
+
+
+def test_df_to_s3_parquet_round_trip(s3):
+    df = sample_df(1000)
+
+    utils_io.df_to_s3(df, bucket, 'dataset.parquet', file_format='parquet', compression='snappy', batch_rows=300)
+
+    body = object_bytes(s3, 'dataset.parquet')
+    pd.testing.assert_frame_equal(pd.read_parquet(BytesIO(body)), df)
+
+
+def test_df_to_s3_multipart_csv(s3):
+    # Big enough to be sent in several parts
+    df = sample_df(300000)
+
+    utils_io.df_to_s3(df, bucket, 'dataset.csv', part_size=part_size)
+
+    assert s3.head_object(Bucket=bucket, Key='dataset.csv')['ETag'].strip('"').count('-') == 1
+    pd.testing.assert_frame_equal(pd.read_csv(BytesIO(object_bytes(s3, 'dataset.csv'))), df)